@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CRM.settings')
+os.environ.setdefault('CRM_URLCONF', 'CRM.asgi_urls')
 
 application = get_asgi_application()
@@ -0,0 +1,22 @@
+"""
+URL configuration used by CRM/asgi.py: the routes of CRM.urls, with the
+dashboard and list pages served by their async views.
+"""
+from django.urls import path
+
+from apps.common import async_views
+from CRM.urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'dashboard': async_views.DashboardView,
+    'companies': async_views.CompanyView,
+    'contacts': async_views.ContactView,
+    'projects': async_views.ProjectsView,
+    'earnings': async_views.EarningsView,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(), name=pattern.name)
+    if getattr(pattern, 'name', None) in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
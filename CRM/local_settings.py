@@ -6,10 +6,85 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# Connections are kept open between requests (CONN_MAX_AGE) and checked
+# before reuse. Write transactions start with BEGIN IMMEDIATE so that two
+# writers queue on the busy timeout instead of one failing with "database is
+# locked" when it tries to upgrade a read lock.
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
-}
\ No newline at end of file
+}
+
+# Applied to every new SQLite connection by apps.common.db.configure_sqlite.
+# WAL lets readers run while a write is in progress; synchronous=NORMAL is
+# durable across application crashes in WAL mode (only an OS crash can lose
+# the last commits).
+CRM_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,           # ms
+    'cache_size': -65536,            # KiB (64 MiB)
+    'mmap_size': 268435456,          # bytes (256 MiB)
+    'temp_store': 'memory',
+}
+
+
+# PostgreSQL
+#
+# Set CRM_DB_ENGINE=postgresql (plus CRM_DB_NAME/USER/PASSWORD/HOST/PORT) to
+# use PostgreSQL. Connections come from psycopg's pool inside each process
+# (needs psycopg[pool]); with CRM_DB_PGBOUNCER=1 pooling is left to a
+# PgBouncer in transaction mode instead, which cannot hold the server-side
+# cursors that QuerySet.iterator() (used by the exports) would open.
+
+if os.environ.get('CRM_DB_ENGINE') == 'postgresql':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('CRM_DB_NAME', 'crm'),
+        'USER': os.environ.get('CRM_DB_USER', 'crm'),
+        'PASSWORD': os.environ.get('CRM_DB_PASSWORD', ''),
+        'HOST': os.environ.get('CRM_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('CRM_DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.environ.get('CRM_DB_PGBOUNCER'):
+        DATABASES['default'].update({
+            'CONN_MAX_AGE': 600,
+            'DISABLE_SERVER_SIDE_CURSORS': True,
+        })
+    else:
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('CRM_DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('CRM_DB_POOL_MAX', 10)),
+                'timeout': 10,
+            },
+        }
+
+
+# Read replica
+#
+# CRM_DB_REPLICA_HOST adds a "replica" alias on that host with the primary's
+# settings; apps.common.routers sends the read-heavy GET pages there. With
+# SQLite, CRM_DB_REPLICA=1 adds a second alias on the same file, which
+# exercises the routing without a real replica.
+
+if os.environ.get('CRM_DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=os.environ['CRM_DB_REPLICA_HOST'],
+        PORT=os.environ.get('CRM_DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        TEST={'MIRROR': 'default'},
+    )
+elif os.environ.get('CRM_DB_REPLICA'):
+    DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
@@ -56,6 +56,8 @@ LOCAL_APPS =[
 INSTALLED_APPS = DEFAULT_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'apps.common.profiling.ProfilingMiddleware',
+    'apps.common.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,14 +69,22 @@ MIDDLEWARE = [
     'social_django.middleware.SocialAuthExceptionMiddleware', 
 ]
 
-ROOT_URLCONF = 'CRM.urls'
+# CRM/asgi.py switches to CRM.asgi_urls, which serves the async page views
+ROOT_URLCONF = os.environ.get('CRM_URLCONF', 'CRM.urls')
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates are parsed once per process. runserver's autoreloader
+            # clears the cache when a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -87,6 +97,60 @@ TEMPLATES = [
 WSGI_APPLICATION = 'CRM.wsgi.application'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache evicts the least recently used entries once MAX_ENTRIES is hit.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm-default',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    }
+}
+
+# Seconds a cached dashboard/earnings/projects context may be served
+CRM_CONTEXT_CACHE_TIMEOUT = 300
+
+# Seconds a cached template fragment ({% fragment %}) may be kept. Fragments
+# are keyed by a version stamp of their rows, so this only bounds memory.
+CRM_FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Rows per page on the list pages (overridable with ?page_size= up to the max)
+CRM_PAGE_SIZE = 25
+CRM_MAX_PAGE_SIZE = 200
+
+# Request profiling (see apps/common/profiling.py): always on, or per request
+# with an "X-Profile: 1" header. Records go to a size-rotated JSONL log.
+CRM_PROFILING = False
+CRM_PROFILING_HEADER = DEBUG
+CRM_PROFILING_LOG = BASE_DIR / 'logs' / 'profiling.jsonl'
+CRM_PROFILING_LOG_MAX_BYTES = 10 * 1024 * 1024
+CRM_PROFILING_LOG_BACKUPS = 5
+
+
+
+# Background tasks (see apps/common/tasks.py): DatabaseBackend queues them
+# for `manage.py run_worker`, ImmediateBackend runs them inline. Workers do
+# not share the LocMemCache of the web processes; cached pages still notice
+# their writes because every cached value is keyed by database version
+# stamps (see apps/common/cache.py).
+CRM_TASK_BACKEND = 'apps.common.tasks.DatabaseBackend'
+
+# Read replica routing (see apps/common/routers.py). Only used when the
+# CRM_READ_REPLICA alias exists in DATABASES (see local_settings.py).
+DATABASE_ROUTERS = ['apps.common.routers.PrimaryReplicaRouter']
+CRM_READ_REPLICA = 'replica'
+CRM_REPLICA_VIEWS = {
+    'dashboard', 'companies', 'contacts', 'projects', 'earnings', 'search', 'export',
+    'api-list', 'api-detail', 'api-search', 'api-earnings-chart',
+}
+# Seconds a client's reads stay on the primary after it wrote
+CRM_REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +171,14 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = [
+    'apps.userprofile.backends.ProfileBackend',
+    # Sessions from before ProfileBackend record this one; without it they
+    # would all be logged out
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -128,6 +200,27 @@ os.path.join(BASE_DIR, 'static'),
 )
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# In production collectstatic writes content-hashed, pre-compressed copies
+# that CRM/wsgi.py serves with far-future cache headers; see
+# apps.common.staticfiles.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'apps.common.staticfiles.CompressedManifestStaticFilesStorage'
+        ),
+    },
+    # Uploads waiting for the import worker (apps.common.tasks.import_upload).
+    # Outside MEDIA_ROOT, so they are never served.
+    'imports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.path.join(BASE_DIR, 'imports')},
+    },
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR , 'media')
 MEDIA_URL = '/media/'
 
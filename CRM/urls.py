@@ -17,7 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from apps.common.views import HomeView, SignupView, DashboardView, ProfileUpdateView, ProfileView, CompanyView, ProjectsView, EarningsView, ContactView
+from apps.common.views import HomeView, SignupView, DashboardView, ProfileUpdateView, ProfileView, CompanyView, ProjectsView, EarningsView, ContactView, ImportView, ExportView, SearchView
+
+from apps.common.api import ApiListView, ApiDetailView, ApiSearchView, ApiEarningsChartView, ApiEarningsAnalyticsView, ApiDashboardView, ApiBatchView
 
 from django.contrib.auth import views as auth_views
 
@@ -55,6 +57,17 @@ urlpatterns = [
     path('projects/', ProjectsView.as_view(), name='projects'),
     path('earnings/', EarningsView.as_view(), name='earnings'),
     path('contacts/', ContactView.as_view(), name='contacts'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('import/', ImportView.as_view(), name='import'),
+    path('export/<str:entity>.<str:file_format>', ExportView.as_view(), name='export'),
+
+    path('api/search/', ApiSearchView.as_view(), name='api-search'),
+    path('api/charts/earnings/', ApiEarningsChartView.as_view(), name='api-earnings-chart'),
+    path('api/analytics/earnings/', ApiEarningsAnalyticsView.as_view(), name='api-earnings-analytics'),
+    path('api/dashboard/', ApiDashboardView.as_view(), name='api-dashboard'),
+    path('api/<str:entity>/', ApiListView.as_view(), name='api-list'),
+    path('api/<str:entity>/batch/', ApiBatchView.as_view(), name='api-batch'),
+    path('api/<str:entity>/<int:pk>/', ApiDetailView.as_view(), name='api-detail'),
 ]
     
 
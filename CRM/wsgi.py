@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CRM.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+from apps.common.staticfiles import StaticFilesApp
+
+if not settings.DEBUG:
+    # Answer /static/ requests from STATIC_ROOT before they reach Django
+    application = StaticFilesApp(application)
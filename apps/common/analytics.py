@@ -0,0 +1,203 @@
+"""
+Multi-year earnings analytics: year-over-year growth, rolling averages,
+per-source shares and a trend + seasonal forecast.
+
+Everything is computed from the ``EarningsRollup`` rows of the user, read
+in one query and laid out as a dense cube indexed by (year, source, month)
+with zeros for the gaps. Ten years of history across every source is a few
+hundred numbers, so plain Python lists over the cube are fast enough; the
+result is cached per user and dropped with the rest of their cached data
+whenever one of their earnings changes.
+"""
+from django.utils import timezone
+
+from .cache import cached_for_user
+from .charts import SOURCE_LABELS
+from .fragments import version_stamps
+from .models import EarningsModel
+from .stats import _rollup_rows
+
+SOURCES = [source for source, _ in EarningsModel.SOURCE_CHOICES]
+ROLLING_WINDOWS = (3, 12)
+FORECAST_MONTHS = 12
+# Seasonal factors need at least two observations of every calendar month
+MIN_SEASONAL_MONTHS = 24
+
+
+def build_cube(rows, today):
+    """
+    ``(years, cube)`` where ``cube[y][s][m]`` is the amount earned in month
+    ``m + 1`` of ``years[y]`` from ``SOURCES[s]``. Years run from the first
+    one with earnings to the current one without gaps; rows outside the
+    years EarningsForm accepts (stored before it checked them) are left out.
+    """
+    rows = [
+        row for row in rows
+        if row['source'] in SOURCES and EarningsModel.MIN_YEAR <= row['year'] <= EarningsModel.MAX_YEAR
+    ]
+    if not rows:
+        return [], []
+    first = min(row['year'] for row in rows)
+    last = max(today.year, max(row['year'] for row in rows))
+    years = list(range(first, last + 1))
+    cube = [[[0.0] * 12 for _ in SOURCES] for _ in years]
+    source_index = {source: i for i, source in enumerate(SOURCES)}
+    for row in rows:
+        cube[row['year'] - first][source_index[row['source']]] = [
+            float(row['month_%d' % month] or 0) for month in range(1, 13)
+        ]
+    return years, cube
+
+
+def _growth(current, previous):
+    return (current - previous) / previous if previous else None
+
+
+def year_over_year(years, monthly, today):
+    """
+    Growth of each year on the one before. The current year is compared on
+    the months elapsed so far in both years, so a partial year is not
+    reported as a drop.
+    """
+    growth = []
+    for i in range(1, len(years)):
+        months = today.month if years[i] == today.year else 12
+        growth.append({
+            'year': years[i],
+            'months': months,
+            'total': sum(monthly[i][:months]),
+            'previous': sum(monthly[i - 1][:months]),
+            'growth': _growth(sum(monthly[i][:months]), sum(monthly[i - 1][:months])),
+        })
+    return growth
+
+
+def rolling_average(values, window):
+    """Trailing means over ``window`` values; ``None`` until the window is full."""
+    averages = []
+    running = 0.0
+    for i, value in enumerate(values):
+        running += value
+        if i >= window:
+            running -= values[i - window]
+        averages.append(running / window if i >= window - 1 else None)
+    return averages
+
+
+def source_shares(years, cube):
+    """Total and share of each source, overall and per year."""
+    totals = [[sum(months) for months in year] for year in cube]
+    year_totals = [sum(row) for row in totals]
+    grand_total = sum(year_totals)
+    shares = []
+    for s, source in enumerate(SOURCES):
+        source_total = sum(row[s] for row in totals)
+        if not source_total:
+            continue
+        shares.append({
+            'source': source,
+            'label': SOURCE_LABELS.get(source, 'Other'),
+            'total': source_total,
+            'share': source_total / grand_total,
+            'by_year': [
+                {'year': year, 'share': row[s] / year_total if year_total else None}
+                for year, row, year_total in zip(years, totals, year_totals)
+            ],
+        })
+    shares.sort(key=lambda item: item['total'], reverse=True)
+    return shares
+
+
+def seasonal_offsets(values, first_month):
+    """
+    How far each calendar month sits above or below its year's mean, averaged
+    over the complete twelve-month blocks of ``values``.
+    """
+    deviations = [[] for _ in range(12)]
+    for start in range(0, len(values) - 11, 12):
+        block = values[start:start + 12]
+        mean = sum(block) / 12
+        for t, value in enumerate(block):
+            deviations[(first_month + start + t) % 12].append(value - mean)
+    return [sum(d) / len(d) if d else 0.0 for d in deviations]
+
+
+def forecast(values, first_month, months=FORECAST_MONTHS):
+    """
+    The ``months`` values after ``values``. Once there are two years of
+    history the seasonal offset of each calendar month is removed first; a
+    least-squares line through the rest gives the trend, and the offsets are
+    added back. ``first_month`` is the calendar month (0-11) of
+    ``values[0]``. Forecasts never go below zero.
+    """
+    n = len(values)
+    if not n:
+        return []
+    seasonal = seasonal_offsets(values, first_month) if n >= MIN_SEASONAL_MONTHS else [0.0] * 12
+    adjusted = [value - seasonal[(first_month + t) % 12] for t, value in enumerate(values)]
+    if n == 1:
+        slope, intercept = 0.0, adjusted[0]
+    else:
+        mean_t = (n - 1) / 2
+        mean_v = sum(adjusted) / n
+        variance = sum((t - mean_t) ** 2 for t in range(n))
+        slope = sum((t - mean_t) * (v - mean_v) for t, v in enumerate(adjusted)) / variance
+        intercept = mean_v - slope * mean_t
+
+    return [
+        max(0.0, intercept + slope * t + seasonal[(first_month + t) % 12])
+        for t in range(n, n + months)
+    ]
+
+
+def analyze(rows, today):
+    """Analytics payload of the rollup ``rows`` of one user, as of ``today``."""
+    years, cube = build_cube(rows, today)
+    monthly = [[sum(source[m] for source in year) for m in range(12)] for year in cube]
+
+    # Month by month from the first year up to the current month
+    series = [amount for year, months in zip(years, monthly) if year <= today.year for amount in months]
+    series = series[:len(series) - (12 - today.month)] if series else []
+    labels = ['%d-%02d' % (years[0] + i // 12, i % 12 + 1) for i in range(len(series))]
+
+    growth = year_over_year(years, monthly, today)
+    rolling = {'rolling_%d' % window: rolling_average(series, window) for window in ROLLING_WINDOWS}
+    sources = source_shares(years, cube)
+    predicted = forecast(series, 0)
+    next_labels = [
+        '%d-%02d' % (today.year + (today.month - 1 + i) // 12, (today.month - 1 + i) % 12 + 1)
+        for i in range(1, FORECAST_MONTHS + 1)
+    ]
+    return {
+        'years': [{'year': year, 'total': sum(months)} for year, months in zip(years, monthly)],
+        'growth': growth,
+        'monthly': {'labels': labels, 'data': series, **rolling},
+        'sources': sources,
+        'forecast': {'labels': next_labels if series else [], 'data': predicted},
+        # The latest figure of each, for the cards on the earnings page
+        'summary': {
+            'growth': growth[-1]['growth'] if growth else None,
+            'average': rolling['rolling_12'][-1] if series else None,
+            'next_month': predicted[0] if predicted else None,
+            'top_source': sources[0] if sources else None,
+        },
+    }
+
+
+def earnings_analytics(user, today=None):
+    """``analyze()`` of the user's rollups, in one query."""
+    today = today or timezone.localdate()
+    return analyze(_rollup_rows(user), today)
+
+
+async def aearnings_analytics(user, today=None):
+    today = today or timezone.localdate()
+    return analyze([row async for row in _rollup_rows(user)], today)
+
+
+def get_earnings_analytics(user):
+    """``earnings_analytics()``, cached until the user's earnings change."""
+    return cached_for_user(
+        user.pk, 'earnings-analytics', lambda: earnings_analytics(user),
+        stamps=version_stamps(user.pk, ['earnings']),
+    )
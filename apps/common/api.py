@@ -0,0 +1,360 @@
+"""
+Read-only JSON API for companies, contacts, projects and earnings.
+
+    GET /api/<entity>/              keyset-paginated list (?after=, ?before=, ?page_size=)
+    GET /api/<entity>/<pk>/         single record
+    POST /api/<entity>/batch/       create, update and delete many records at once (see batch.py)
+    GET /api/search/?q=             ranked matches across companies, contacts and projects
+    GET /api/charts/earnings/       monthly earnings chart (?year=, ?years= for a multi-year series)
+    GET /api/analytics/earnings/    growth, rolling averages, source shares and forecast of all years
+    GET /api/dashboard/             every dashboard widget in one payload (?since= for changes only)
+
+The list and detail endpoints accept ``?fields=a,b`` to limit the
+serialized fields, and answer with a strong ETag derived from ``updated_at``
+(plus the row count for lists) so that polling clients get a 304 without
+the rows being loaded or serialized. Details also send Last-Modified; lists
+do not, since deleting a row does not move the newest ``updated_at``.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+
+from .analytics import get_earnings_analytics
+from .batch import MAX_OPERATIONS, run_batch
+from .cache import _missing, _record
+from .charts import earnings_chart_json, get_chart_data, MAX_YEARS
+from .deadlines import get_deadlines
+from .fragments import version_stamps
+from .models import Company, Contact, Project, EarningsModel
+from .pagination import (
+    KeysetPaginator, InvalidCursor, get_page_size,
+    COMPANY_ORDERING, CONTACT_ORDERING, PROJECT_ORDERING, EARNINGS_ORDERING,
+)
+from .search import search
+from .stats import _recent, get_earnings_stats, get_entity_counts
+
+
+class Resource:
+
+    def __init__(self, model, fields, ordering):
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+
+    def parse_fields(self, request):
+        requested = request.GET.get('fields')
+        if not requested:
+            return self.fields
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise ValueError('Unknown field(s): %s' % ', '.join(unknown))
+        return fields
+
+    def queryset(self, owner, fields):
+        # Load the selected columns plus whatever the keyset ordering needs
+        ordering = [name.lstrip('-') for name in self.ordering if name.lstrip('-') != 'pk']
+        return self.model.objects.filter(owner=owner).only(*set(fields) | set(ordering))
+
+    def serialize(self, obj, fields):
+        opts = self.model._meta
+        return {name: getattr(obj, opts.get_field(name).attname) for name in fields}
+
+
+RESOURCES = {
+    'companies': Resource(Company, [
+        'id', 'name', 'email', 'phone', 'address', 'website', 'description', 'created_at', 'updated_at',
+    ], COMPANY_ORDERING),
+    'contacts': Resource(Contact, [
+        'id', 'name', 'email', 'phone', 'description', 'created_at', 'updated_at',
+    ], CONTACT_ORDERING),
+    'projects': Resource(Project, [
+        'id', 'name', 'company', 'description', 'status', 'priority', 'progress', 'start_date',
+        'due_date', 'budget', 'created_at', 'updated_at',
+    ], PROJECT_ORDERING),
+    'earnings': Resource(EarningsModel, [
+        'id', 'month', 'year', 'amount', 'source', 'description', 'created_at', 'updated_at',
+    ], EARNINGS_ORDERING),
+}
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+class ApiView(LoginRequiredMixin, View):
+    raise_exception = True
+    http_method_names = ['get', 'head', 'options']
+
+    def conditional(self, request, etag, last_modified, build):
+        """Return a 304 when the client's validators match, else ``build()``."""
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = build()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+class ApiListView(ApiView):
+
+    def get(self, request, entity):
+        resource = RESOURCES.get(entity)
+        if resource is None:
+            return error('Unknown resource.', status=404)
+        try:
+            fields = resource.parse_fields(request)
+        except ValueError as e:
+            return error(str(e))
+
+        queryset = resource.queryset(request.user, fields)
+        state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        etag = make_etag(
+            entity, request.user.pk, state['last_modified'], state['count'], sorted(request.GET.items())
+        )
+
+        def build():
+            paginator = KeysetPaginator(queryset, resource.ordering, get_page_size(request))
+            try:
+                page = paginator.page(
+                    after=request.GET.get('after'),
+                    before=request.GET.get('before'),
+                    params=request.GET.dict(),
+                )
+            except InvalidCursor:
+                return error('Invalid page cursor.')
+            return JsonResponse({
+                'results': [resource.serialize(obj, fields) for obj in page],
+                'next': request.path + page.next_url if page.has_next() else None,
+                'previous': request.path + page.previous_url if page.has_previous() else None,
+            })
+
+        # No Last-Modified: the newest updated_at does not move when a row is
+        # deleted, so If-Modified-Since alone could miss deletions. The ETag
+        # covers them through the row count.
+        return self.conditional(request, etag, None, build)
+
+
+class ApiDetailView(ApiView):
+
+    def get(self, request, entity, pk):
+        resource = RESOURCES.get(entity)
+        if resource is None:
+            return error('Unknown resource.', status=404)
+        try:
+            fields = resource.parse_fields(request)
+        except ValueError as e:
+            return error(str(e))
+
+        try:
+            obj = resource.queryset(request.user, set(fields) | {'updated_at'}).get(pk=pk)
+        except resource.model.DoesNotExist:
+            return error('No such record.', status=404)
+
+        etag = make_etag(entity, obj.pk, obj.updated_at, fields)
+        return self.conditional(
+            request, etag, obj.updated_at,
+            lambda: JsonResponse(resource.serialize(obj, fields)),
+        )
+
+
+class ApiBatchView(ApiView):
+    """
+    ``{"operations": [...]}`` in, ``{"applied": bool, "results": [...]}``
+    out; 200 when the batch was applied, 400 with the per-operation errors
+    when nothing was.
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request, entity):
+        if entity not in RESOURCES:
+            return error('Unknown resource.', status=404)
+        try:
+            operations = json.loads(request.body)['operations']
+        except (ValueError, TypeError, KeyError):
+            return error('Expected a JSON object with an "operations" list.')
+        if not isinstance(operations, list) or not operations:
+            return error('"operations" must be a non-empty list.')
+        if len(operations) > MAX_OPERATIONS:
+            return error('At most %d operations per batch.' % MAX_OPERATIONS)
+
+        result = run_batch(entity, operations, request.user)
+        return JsonResponse(result.as_dict(), status=200 if result.applied else 400)
+
+
+class ApiSearchView(ApiView):
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return error('Missing search query (?q=).')
+        return JsonResponse({'results': search(request.user, query)})
+
+
+class ApiEarningsChartView(ApiView):
+
+    def get(self, request):
+        try:
+            year = int(request.GET.get('year', timezone.localdate().year))
+            years = int(request.GET.get('years', 1))
+        except ValueError:
+            return error('year and years must be integers.')
+        if not EarningsModel.MIN_YEAR <= year <= EarningsModel.MAX_YEAR:
+            return error('year must be between %d and %d.' % (EarningsModel.MIN_YEAR, EarningsModel.MAX_YEAR))
+        if not 1 <= years <= MAX_YEARS:
+            return error('years must be between 1 and %d.' % MAX_YEARS)
+
+        payload = earnings_chart_json(request.user, year, years)
+        return self.conditional(
+            request, make_etag(payload), None,
+            lambda: HttpResponse(payload, content_type='application/json'),
+        )
+
+
+class ApiEarningsAnalyticsView(ApiView):
+
+    def get(self, request):
+        payload = get_earnings_analytics(request.user)
+        return self.conditional(
+            request, make_etag(payload), None,
+            lambda: JsonResponse(payload, json_dumps_params={'separators': (',', ':')}),
+        )
+
+
+def _recent_rows(model, *fields):
+    return lambda user, today: list(_recent(model, user).values(*fields))
+
+
+def _counts_widget(user, today):
+    counts = get_entity_counts(user)
+    return {
+        'companies': counts['companies_count'] or 0,
+        'contacts': counts['contacts_count'] or 0,
+        'projects': counts['projects_count'] or 0,
+    }
+
+
+def _earnings_widget(user, today):
+    stats = get_earnings_stats(user, today)
+    earnings_chart, sources_chart = get_chart_data(stats)
+    return {
+        'current_month': float(stats['current_month']),
+        'earnings_chart': earnings_chart,
+        'sources_chart': sources_chart,
+    }
+
+
+def _deadlines_widget(user, today):
+    summary = get_deadlines(user.pk, today)
+    return {
+        'overdue': summary.overdue_count,
+        'due_today': summary.due_today_count,
+        'due_week': summary.due_week_count,
+        'due_month': summary.due_month_count,
+        'due_soon': summary.due_soon,
+    }
+
+
+# name: (entities whose version stamp the widget depends on, builder)
+DASHBOARD_WIDGETS = {
+    'counts': (['companies', 'contacts', 'projects'], _counts_widget),
+    'earnings': (['earnings'], _earnings_widget),
+    'recent_companies': (['companies'], _recent_rows(Company, 'id', 'name', 'email', 'created_at')),
+    'recent_projects': (['projects'], _recent_rows(Project, 'id', 'name', 'status', 'progress', 'due_date')),
+    'recent_contacts': (['contacts'], _recent_rows(Contact, 'id', 'name', 'email', 'created_at')),
+    'deadlines': (['projects'], _deadlines_widget),
+}
+DASHBOARD_ENTITIES = sorted({entity for entities, _ in DASHBOARD_WIDGETS.values() for entity in entities})
+
+
+def widget_versions(user, today):
+    """
+    ``{widget: version}`` from the fragment version stamps (one query). The
+    date is part of every version since earnings and deadlines are relative
+    to it.
+    """
+    stamps = dict(zip(DASHBOARD_ENTITIES, version_stamps(user.pk, DASHBOARD_ENTITIES)))
+    return {
+        name: hashlib.sha1(
+            repr((name, [stamps[entity] for entity in entities], today)).encode()
+        ).hexdigest()[:8]
+        for name, (entities, _) in DASHBOARD_WIDGETS.items()
+    }
+
+
+def parse_since(token):
+    """``{widget: version}`` of a previous response's ``version``, or ``{}`` if unusable."""
+    versions = (token or '').split('.')
+    if len(versions) != len(DASHBOARD_WIDGETS):
+        return {}
+    return dict(zip(DASHBOARD_WIDGETS, versions))
+
+
+def build_widgets(user, today, versions):
+    """
+    Data of the ``versions`` widgets. Each one is cached under its version,
+    so the other tabs and devices of the user polling the same state share
+    it; the lookups are a single ``get_many``.
+    """
+    keys = {name: 'crm:dash:%s:%s:%s' % (user.pk, name, version) for name, version in versions.items()}
+    cached = cache.get_many(keys.values())
+    widgets, missing = {}, {}
+    for name, key in keys.items():
+        value = cached.get(key, _missing)
+        if value is _missing:
+            _record('dashboard-widget', 'misses')
+            value = missing[key] = DASHBOARD_WIDGETS[name][1](user, today)
+        else:
+            _record('dashboard-widget', 'hits')
+        widgets[name] = value
+    if missing:
+        cache.set_many(missing, settings.CRM_CONTEXT_CACHE_TIMEOUT)
+    return widgets
+
+
+@method_decorator(gzip_page, name='dispatch')
+class ApiDashboardView(ApiView):
+    """
+    The dashboard widgets as one compact JSON document::
+
+        {"version": "<token>", "widgets": {"counts": {...}, "earnings": {...}, ...}}
+
+    Pass the ``version`` of the previous response as ``?since=`` to receive
+    only the widgets that changed since then; an unchanged dashboard comes
+    back as ``{"version": ..., "widgets": {}}`` or, with If-None-Match, as a
+    304. Responses are gzipped when the client accepts it.
+    """
+
+    def get(self, request):
+        user = request.user
+        today = timezone.localdate()
+        versions = widget_versions(user, today)
+        previous = parse_since(request.GET.get('since'))
+        changed = {name: version for name, version in versions.items() if previous.get(name) != version}
+        token = '.'.join(versions.values())
+
+        return self.conditional(
+            request, make_etag('dashboard', user.pk, token, sorted(changed)), None,
+            lambda: JsonResponse(
+                {'version': token, 'widgets': build_widgets(user, today, changed)},
+                json_dumps_params={'separators': (',', ':')},
+            ),
+        )
@@ -0,0 +1,134 @@
+"""
+Async versions of the dashboard and list pages, served by CRM/asgi.py (see
+CRM/asgi_urls.py).
+
+They subclass the synchronous views and only replace how the GET context is
+built: the user is loaded with ``request.auser()`` and the independent
+queries of a page are awaited together with ``asyncio.gather``. Django's
+async ORM still runs each query in its shared sync thread, so the queries
+themselves are not parallel; the gain is that a request waiting on the
+database no longer occupies a worker thread. Form POSTs, which are rare,
+reuse the synchronous handlers through ``sync_to_async``.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic.base import ContextMixin
+
+from . import views
+from .analytics import aearnings_analytics
+from .cache import acached_context
+from .charts import get_chart_data
+from .deadlines import with_overdue
+from .forms import CompanyForm, ContactForm, EarningsForm, ProjectForm
+from .models import Company, Contact, Project, EarningsModel
+from .pagination import apaginate, COMPANY_ORDERING, CONTACT_ORDERING, PROJECT_ORDERING, EARNINGS_ORDERING
+from .stats import aget_dashboard_stats, aget_earnings_stats, aget_project_stats
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Resolve the lazy request.user here; touching it from the event loop
+        # would run a synchronous query.
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+    def base_context(self, **kwargs):
+        return ContextMixin.get_context_data(self, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(await self.aget_context_data(**kwargs))
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class DashboardView(AsyncLoginRequiredMixin, views.DashboardView):
+    http_method_names = ['get', 'head', 'options']
+
+    async def aget_context_data(self, **kwargs):
+        context = self.base_context(**kwargs)
+        context.update(await acached_context(
+            self.request, 'dashboard', self.aget_dashboard_data, entities=views.DASHBOARD_ENTITIES,
+        ))
+        return context
+
+    async def aget_dashboard_data(self):
+        stats = await aget_dashboard_stats(self.request.user)
+        stats['earnings_chart_data'] = json.dumps(stats['earnings_chart'])
+        stats['sources_chart_data'] = json.dumps(stats['sources_chart'])
+        return stats
+
+
+class CompanyView(AsyncLoginRequiredMixin, views.CompanyView):
+
+    async def aget_context_data(self, **kwargs):
+        context = self.base_context(**kwargs)
+        context['company_form'] = CompanyForm()
+        context['page'] = await apaginate(self.request, Company.objects.filter(owner=self.request.user), COMPANY_ORDERING)
+        context['companies'] = context['page'].object_list
+        return context
+
+
+class ContactView(AsyncLoginRequiredMixin, views.ContactView):
+
+    async def aget_context_data(self, **kwargs):
+        context = self.base_context(**kwargs)
+        context['contact_form'] = ContactForm()
+        context['page'] = await apaginate(self.request, Contact.objects.filter(owner=self.request.user), CONTACT_ORDERING)
+        context['contacts'] = context['page'].object_list
+        return context
+
+
+class ProjectsView(AsyncLoginRequiredMixin, views.ProjectsView):
+
+    async def aget_context_data(self, **kwargs):
+        context = self.base_context(**kwargs)
+        user = self.request.user
+        context['project_form'] = ProjectForm(user=user)
+        projects = Project.objects.filter(owner=user).select_related('company').only(
+            'name', 'status', 'priority', 'start_date', 'due_date', 'budget', 'created_at', 'company__name'
+        )
+        context['page'], stats = await asyncio.gather(
+            apaginate(self.request, with_overdue(projects), PROJECT_ORDERING),
+            acached_context(self.request, 'projects', lambda: aget_project_stats(user), entities=['projects']),
+        )
+        context['projects'] = context['page'].object_list
+        context.update(stats)
+        return context
+
+
+class EarningsView(AsyncLoginRequiredMixin, views.EarningsView):
+
+    async def aget_context_data(self, **kwargs):
+        context = self.base_context(**kwargs)
+        user_earnings = EarningsModel.objects.filter(owner=self.request.user)
+
+        context['earning_form'] = EarningsForm()
+        context['page'], stats = await asyncio.gather(
+            apaginate(self.request, user_earnings, EARNINGS_ORDERING),
+            acached_context(self.request, 'earnings', self.aget_earnings_data, entities=['earnings']),
+        )
+        context['earnings'] = context['page'].object_list
+        context.update(stats)
+        return context
+
+    async def aget_earnings_data(self):
+        stats, analytics = await asyncio.gather(
+            aget_earnings_stats(self.request.user), aearnings_analytics(self.request.user),
+        )
+        earnings_chart, sources_chart = get_chart_data(stats)
+        return {
+            'total_year_earnings': stats['total_year'],
+            'current_month_earnings': stats['current_month'],
+            'last_month_earnings': stats['last_month'],
+            'active_sources_count': stats['active_sources_count'],
+            'earnings_chart_data': json.dumps(earnings_chart),
+            'sources_chart_data': json.dumps(sources_chart),
+            'analytics': analytics,
+        }
@@ -0,0 +1,193 @@
+"""
+Batched create, update and delete of companies, contacts, projects and
+earnings.
+
+A batch is a list of operations::
+
+    [
+        {"op": "create", "data": {"name": "Acme", "email": "hello@acme.test"}},
+        {"op": "update", "id": 12, "data": {"status": "completed"}},
+        {"op": "delete", "id": 13},
+    ]
+
+Every operation is validated first, with the field rules of the entity's
+ModelForm (through its importer, see importers.py); updates only touch the
+fields they list. If any operation is invalid nothing is written. Otherwise
+the whole batch is applied in one transaction with one filtered delete(),
+one bulk_update and one bulk_create, instead of a request and a handful of
+queries per row. The outcome is reported per operation, in order.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import bump_generation
+from .importers import IMPORTERS
+from .models import DeadlineSummary, EarningsModel, EarningsRollup, Project
+from .search import index_objects
+
+MAX_OPERATIONS = 1000
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchResult:
+
+    def __init__(self, operations):
+        self.applied = False
+        self.results = [
+            {'index': index, 'op': op.get('op') if isinstance(op, dict) else None, 'status': 'valid'}
+            for index, op in enumerate(operations)
+        ]
+
+    def add_error(self, index, errors):
+        result = self.results[index]
+        result['status'] = 'invalid'
+        for name, messages in errors.items():
+            result.setdefault('errors', {}).setdefault(name, []).extend(messages)
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result['status'] == 'invalid']
+
+    def as_dict(self):
+        return {'applied': self.applied, 'results': self.results}
+
+
+def _parse(operations, result):
+    """Check the shape of each operation; returns the well-formed ones."""
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            result.add_error(index, {'op': ['Must be one of: %s.' % ', '.join(OPERATIONS)]})
+            continue
+        op = operation['op']
+        pk = operation.get('id')
+        if op != 'create' and (not isinstance(pk, int) or isinstance(pk, bool)):
+            result.add_error(index, {'id': ['An integer id is required.']})
+            continue
+        data = operation.get('data', {})
+        if op != 'delete' and not isinstance(data, dict):
+            result.add_error(index, {'data': ['Must be an object.']})
+            continue
+        if op != 'create':
+            result.results[index]['id'] = pk
+        parsed.append((index, op, pk, data))
+    return parsed
+
+
+def _unique_conflicts(model, objs, freed, result):
+    """
+    Flag rows of ``objs`` (``(index, obj)``) whose unique_together key is
+    taken by another row of the batch or by a stored row the batch does not
+    change or delete (``freed`` pks).
+    """
+    for fields in model._meta.unique_together:
+        seen = {}
+        for index, obj in objs:
+            key = tuple(getattr(obj, model._meta.get_field(name).attname) for name in fields)
+            if key in seen:
+                result.add_error(index, {'__all__': ['Same %s as operation %d.' % (', '.join(fields), seen[key])]})
+            else:
+                seen[key] = index
+        if not seen:
+            continue
+        owner_id = objs[0][1].owner_id
+        stored = model.objects.filter(owner_id=owner_id).exclude(pk__in=freed).filter(
+            **{'%s__in' % name: {key[i] for key in seen} for i, name in enumerate(fields) if name != 'owner'}
+        ).values_list(*[model._meta.get_field(name).attname for name in fields])
+        for key in set(stored) & set(seen):
+            result.add_error(seen[key], {'__all__': ['A record with this %s already exists.' % ', '.join(fields)]})
+
+
+def run_batch(entity, operations, owner):
+    """Validate and apply ``operations`` on ``entity`` rows of ``owner``; returns a BatchResult."""
+    importer = IMPORTERS[entity]
+    model = importer.model
+    result = BatchResult(operations)
+    parsed = _parse(operations, result)
+
+    # One operation per stored row
+    targets = {}
+    for index, op, pk, _ in parsed:
+        if op != 'create':
+            if pk in targets:
+                result.add_error(index, {'id': ['Record %d is already changed by operation %d.' % (pk, targets[pk])]})
+            else:
+                targets[pk] = index
+    existing = model.objects.in_bulk([pk for pk in targets if pk is not None]) if targets else {}
+    existing = {pk: obj for pk, obj in existing.items() if obj.owner_id == owner.pk}
+
+    rows = []
+    for index, op, pk, data in parsed:
+        if op != 'create' and pk not in existing:
+            result.add_error(index, {'id': ['No such record.']})
+            continue
+        if op == 'delete':
+            continue
+        unknown = sorted(set(data) - set(importer.fields))
+        if unknown:
+            result.add_error(index, {name: ['Unknown field.'] for name in unknown})
+            continue
+        cleaned, errors = importer.clean_row(data, partial=op == 'update')
+        if errors:
+            result.add_error(index, errors)
+        else:
+            rows.append((index, cleaned))
+    rows = importer._resolve_related(rows, owner, result)
+
+    creates, updates, changed_fields = [], [], set()
+    operation_of = {index: (op, pk) for index, op, pk, _ in parsed}
+    for index, cleaned in rows:
+        op, pk = operation_of[index]
+        if op == 'create':
+            creates.append((index, model(owner=owner, **cleaned)))
+        else:
+            obj = existing[pk]
+            for name, value in cleaned.items():
+                setattr(obj, name, value)
+            changed_fields.update(cleaned)
+            updates.append((index, obj))
+    deletes = [pk for index, op, pk, _ in parsed if op == 'delete' and pk in existing]
+    _unique_conflicts(model, updates + creates, [obj.pk for _, obj in updates] + deletes, result)
+
+    if result.errors:
+        return result
+
+    # Rollup buckets the updated earnings are leaving
+    rollup_keys = {obj._rollup_key for _, obj in updates} if model is EarningsModel else set()
+    now = timezone.now()
+    for _, obj in updates:
+        obj.updated_at = now
+    try:
+        with transaction.atomic():
+            if deletes:
+                # A filtered delete() still sends the post_delete signals, so
+                # the search index, rollups and caches follow as for one row
+                model.objects.filter(owner=owner, pk__in=deletes).delete()
+            if updates:
+                model.objects.bulk_update([obj for _, obj in updates], sorted(changed_fields) + ['updated_at'])
+            if creates:
+                model.objects.bulk_create([obj for _, obj in creates])
+    except IntegrityError:
+        for index, _ in updates + creates:
+            result.add_error(index, {'__all__': ['Conflicts with another record.']})
+        return result
+
+    # bulk_create and bulk_update bypass the model signals
+    written = [obj for _, obj in updates + creates]
+    if written:
+        index_objects(written)
+        if model is EarningsModel:
+            rollup_keys.update((obj.owner_id, obj.year, obj.source) for obj in written)
+            for key in rollup_keys:
+                EarningsRollup.refresh(*key)
+        if model is Project:
+            DeadlineSummary.objects.filter(owner=owner).delete()
+        bump_generation(owner.pk)
+
+    result.applied = True
+    statuses = {'create': 'created', 'update': 'updated', 'delete': 'deleted'}
+    for row in result.results:
+        row['status'] = statuses[row['op']]
+    for index, obj in creates:
+        result.results[index]['id'] = obj.pk
+    return result
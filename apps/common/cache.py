@@ -0,0 +1,153 @@
+"""
+Per-user cache for the expensive view contexts.
+
+Every user has a generation number in the cache; cached contexts are stored
+under keys that include it, so bumping the generation (done by the signal
+handlers in models.py whenever one of the user's rows changes) makes all of
+their old entries unreachable at once. Stale entries are then left for the
+cache backend to evict.
+
+The generation lives in the cache, so with the default LocMemCache a bump
+only reaches the process that made it. Writes made elsewhere, such as the
+imports run by ``manage.py run_worker``, are noticed through the version
+stamps of fragments.py instead: they are read from the database and every
+cached value is keyed by the stamps of the tables it is computed from
+(``entities`` of cached_context(), ``stamps`` of cached_for_user()).
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .profiling import record_cache
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+
+_missing = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(name, outcome, fragment=False):
+    with _stats_lock:
+        _stats[(name, outcome)] += 1
+    record_cache(outcome, fragment)
+
+
+def cache_stats():
+    """Hit/miss/bypass counters of this process, as ``{name: {outcome: n}}``."""
+    with _stats_lock:
+        items = list(_stats.items())
+    stats = {}
+    for (name, outcome), count in items:
+        stats.setdefault(name, {'hits': 0, 'misses': 0, 'bypass': 0})[outcome] = count
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _generation_key(user_id):
+    return 'crm:gen:%s' % user_id
+
+
+def get_generation(user_id):
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock rather than 1 so that a generation which was
+        # evicted never comes back with a number that old entries still use.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(user_id):
+    key = _generation_key(user_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(user_id):
+    """Invalidate every cached context of ``user_id``."""
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _context_key(name, user_id, generation, stamps=()):
+    return 'crm:ctx:%s:%s:%s:%s:%s' % (
+        name, user_id, generation, '-'.join(stamps), timezone.localdate().isoformat(),
+    )
+
+
+def cached_for_user(user_id, name, builder, timeout=None, stamps=()):
+    """
+    Return ``builder()``, cached under ``name`` until one of the user's rows
+    changes (or one of ``stamps`` does, see fragments.version_stamps).
+    """
+    key = _context_key(name, user_id, get_generation(user_id), stamps)
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        _record(name, 'hits')
+        return value
+
+    _record(name, 'misses')
+    value = builder()
+    if timeout is None:
+        timeout = settings.CRM_CONTEXT_CACHE_TIMEOUT
+    cache.set(key, value, timeout)
+    return value
+
+
+def cached_context(request, name, builder, timeout=None, entities=()):
+    """
+    Return ``builder()``, cached per user until one of their rows changes.
+
+    Keys also carry the current date because the statistics are relative to
+    "this month" and "today", and the version stamps of ``entities``, the
+    tables the context is computed from: bulk writes skip the signal handlers
+    that bump the generation, and pages render this context inside fragments
+    keyed by those stamps, which must not be filled from a stale context.
+    The stamps are shared with the page's fragments, so they cost no extra
+    query. Requests other than GET/HEAD always rebuild.
+    """
+    if request.method not in CACHEABLE_METHODS:
+        _record(name, 'bypass')
+        return builder()
+    from .fragments import request_stamps
+    stamps = request_stamps(request, entities) if entities else ()
+    return cached_for_user(request.user.pk, name, builder, timeout, stamps)
+
+
+async def acached_context(request, name, builder, timeout=None, entities=()):
+    """Async version of cached_context(); ``builder`` is a coroutine function."""
+    if request.method not in CACHEABLE_METHODS:
+        _record(name, 'bypass')
+        return await builder()
+
+    from .fragments import arequest_stamps
+    stamps = await arequest_stamps(request, entities) if entities else ()
+    user_id = request.user.pk
+    key = _context_key(name, user_id, await aget_generation(user_id), stamps)
+    value = await cache.aget(key, _missing)
+    if value is not _missing:
+        _record(name, 'hits')
+        return value
+
+    _record(name, 'misses')
+    value = await builder()
+    if timeout is None:
+        timeout = settings.CRM_CONTEXT_CACHE_TIMEOUT
+    await cache.aset(key, value, timeout)
+    return value
@@ -0,0 +1,89 @@
+"""
+Chart.js payloads for the earnings charts.
+
+Everything is read from the ``EarningsRollup`` table, which already holds
+one row per (year, source) with a column per month, so a payload is built
+from a handful of rows with twelve slots each no matter how many earnings
+the user has. The serialized JSON is cached per (user, year) until the
+version stamp of the user's earnings changes.
+"""
+import json
+
+from django.db.models import Sum
+
+from .cache import cached_for_user
+from .fragments import version_stamps
+from .models import EarningsModel, EarningsRollup
+
+MONTHS = [label for _, label in EarningsModel.MONTH_CHOICES]
+SOURCE_LABELS = dict(EarningsModel.SOURCE_CHOICES)
+MAX_YEARS = 10
+
+
+def _floats(row):
+    return [float(row[field] or 0) for field in EarningsRollup.MONTH_FIELDS]
+
+
+def monthly_by_year(user, years):
+    """``{year: [12 monthly totals]}`` for each of ``years``, in one grouped query."""
+    rows = (
+        EarningsRollup.objects.filter(owner=user, year__in=years)
+        .order_by()
+        .values('year')
+        .annotate(**{field: Sum(field) for field in EarningsRollup.MONTH_FIELDS})
+    )
+    series = {year: [0.0] * 12 for year in years}
+    for row in rows:
+        series[row['year']] = _floats(row)
+    return series
+
+
+def monthly_by_source(user, year):
+    """``[(source, [12 monthly totals])]`` for ``year``, largest source first."""
+    rows = EarningsRollup.objects.filter(owner=user, year=year).order_by('-total', 'source').values(
+        'source', *EarningsRollup.MONTH_FIELDS
+    )
+    return [(row['source'], _floats(row)) for row in rows]
+
+
+def get_chart_data(earnings_stats):
+    """Chart.js payloads for the monthly line chart and the sources doughnut."""
+    return (
+        {
+            'labels': MONTHS,
+            'data': earnings_stats['monthly'],
+        },
+        {
+            'labels': [SOURCE_LABELS.get(source, 'Other') for source, _ in earnings_stats['sources']],
+            'data': [total for _, total in earnings_stats['sources']],
+        },
+    )
+
+
+def earnings_chart(user, year, years=1):
+    """
+    Monthly totals of ``year`` and the ``years - 1`` before it (one dataset
+    per year), plus the months of ``year`` stacked per source.
+    """
+    year_range = list(range(year - years + 1, year + 1))
+    by_year = monthly_by_year(user, year_range)
+    return {
+        'labels': MONTHS,
+        'year': year,
+        'data': by_year[year],
+        'years': [{'label': str(y), 'data': by_year[y]} for y in reversed(year_range)],
+        'sources': [
+            {'source': source, 'label': SOURCE_LABELS.get(source, 'Other'), 'data': data, 'stack': 'sources'}
+            for source, data in monthly_by_source(user, year)
+        ],
+    }
+
+
+def earnings_chart_json(user, year, years=1):
+    """``earnings_chart()`` serialized to bytes, cached per (user, year, years)."""
+    years = max(1, min(years, MAX_YEARS))
+    return cached_for_user(
+        user.pk, 'earnings-chart:%d:%d' % (year, years),
+        lambda: json.dumps(earnings_chart(user, year, years), separators=(',', ':')).encode(),
+        stamps=version_stamps(user.pk, ['earnings']),
+    )
@@ -0,0 +1,27 @@
+"""
+Per-connection database setup.
+
+SQLite keeps most of its tuning knobs (journal mode, sync level, page
+cache, mmap) per connection rather than per file, so they are applied with
+PRAGMA statements each time Django opens a connection. The values come from
+the ``CRM_SQLITE_PRAGMAS`` setting.
+"""
+import re
+
+from django.conf import settings
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created receiver applying ``CRM_SQLITE_PRAGMAS``."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'CRM_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            value = str(value)
+            if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(value):
+                raise ValueError('Invalid SQLite pragma: %s = %s' % (name, value))
+            cursor.execute('PRAGMA %s = %s' % (name, value))
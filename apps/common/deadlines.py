@@ -0,0 +1,128 @@
+"""
+Project deadlines.
+
+A project is open while its status is not "completed"; open projects with a
+due date are covered by the partial index ``project_owner_due_open_idx``
+(owner, due_date WHERE status <> 'completed'), so the queries below are
+range scans of that index whatever the size of the project table.
+
+Each user's buckets (overdue, due today, due in the next 7 and 30 days) and
+the feed of projects due soon are stored in DeadlineSummary. The row is
+valid for the day it was computed on: it is dropped when one of the user's
+projects changes, rebuilt on the next read if it is missing or from an
+earlier day, and rebuilt for everyone by ``manage.py refresh_deadlines``,
+meant to run nightly just after midnight.
+"""
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import BooleanField, Case, Count, Q, Value, When
+from django.utils import timezone
+
+from .models import DeadlineSummary, Project
+
+DUE_SOON_DAYS = 7
+HORIZON_DAYS = 30
+FEED_SIZE = 10
+
+
+def open_deadlines(owner_id):
+    """Open projects of the owner that have a due date."""
+    # ``exclude`` renders NOT (status = 'completed'), the condition of the
+    # partial index, so the planner can use it.
+    return Project.objects.filter(owner_id=owner_id, due_date__isnull=False).exclude(status='completed')
+
+
+def overdue(owner_id, today=None):
+    """Open projects past their due date, the longest overdue first."""
+    today = today or timezone.localdate()
+    return open_deadlines(owner_id).filter(due_date__lt=today).order_by('due_date', 'pk')
+
+
+def due_within(owner_id, days, today=None):
+    """Open projects due between today and ``days`` days from now, soonest first."""
+    today = today or timezone.localdate()
+    return open_deadlines(owner_id).filter(
+        due_date__range=(today, today + datetime.timedelta(days=days))
+    ).order_by('due_date', 'pk')
+
+
+def overdue_flag(today):
+    """Expression that is true for open projects past their due date."""
+    return Case(
+        When(Q(due_date__lt=today) & ~Q(status='completed'), then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    )
+
+
+def with_overdue(queryset, today=None):
+    """Annotate ``overdue`` on each project of ``queryset``."""
+    return queryset.annotate(overdue=overdue_flag(today or timezone.localdate()))
+
+
+def compute_summary(owner_id, today):
+    """The DeadlineSummary fields of ``owner_id`` for ``today``, in two queries."""
+    day = datetime.timedelta(days=1)
+    counts = open_deadlines(owner_id).filter(
+        due_date__lte=today + HORIZON_DAYS * day
+    ).aggregate(
+        overdue_count=Count('pk', filter=Q(due_date__lt=today)),
+        due_today_count=Count('pk', filter=Q(due_date=today)),
+        due_week_count=Count('pk', filter=Q(due_date__range=(today + day, today + DUE_SOON_DAYS * day))),
+        due_month_count=Count('pk', filter=Q(due_date__gt=today + DUE_SOON_DAYS * day)),
+    )
+    feed = due_within(owner_id, DUE_SOON_DAYS, today).values(
+        'pk', 'name', 'due_date', 'priority', 'status'
+    )[:FEED_SIZE]
+    counts['due_soon'] = [
+        {
+            'id': row['pk'],
+            'name': row['name'],
+            'due_date': row['due_date'].isoformat(),
+            'days_left': (row['due_date'] - today).days,
+            'priority': row['priority'],
+            'status': row['status'],
+        }
+        for row in feed
+    ]
+    return counts
+
+
+def refresh(owner_id, today=None):
+    """Recompute and store the summary of ``owner_id``."""
+    today = today or timezone.localdate()
+    summary, _ = DeadlineSummary.objects.update_or_create(
+        owner_id=owner_id, defaults=dict(compute_summary(owner_id, today), computed_on=today),
+    )
+    return summary
+
+
+def get_deadlines(owner_id, today=None):
+    """The summary of ``owner_id`` for ``today``, recomputed only if it is stale."""
+    today = today or timezone.localdate()
+    summary = DeadlineSummary.objects.filter(owner_id=owner_id).first()
+    if summary is None or summary.computed_on != today:
+        summary = refresh(owner_id, today)
+    return summary
+
+
+async def aget_deadlines(owner_id, today=None):
+    today = today or timezone.localdate()
+    summary = await DeadlineSummary.objects.filter(owner_id=owner_id).afirst()
+    if summary is None or summary.computed_on != today:
+        summary = await sync_to_async(refresh)(owner_id, today)
+    return summary
+
+
+def rebuild(owner_ids=None, today=None):
+    """Recompute the summaries of ``owner_ids`` (every user with projects by default)."""
+    today = today or timezone.localdate()
+    if owner_ids is None:
+        owner_ids = Project.objects.order_by().values_list('owner_id', flat=True).distinct()
+        DeadlineSummary.objects.exclude(owner_id__in=owner_ids).delete()
+    count = 0
+    for owner_id in list(owner_ids):
+        refresh(owner_id, today)
+        count += 1
+    return count
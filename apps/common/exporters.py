@@ -0,0 +1,80 @@
+"""
+Streaming export of a user's companies, contacts, projects and earnings.
+
+Rows are pulled with ``values_list().iterator(chunk_size=...)`` and encoded
+one at a time, so neither the queryset nor the response body is ever held in
+memory. Column names match the importer so an export can be imported again.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Company, Contact, Project, EarningsModel
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# entity: (model, [(column, model field), ...])
+EXPORTS = {
+    'companies': (Company, [
+        ('name', 'name'), ('email', 'email'), ('phone', 'phone'), ('address', 'address'),
+        ('website', 'website'), ('description', 'description'), ('created_at', 'created_at'),
+    ]),
+    'contacts': (Contact, [
+        ('name', 'name'), ('email', 'email'), ('phone', 'phone'),
+        ('description', 'description'), ('created_at', 'created_at'),
+    ]),
+    'projects': (Project, [
+        ('name', 'name'), ('company', 'company_id'), ('description', 'description'),
+        ('status', 'status'), ('priority', 'priority'), ('progress', 'progress'),
+        ('start_date', 'start_date'), ('due_date', 'due_date'), ('budget', 'budget'),
+        ('created_at', 'created_at'),
+    ]),
+    'earnings': (EarningsModel, [
+        ('month', 'month'), ('year', 'year'), ('amount', 'amount'),
+        ('source', 'source'), ('description', 'description'),
+    ]),
+}
+
+
+class Echo:
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(entity, owner, chunk_size=CHUNK_SIZE, using=None):
+    model, columns = EXPORTS[entity]
+    return (
+        model.objects.using(using).filter(owner=owner)
+        .order_by('pk')
+        .values_list(*[field for _, field in columns])
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def stream_csv(entity, owner, chunk_size=CHUNK_SIZE, using=None):
+    _, columns = EXPORTS[entity]
+    writer = csv.writer(Echo())
+    # The header goes out before the query has even started
+    yield writer.writerow([column for column, _ in columns])
+    for row in export_rows(entity, owner, chunk_size, using):
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def stream_jsonl(entity, owner, chunk_size=CHUNK_SIZE, using=None):
+    _, columns = EXPORTS[entity]
+    names = [column for column, _ in columns]
+    for row in export_rows(entity, owner, chunk_size, using):
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+}
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from apps.userprofile.images import build_image_variants
 from apps.userprofile.models import Profile
 from .models import Company, Project, EarningsModel, Contact
 
@@ -42,6 +43,13 @@ class ProfileForm(forms.ModelForm):
             'profile_image'
         ]
 
+    def save(self, commit=True):
+        profile = super().save(commit)
+        if commit and 'profile_image' in self.changed_data:
+            # Resizing runs in the background; pages use the original meanwhile
+            build_image_variants.enqueue(profile.pk, profile.profile_image.name or '', owner=profile.user)
+        return profile
+
 class CompanyForm(forms.ModelForm):
     class Meta:
         model = Company
@@ -85,13 +93,29 @@ class ProjectForm(forms.ModelForm):
             self.fields['company'].queryset = Company.objects.filter(owner=user)
 
 class EarningsForm(forms.ModelForm):
+    year = forms.IntegerField(
+        min_value=EarningsModel.MIN_YEAR, max_value=EarningsModel.MAX_YEAR,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
+
     class Meta:
         model = EarningsModel
         fields = ['month', 'year', 'amount', 'source', 'description']
         widgets = {
             'month': forms.Select(attrs={'class': 'form-control'}),
-            'year': forms.NumberInput(attrs={'class': 'form-control', 'min': 2020, 'max': 2030}),
             'amount': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
             'source': forms.Select(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'Optional description...'}),
-        }
\ No newline at end of file
+        }
+
+
+class ImportForm(forms.Form):
+    ENTITY_CHOICES = [
+        ('companies', 'Companies'),
+        ('contacts', 'Contacts'),
+        ('projects', 'Projects'),
+        ('earnings', 'Earnings'),
+    ]
+
+    entity = forms.ChoiceField(choices=ENTITY_CHOICES, widget=forms.Select(attrs={'class': 'form-control'}))
+    file = forms.FileField(help_text='CSV with a header row, or JSON Lines (.jsonl)')
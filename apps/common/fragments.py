@@ -0,0 +1,114 @@
+"""
+Cached HTML fragments of the list tables and dashboard cards.
+
+A fragment is cached per user under a version stamp of the entities it
+shows: the newest ``updated_at`` and the row count of each of the user's
+tables. Editing a row moves the newest ``updated_at`` and adding or
+deleting one changes the count, so the stamp also notices bulk writes that
+skip the signal handlers behind the per-user generation in cache.py. Keys
+also carry that generation, and the date for the parts that are relative
+to "today" (overdue badges).
+
+The stat cards render values from ``cached_context()``, which is keyed by
+the same stamps (shared through the request, see ``request_stamps``), so a
+fragment that misses after a bulk write is never filled from a stale
+context.
+
+Templates use the ``{% fragment %}`` tag, see templatetags/fragments.py.
+"""
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Count, Max, Value
+from django.utils import timezone
+
+from .cache import _missing, _record, get_generation
+from .models import Company, Contact, Project, EarningsModel
+
+ENTITIES = {
+    'companies': Company,
+    'contacts': Contact,
+    'projects': Project,
+    'earnings': EarningsModel,
+}
+# Memo key of the user's cache generation, next to the entity stamps
+GENERATION = '__generation__'
+
+
+def version_stamps(user_id, entities, memo=None):
+    """
+    ``{entity: '<newest updated_at>.<row count>'}`` of the user's rows, read
+    in one query (served from the owner/updated_at indexes). Stamps already
+    in ``memo`` are reused and new ones are added to it.
+    """
+    memo = {} if memo is None else memo
+    missing = [entity for entity in dict.fromkeys(entities) if entity not in memo]
+    unknown = set(missing) - set(ENTITIES)
+    if unknown:
+        raise ValueError('Unknown fragment entities: %s' % ', '.join(sorted(unknown)))
+    if missing:
+        queries = [
+            ENTITIES[entity].objects.filter(owner_id=user_id).order_by()
+            .values('owner_id').annotate(latest=Max('updated_at'), count=Count('pk'))
+            .values_list(Value(entity, output_field=CharField()), 'latest', 'count')
+            for entity in missing
+        ]
+        rows = queries[0].union(*queries[1:], all=True) if len(queries) > 1 else queries[0]
+        found = {entity: (latest, count) for entity, latest, count in rows}
+        for entity in missing:
+            latest, count = found.get(entity, (None, 0))
+            memo[entity] = '%s.%d' % (latest.timestamp() if latest else 0, count)
+    return [memo[entity] for entity in entities]
+
+
+def request_stamps(request, entities):
+    """``version_stamps()`` of the request's user, memoized on the request."""
+    memo = request.__dict__.setdefault('_fragment_stamps', {})
+    return version_stamps(request.user.pk, entities, memo)
+
+
+async def arequest_stamps(request, entities):
+    return await sync_to_async(request_stamps)(request, entities)
+
+
+def fragment_key(name, user_id, generation, stamps, vary_on=()):
+    vary = hashlib.md5(':'.join(str(value) for value in vary_on).encode(), usedforsecurity=False).hexdigest()
+    return 'crm:frag:%s:%s:%s:%s:%s:%s' % (
+        name, user_id, generation, '-'.join(stamps), vary, timezone.localdate().isoformat(),
+    )
+
+
+def cached_fragment(name, user_id, entities, render, vary_on=(), memo=None, timeout=None):
+    """
+    Return ``render()``, cached until one of the user's ``entities`` changes
+    or their cache generation is bumped, whichever invalidates the context
+    the fragment is rendered from.
+    """
+    memo = {} if memo is None else memo
+    if GENERATION not in memo:
+        memo[GENERATION] = get_generation(user_id)
+    key = fragment_key(name, user_id, memo[GENERATION], version_stamps(user_id, entities, memo), vary_on)
+    stat_name = 'fragment:%s' % name
+    html = cache.get(key, _missing)
+    if html is not _missing:
+        _record(stat_name, 'hits', fragment=True)
+        return html
+
+    _record(stat_name, 'misses', fragment=True)
+    html = render()
+    if timeout is None:
+        timeout = settings.CRM_FRAGMENT_CACHE_TIMEOUT
+    cache.set(key, html, timeout)
+    return html
+
+
+def fragment_hit_rate(stats):
+    """Share of fragment lookups in ``cache_stats()`` output that were hits."""
+    hits = misses = 0
+    for name, counts in stats.items():
+        if name.startswith('fragment:'):
+            hits += counts['hits']
+            misses += counts['misses']
+    return hits / (hits + misses) if hits + misses else None
@@ -0,0 +1,204 @@
+"""
+Streaming bulk import of companies, contacts, projects and earnings.
+
+Rows are read lazily from CSV or JSON Lines, validated with the field rules
+of the matching ModelForm (without instantiating a form per row) and written
+in batches with bulk_create, one transaction per batch. Only one batch is
+held in memory at a time, so memory use does not grow with the file size.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import bump_generation
+from .forms import CompanyForm, ContactForm, ProjectForm, EarningsForm
+from .models import DeadlineSummary, EarningsModel, EarningsRollup, Project
+from .search import index_objects
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            # Form messages may be lazy translations; the errors end up in
+            # the JSON result of the import task
+            self.errors.append((line, {name: [str(message) for message in messages] for name, messages in errors.items()}))
+
+    def __str__(self):
+        return '%d imported, %d failed' % (self.imported, self.failed)
+
+
+class Importer:
+    """
+    Bulk loader for the model of ``form_class``.
+
+    ``upsert_fields``, when given, is the unique key rows are matched on;
+    existing rows with the same key are updated instead of duplicated.
+    """
+
+    def __init__(self, form_class, upsert_fields=None):
+        self.form_class = form_class
+        self.model = form_class._meta.model
+        self.fields = form_class.base_fields
+        self.upsert_fields = upsert_fields
+
+    def clean_row(self, row, partial=False):
+        """``(cleaned, errors)`` of ``row``; with ``partial`` only the fields it has."""
+        cleaned, errors = {}, {}
+        for name, field in self.fields.items():
+            if partial and name not in row:
+                continue
+            value = row.get(name)
+            if value is None:
+                value = ''
+            try:
+                if isinstance(field, forms.ModelChoiceField):
+                    # Only the key is checked here; ownership is verified for
+                    # the whole batch at once in _resolve_related
+                    if value in field.empty_values:
+                        if field.required:
+                            raise ValidationError(field.error_messages['required'])
+                        cleaned[name] = None
+                    else:
+                        cleaned[name] = field.queryset.model._meta.pk.to_python(value)
+                else:
+                    cleaned[name] = field.clean(value)
+            except ValidationError as e:
+                errors[name] = e.messages
+        return cleaned, errors
+
+    def _resolve_related(self, batch, owner, result):
+        for name, field in self.fields.items():
+            if not isinstance(field, forms.ModelChoiceField):
+                continue
+            related = field.queryset.model
+            ids = {cleaned[name] for _, cleaned in batch if cleaned.get(name) is not None}
+            known = set(related.objects.filter(owner=owner, pk__in=ids).values_list('pk', flat=True))
+
+            resolved = []
+            for line, cleaned in batch:
+                if name not in cleaned:  # partial row
+                    resolved.append((line, cleaned))
+                    continue
+                pk = cleaned.pop(name)
+                if pk is not None and pk not in known:
+                    result.add_error(line, {name: [field.error_messages['invalid_choice']]})
+                    continue
+                cleaned[name + '_id'] = pk
+                resolved.append((line, cleaned))
+            batch = resolved
+        return batch
+
+    def _write(self, batch, owner):
+        objs = [self.model(owner=owner, **cleaned) for _, cleaned in batch]
+        if not self.upsert_fields:
+            self.model.objects.bulk_create(objs)
+            index_objects(objs)
+            return objs
+
+        # Keep the last row for each key; one statement cannot update a row twice
+        unique = {tuple(getattr(obj, name) for name in self.upsert_fields): obj for obj in objs}
+        objs = list(unique.values())
+        self.model.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=self.upsert_fields,
+            update_fields=[name for name in self.fields if name not in self.upsert_fields] + ['updated_at'],
+        )
+        return objs
+
+    def run(self, rows, owner, batch_size=DEFAULT_BATCH_SIZE):
+        """Import ``(line, row_dict)`` pairs for ``owner`` and return an ImportResult."""
+        result = ImportResult()
+        rollup_keys = set()
+        rows = iter(rows)
+
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+
+            batch = []
+            for line, row in chunk:
+                if not isinstance(row, dict):
+                    result.add_error(line, {'__all__': ['Not a valid record.']})
+                    continue
+                cleaned, errors = self.clean_row(row)
+                if errors:
+                    result.add_error(line, errors)
+                else:
+                    batch.append((line, cleaned))
+            batch = self._resolve_related(batch, owner, result)
+            if not batch:
+                continue
+
+            with transaction.atomic():
+                objs = self._write(batch, owner)
+            result.imported += len(batch)
+            if self.model is EarningsModel:
+                rollup_keys.update((owner.pk, obj.year, obj.source) for obj in objs)
+
+        # bulk_create bypasses the model signals, so refresh derived data here
+        for key in rollup_keys:
+            EarningsRollup.refresh(*key)
+        if result.imported:
+            bump_generation(owner.pk)
+            if self.model is Project:
+                DeadlineSummary.objects.filter(owner=owner).delete()
+        return result
+
+
+IMPORTERS = {
+    'companies': Importer(CompanyForm),
+    'contacts': Importer(ContactForm),
+    'projects': Importer(ProjectForm),
+    'earnings': Importer(EarningsForm, upsert_fields=['month', 'year', 'source', 'owner']),
+}
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(line_number, row_dict)`` from a text stream of CSV or JSON
+    Lines. Blank JSONL lines are skipped.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+    else:
+        raise ValueError('Unsupported import format: %s' % file_format)
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def import_file(entity, binary_file, owner, file_format=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Import an open binary file (e.g. an upload) of ``entity`` rows for ``owner``."""
+    file_format = file_format or guess_format(getattr(binary_file, 'name', '') or '')
+    stream = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        return IMPORTERS[entity].run(read_rows(stream, file_format), owner, batch_size)
+    finally:
+        stream.detach()
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.importers import IMPORTERS, DEFAULT_BATCH_SIZE, import_file
+
+
+class Command(BaseCommand):
+    help = 'Bulk import companies, contacts, projects or earnings from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help='CSV file with a header row, or a .jsonl file')
+        parser.add_argument('--user', required=True, help='Username that will own the records')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('Unknown user: %s' % options['user'])
+
+        try:
+            with open(options['path'], 'rb') as binary_file:
+                result = import_file(
+                    options['entity'], binary_file, owner,
+                    file_format=options['format'], batch_size=options['batch_size'],
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, errors in result.errors:
+            self.stderr.write('Line %s: %s' % (line, '; '.join(
+                '%s: %s' % (field, ' '.join(messages)) for field, messages in errors.items()
+            )))
+        style = self.style.SUCCESS if not result.failed else self.style.WARNING
+        self.stdout.write(style('Import finished: %s.' % result))
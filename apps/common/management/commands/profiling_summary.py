@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.profiling import read_log, summarize
+
+
+class Command(BaseCommand):
+    help = 'Summarize the request profiling log into latency percentiles per URL name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help='Log file (defaults to CRM_PROFILING_LOG); rotated backups are included')
+        parser.add_argument('--sort', choices=['p50', 'p95', 'p99', 'requests', 'sql_count'], default='p95')
+
+    def handle(self, *args, **options):
+        summary = summarize(read_log(options['log'] or settings.CRM_PROFILING_LOG))
+        if not summary:
+            raise CommandError('The profiling log is empty or missing.')
+
+        self.stdout.write('%-22s %8s %9s %9s %9s %8s %6s %8s %7s' % (
+            'url name', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'dups', 'tpl ms', 'frag %',
+        ))
+        rows = sorted(summary.items(), key=lambda item: item[1][options['sort']], reverse=True)
+        for name, row in rows:
+            hit_rate = row['fragment_hit_rate']
+            self.stdout.write('%-22s %8d %9.1f %9.1f %9.1f %8.1f %6.1f %8.1f %7s' % (
+                name, row['requests'], row['p50'], row['p95'], row['p99'],
+                row['sql_count'], row['sql_duplicates'], row['template_ms'],
+                '-' if hit_rate is None else '%.0f' % (hit_rate * 100),
+            ))
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.models import EarningsRollup
+from apps.common.tasks import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the EarningsRollup table from the raw earnings rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', metavar='USERNAME',
+            help='Only rebuild the rollups of this user (can be repeated).',
+        )
+        parser.add_argument(
+            '--queue', action='store_true',
+            help='Queue the rebuild for the background worker instead of running it now.',
+        )
+
+    def handle(self, *args, **options):
+        owners = None
+        if options['usernames']:
+            owners = list(User.objects.filter(username__in=options['usernames']))
+            missing = set(options['usernames']) - {user.username for user in owners}
+            if missing:
+                raise CommandError('Unknown user(s): %s' % ', '.join(sorted(missing)))
+
+        if options['queue']:
+            task = rebuild_rollups.enqueue(None if owners is None else [user.pk for user in owners])
+            self.stdout.write(self.style.SUCCESS('Queued the rebuild as task %d.' % task.pk))
+            return
+
+        count = EarningsRollup.rebuild(owners)
+        self.stdout.write(self.style.SUCCESS('Rebuilt %d earnings rollup row(s).' % count))
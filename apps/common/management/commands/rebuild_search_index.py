@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.search import rebuild_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the full-text search table from the companies, contacts and projects.'
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            raise CommandError('The search table is only used on SQLite; other backends search the tables directly.')
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.common.deadlines import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the deadline buckets and due-soon feed of every user. '
+        'Run nightly, just after midnight, so that the first page view of the day finds them fresh.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', metavar='USERNAME',
+            help='Only refresh the deadlines of this user (can be repeated).',
+        )
+
+    def handle(self, *args, **options):
+        owner_ids = None
+        if options['usernames']:
+            users = dict(User.objects.filter(username__in=options['usernames']).values_list('username', 'pk'))
+            missing = set(options['usernames']) - set(users)
+            if missing:
+                raise CommandError('Unknown user(s): %s' % ', '.join(sorted(missing)))
+            owner_ids = list(users.values())
+
+        count = rebuild(owner_ids)
+        self.stdout.write(self.style.SUCCESS('Refreshed the deadlines of %d user(s).' % count))
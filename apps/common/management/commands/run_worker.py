@@ -0,0 +1,125 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.common.tasks import claim, requeue_stale, run_task, worker_name
+
+logger = logging.getLogger('crm.tasks')
+
+
+def _init_process():
+    # Pool processes are spawned, so each one sets Django up and opens its
+    # own database connection.
+    django.setup()
+
+
+def _run(task_id):
+    try:
+        return run_task(task_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks in a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (0 runs tasks in this process)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue polls when idle')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue running tasks whose lock has not been refreshed for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        processes = options['processes']
+        self.stdout.write('Worker %s started with %s.' % (
+            worker, '%d process(es)' % processes if processes else 'no pool',
+        ))
+
+        if processes == 0:
+            done = self.run_inline(worker, options)
+        else:
+            done = 0
+            while True:
+                with ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process,
+                ) as pool:
+                    finished, broken = self.run_pool(pool, worker, processes, options)
+                done += finished
+                if not broken:
+                    break
+                # A pool process died; its tasks are requeued once stale
+                self.stderr.write('Worker pool broke, starting a new one.')
+        self.stdout.write(self.style.SUCCESS('Worker %s finished %d task(s).' % (worker, done)))
+
+    def run_inline(self, worker, options):
+        done = 0
+        while True:
+            requeue_stale(options['stale_after'])
+            ids = claim(worker, 1)
+            if not ids:
+                if options['once']:
+                    return done
+                time.sleep(options['poll_interval'])
+                continue
+            try:
+                status = run_task(ids[0])
+            except Exception as e:
+                logger.exception('Task %d could not be run', ids[0])
+                status = 'error (%s)' % e
+            self.report(ids[0], status)
+            done += 1
+
+    def run_pool(self, pool, worker, processes, options):
+        """Run tasks until the queue is empty (with --once) or the pool breaks; returns (done, broken)."""
+        done = 0
+        running = {}
+        broken = False
+        try:
+            while True:
+                requeue_stale(options['stale_after'])
+                free = processes - len(running)
+                if free and not broken:
+                    for task_id in claim(worker, free):
+                        try:
+                            running[pool.submit(_run, task_id)] = task_id
+                        except BrokenProcessPool:
+                            logger.exception('Task %d could not be submitted', task_id)
+                            broken = True
+                            break
+                if not running:
+                    if options['once'] or broken:
+                        return done, broken
+                    time.sleep(options['poll_interval'])
+                    continue
+                finished, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        # run_task records errors of the task itself, so this
+                        # is the pool or the database failing. The task stays
+                        # running until requeue_stale releases it.
+                        logger.exception('Task %d could not be run', task_id)
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        status = 'error (%s)' % e
+                    self.report(task_id, status)
+                    done += 1
+        except KeyboardInterrupt:
+            # Tasks still running in the pool finish before the pool exits
+            return done, False
+
+    def report(self, task_id, status):
+        self.stdout.write('Task %d: %s' % (task_id, status))
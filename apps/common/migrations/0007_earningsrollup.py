@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    EarningsModel = apps.get_model('common', 'EarningsModel')
+    EarningsRollup = apps.get_model('common', 'EarningsRollup')
+
+    monthly_sums = {
+        'month_%d' % month: models.Sum('amount', filter=models.Q(month=month))
+        for month in range(1, 13)
+    }
+    rows = EarningsModel.objects.order_by().values('owner_id', 'year', 'source').annotate(
+        total=models.Sum('amount'), **monthly_sums
+    )
+    EarningsRollup.objects.bulk_create(
+        [EarningsRollup(**{key: value or 0 for key, value in row.items()}) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_contact'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EarningsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('source', models.CharField(choices=[('web_development', 'Web Development'), ('consulting', 'Consulting'), ('design', 'Design'), ('other', 'Other')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('month_1', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_2', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_3', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_4', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_5', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_6', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_7', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_8', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_9', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_10', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_11', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('month_12', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-year', 'source'],
+                'unique_together': {('owner', 'year', 'source')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_earningsrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='company_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='contact_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='earningsmodel',
+            index=models.Index(fields=['owner', 'year', 'month', 'source'], name='earnings_owner_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='project_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['owner', 'status'], name='project_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('status', 'completed'), _negated=True), fields=['owner', 'due_date'], name='project_owner_due_open_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'common_search'
+COLUMNS = ['name', 'email', 'phone', 'description', 'address']
+# entity: (rowid tag, table, searchable columns)
+ENTITIES = {
+    'company': (1, 'common_company', ['name', 'email', 'phone', 'description', 'address']),
+    'contact': (2, 'common_contact', ['name', 'email', 'phone', 'description']),
+    'project': (3, 'common_project', ['name', 'description']),
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5("
+            "name, email, phone, description, address, "
+            "entity UNINDEXED, object_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')" % SEARCH_TABLE
+        )
+        for entity, (tag, table, fields) in ENTITIES.items():
+            values = ["COALESCE(%s, '')" % column if column in fields else "''" for column in COLUMNS]
+            schema_editor.execute(
+                # rowid = owner << 40 | pk * 4 + tag, see apps/common/search.py
+                "INSERT INTO %s (rowid, %s, entity, object_id) "
+                "SELECT (owner_id << 40) + id * 4 + %d, %s, '%s', id FROM %s" % (
+                    SEARCH_TABLE, ', '.join(COLUMNS), tag, ', '.join(values), entity, table,
+                )
+            )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for entity, (_, table, fields) in ENTITIES.items():
+            for column in fields:
+                schema_editor.execute(
+                    'CREATE INDEX IF NOT EXISTS %s_%s_trgm_idx ON %s USING gin (%s gin_trgm_ops)'
+                    % (table, column, table, column)
+                )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % SEARCH_TABLE)
+    elif vendor == 'postgresql':
+        for entity, (_, table, fields) in ENTITIES.items():
+            for column in fields:
+                schema_editor.execute('DROP INDEX IF EXISTS %s_%s_trgm_idx' % (table, column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_owner_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
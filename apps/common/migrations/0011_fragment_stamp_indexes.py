@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['owner', 'updated_at'], name='company_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner', 'updated_at'], name='contact_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='earningsmodel',
+            index=models.Index(fields=['owner', 'updated_at'], name='earnings_owner_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['owner', 'updated_at'], name='project_owner_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('common', '0011_fragment_stamp_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadlineSummary',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('computed_on', models.DateField()),
+                ('overdue_count', models.PositiveIntegerField(default=0)),
+                ('due_today_count', models.PositiveIntegerField(default=0)),
+                ('due_week_count', models.PositiveIntegerField(default=0)),
+                ('due_month_count', models.PositiveIntegerField(default=0)),
+                ('due_soon', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
 
+from .cache import bump_generation
+
 class Company(models.Model):
     name = models.CharField(max_length=200)
     email = models.EmailField()
@@ -20,6 +24,11 @@ class Company(models.Model):
     class Meta:
         verbose_name_plural = "Companies"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='company_owner_created_idx'),
+            # Version stamps of the cached template fragments (fragments.py)
+            models.Index(fields=['owner', 'updated_at'], name='company_owner_updated_idx'),
+        ]
 
 class Contact(models.Model):
     name = models.CharField(max_length=200)
@@ -36,6 +45,10 @@ class Contact(models.Model):
     class Meta:
         verbose_name_plural = "Contacts"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='contact_owner_created_idx'),
+            models.Index(fields=['owner', 'updated_at'], name='contact_owner_updated_idx'),
+        ]
 
 class Project(models.Model):
     STATUS_CHOICES = [
@@ -73,23 +86,34 @@ class Project(models.Model):
     def get_absolute_url(self):
         return reverse('project_detail', kwargs={'pk': self.pk})
 
+    # For a single project. Lists should use apps.common.deadlines, which
+    # filters and flags overdue projects in SQL.
     @property
     def is_overdue(self):
         if self.due_date and self.status != 'completed':
-            return timezone.now().date() > self.due_date
+            return timezone.localdate() > self.due_date
         return False
 
     @property
     def days_remaining(self):
         if self.due_date:
-            delta = self.due_date - timezone.now().date()
-            return delta.days
+            return (self.due_date - timezone.localdate()).days
         return None
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Project"
         verbose_name_plural = "Projects"
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-id'], name='project_owner_created_idx'),
+            models.Index(fields=['owner', 'updated_at'], name='project_owner_updated_idx'),
+            models.Index(fields=['owner', 'status'], name='project_owner_status_idx'),
+            models.Index(
+                fields=['owner', 'due_date'],
+                name='project_owner_due_open_idx',
+                condition=~models.Q(status='completed'),
+            ),
+        ]
 
 class EarningsModel(models.Model):
     MONTH_CHOICES = [
@@ -113,6 +137,11 @@ class EarningsModel(models.Model):
         ('design', 'Design'),
         ('other', 'Other'),
     ]
+
+    # Years accepted from users (EarningsForm); the analytics lay every year
+    # in between out densely, so the range must stay bounded
+    MIN_YEAR = 1900
+    MAX_YEAR = 2100
     
     month = models.IntegerField(choices=MONTH_CHOICES)
     year = models.IntegerField()
@@ -125,7 +154,222 @@ class EarningsModel(models.Model):
     
     def __str__(self):
         return f"{self.get_month_display()} {self.year} - ${self.amount}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the rollup bucket the row was loaded from, so moving an
+        # earning to another year or source also refreshes the one it left.
+        instance._rollup_key = tuple(
+            instance.__dict__.get(name) for name in ('owner_id', 'year', 'source')
+        )
+        return instance
     
     class Meta:
         ordering = ['-year', '-month']
-        unique_together = ['month', 'year', 'source', 'owner']
\ No newline at end of file
+        unique_together = ['month', 'year', 'source', 'owner']
+        indexes = [
+            models.Index(fields=['owner', 'year', 'month', 'source'], name='earnings_owner_period_idx'),
+            models.Index(fields=['owner', 'updated_at'], name='earnings_owner_updated_idx'),
+        ]
+
+class EarningsRollup(models.Model):
+    """
+    Per-user earnings totals for one (year, source), one column per month.
+
+    Rows are derived from ``EarningsModel`` and kept current by the signal
+    handlers below; use ``manage.py rebuild_earnings_rollups`` to backfill.
+    """
+    MONTH_FIELDS = ['month_%d' % month for month in range(1, 13)]
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    year = models.IntegerField()
+    source = models.CharField(max_length=20, choices=EarningsModel.SOURCE_CHOICES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    month_1 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_2 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_3 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_4 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_5 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_6 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_7 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_8 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_9 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_10 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_11 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    month_12 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.year} {self.get_source_display()} - ${self.total}"
+
+    @classmethod
+    def refresh(cls, owner_id, year, source):
+        """Recompute one rollup row from the earnings it summarises."""
+        rows = EarningsModel.objects.filter(
+            owner_id=owner_id, year=year, source=source
+        ).order_by().values('month').annotate(amount=models.Sum('amount'))
+        values = {field: 0 for field in cls.MONTH_FIELDS}
+        for row in rows:
+            values['month_%d' % row['month']] = row['amount']
+
+        if not rows:
+            cls.objects.filter(owner_id=owner_id, year=year, source=source).delete()
+            return None
+
+        values['total'] = sum(values.values())
+        rollup, _ = cls.objects.update_or_create(
+            owner_id=owner_id, year=year, source=source, defaults=values
+        )
+        return rollup
+
+    @classmethod
+    def refresh_for(cls, earnings):
+        """Refresh every rollup touched by ``earnings`` (e.g. after a bulk write)."""
+        keys = {(earning.owner_id, earning.year, earning.source) for earning in earnings}
+        for key in keys:
+            cls.refresh(*key)
+
+    @classmethod
+    def rebuild(cls, owners=None):
+        """Drop and regenerate the rollups of ``owners`` (all users by default)."""
+        earnings = EarningsModel.objects.order_by()
+        rollups = cls.objects.all()
+        if owners is not None:
+            earnings = earnings.filter(owner__in=owners)
+            rollups = rollups.filter(owner__in=owners)
+
+        monthly_sums = {
+            field: models.Sum('amount', filter=models.Q(month=month))
+            for month, field in enumerate(cls.MONTH_FIELDS, start=1)
+        }
+        rows = earnings.values('owner_id', 'year', 'source').annotate(
+            total=models.Sum('amount'), **monthly_sums
+        )
+        objs = [
+            cls(**{key: value or 0 for key, value in row.items()})
+            for row in rows.iterator()
+        ]
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create(objs, batch_size=500)
+        return len(objs)
+
+    class Meta:
+        ordering = ['-year', 'source']
+        unique_together = ['owner', 'year', 'source']
+
+
+class DeadlineSummary(models.Model):
+    """
+    Precomputed deadline buckets and due-soon feed of one user, valid for
+    ``computed_on``. Maintained by apps.common.deadlines: dropped when one of
+    the user's projects changes, recomputed on the next read, and rebuilt
+    nightly by ``manage.py refresh_deadlines``.
+    """
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    computed_on = models.DateField()
+    overdue_count = models.PositiveIntegerField(default=0)
+    due_today_count = models.PositiveIntegerField(default=0)
+    due_week_count = models.PositiveIntegerField(default=0)
+    due_month_count = models.PositiveIntegerField(default=0)
+    # [{'id', 'name', 'due_date', 'days_left', 'priority', 'status'}], soonest first
+    due_soon = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.owner} deadlines on {self.computed_on}"
+
+
+class Task(models.Model):
+    """
+    A unit of background work queued by apps.common.tasks and run by
+    ``manage.py run_worker``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+            models.Index(fields=['owner', 'name', '-created_at'], name='task_owner_name_idx'),
+        ]
+
+
+@receiver(post_save, sender=EarningsModel)
+def update_earnings_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    key = (instance.owner_id, instance.year, instance.source)
+    previous = getattr(instance, '_rollup_key', None)
+    EarningsRollup.refresh(*key)
+    if previous and previous != key and None not in previous:
+        EarningsRollup.refresh(*previous)
+    instance._rollup_key = key
+
+
+@receiver(post_delete, sender=EarningsModel)
+def remove_earnings_rollup(sender, instance, **kwargs):
+    EarningsRollup.refresh(instance.owner_id, instance.year, instance.source)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=EarningsModel)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=EarningsModel)
+def invalidate_owner_cache(sender, instance, **kwargs):
+    bump_generation(instance.owner_id)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_deadlines(sender, instance, **kwargs):
+    DeadlineSummary.objects.filter(owner_id=instance.owner_id).delete()
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Project)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    from .search import index_objects
+    index_objects([instance])
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Project)
+def remove_from_search_index(sender, instance, **kwargs):
+    from .search import unindex_object
+    unindex_object(instance)
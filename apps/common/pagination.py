@@ -0,0 +1,192 @@
+"""
+Keyset (cursor) pagination for the owner-scoped list pages.
+
+Instead of OFFSET, each page is fetched with a WHERE clause that continues
+after the last row of the previous page, so page 1000 costs the same as
+page 1 as long as the ordering is backed by an index. Cursors are opaque
+base64 strings holding the ordering values of a boundary row.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.http import urlencode
+
+# Orderings used by the list pages; the last field must be unique
+COMPANY_ORDERING = ('-created_at', '-pk')
+CONTACT_ORDERING = ('-created_at', '-pk')
+PROJECT_ORDERING = ('-created_at', '-pk')
+EARNINGS_ORDERING = ('-year', '-month', '-pk')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would make
+    # the seek condition skip or repeat rows that share a millisecond.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor, previous_cursor, params):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _url(self, **cursor):
+        params = {key: value for key, value in self._params.items() if key not in ('after', 'before')}
+        params.update(cursor)
+        return '?' + urlencode(params)
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor) if self.has_next() else None
+
+    @property
+    def previous_url(self):
+        return self._url(before=self.previous_cursor) if self.has_previous() else None
+
+
+class KeysetPaginator:
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        self.page_size = page_size
+
+    def _field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name) for name, _ in self.ordering]
+        raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(raw)
+        except (binascii.Error, ValueError) as e:
+            raise InvalidCursor(str(e))
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('Cursor does not match the ordering')
+        try:
+            return [
+                self._field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except ValidationError as e:
+            raise InvalidCursor(str(e))
+
+    def _seek(self, values, forward):
+        # (a, b, c) after (x, y, z) == a > x OR (a = x AND b > y) OR ...
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{'%s__%s' % (name, lookup): values[i]})
+            for (prev_name, _), prev_value in zip(self.ordering[:i], values[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _order_by(self, forward):
+        return [
+            ('-' if descending == forward else '') + name
+            for name, descending in self.ordering
+        ]
+
+    def _slice(self, after, before):
+        forward = not before
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        cursor = after if forward else before
+        if cursor:
+            queryset = queryset.filter(self._seek(self.decode_cursor(cursor), forward))
+        return queryset[:self.page_size + 1], forward
+
+    def _build_page(self, rows, forward, after, params):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+
+        has_next = has_more if forward else True
+        has_previous = bool(after) if forward else has_more
+        return KeysetPage(
+            rows,
+            self.encode_cursor(rows[-1]) if rows and has_next else None,
+            self.encode_cursor(rows[0]) if rows and has_previous else None,
+            params or {},
+        )
+
+    def page(self, after=None, before=None, params=None):
+        queryset, forward = self._slice(after, before)
+        return self._build_page(list(queryset), forward, after, params)
+
+    async def apage(self, after=None, before=None, params=None):
+        queryset, forward = self._slice(after, before)
+        return self._build_page([obj async for obj in queryset], forward, after, params)
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.GET.get('page_size', settings.CRM_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.CRM_PAGE_SIZE
+    return max(1, min(page_size, settings.CRM_MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, ordering):
+    """Return the page of ``queryset`` selected by ``?after=``/``?before=``."""
+    paginator = KeysetPaginator(queryset, ordering, get_page_size(request))
+    try:
+        return paginator.page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            params=request.GET.dict(),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+
+
+async def apaginate(request, queryset, ordering):
+    """Async version of paginate()."""
+    paginator = KeysetPaginator(queryset, ordering, get_page_size(request))
+    try:
+        return await paginator.apage(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            params=request.GET.dict(),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
@@ -0,0 +1,257 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware records, per request, the wall time, the number and
+total duration of SQL queries (flagging queries repeated with the same
+parameters), the template render time and the context and fragment cache
+outcomes. The numbers are sent back in a ``Server-Timing`` header, which
+browser dev tools display next to the request, and appended as one JSON
+object per line to ``CRM_PROFILING_LOG`` (rotated by size).
+``manage.py profiling_summary`` turns that log into per-URL percentiles.
+
+Profiling is on for every request when ``CRM_PROFILING`` is true, and for a
+single request when ``CRM_PROFILING_HEADER`` is true and the request carries
+an ``X-Profile: 1`` header.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+logger = logging.getLogger('crm.profiling')
+_current = ContextVar('crm_profile', default=None)
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_ms = 0.0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_started = None
+        self.queries = Counter()
+        self.cache = Counter()
+        self.fragments = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.queries.values())
+
+    def duplicates(self, limit=5):
+        return [
+            {'sql': sql, 'count': count}
+            for (sql, _), count in self.queries.most_common(limit) if count > 1
+        ]
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - started) * 1000
+            self.queries[(sql, repr(params))] += 1
+
+    def start_rendering(self, response):
+        self.template_started = time.perf_counter()
+        response.add_post_render_callback(self.finish_rendering)
+
+    def finish_rendering(self, response):
+        self.template_ms += (time.perf_counter() - self.template_started) * 1000
+
+    def server_timing(self):
+        hits, misses = self.cache['hits'], self.cache['misses']
+        return ', '.join([
+            'total;dur=%.1f' % self.total_ms,
+            'sql;dur=%.1f;desc="%d queries, %d duplicate"' % (
+                self.sql_ms, self.query_count, self.duplicate_count,
+            ),
+            'tpl;dur=%.1f;desc="templates"' % self.template_ms,
+            'cache;desc="%d hits, %d misses"' % (hits, misses),
+            'frag;desc="%d hits, %d misses"' % (self.fragments['hits'], self.fragments['misses']),
+        ])
+
+    def as_record(self, request, response):
+        match = request.resolver_match
+        return {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(self.total_ms, 3),
+            'sql_ms': round(self.sql_ms, 3),
+            'sql_count': self.query_count,
+            'sql_duplicates': self.duplicate_count,
+            'duplicate_queries': self.duplicates(),
+            'template_ms': round(self.template_ms, 3),
+            'cache_hits': self.cache['hits'],
+            'cache_misses': self.cache['misses'],
+            'fragment_hits': self.fragments['hits'],
+            'fragment_misses': self.fragments['misses'],
+        }
+
+
+def record_cache(outcome, fragment=False):
+    """Count a context (or fragment) cache outcome against the request being profiled, if any."""
+    profile = _current.get()
+    if profile is not None:
+        (profile.fragments if fragment else profile.cache)[outcome] += 1
+
+
+def _configure_logger():
+    path = Path(settings.CRM_PROFILING_LOG).resolve()
+    if any(getattr(h, 'baseFilename', None) == str(path) for h in logger.handlers):
+        return
+    for old in logger.handlers[:]:
+        logger.removeHandler(old)
+        old.close()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=settings.CRM_PROFILING_LOG_MAX_BYTES,
+        backupCount=settings.CRM_PROFILING_LOG_BACKUPS,
+        encoding='utf-8',
+        delay=True,
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def is_enabled(self, request):
+        if settings.CRM_PROFILING:
+            return True
+        return settings.CRM_PROFILING_HEADER and request.META.get(PROFILE_HEADER) == '1'
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_enabled(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with self.wrap_connections(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, request, response)
+
+    async def __acall__(self, request):
+        if not self.is_enabled(request):
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with self.wrap_connections(profile):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(profile, request, response)
+
+    def wrap_connections(self, profile):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        return stack
+
+    def finish(self, profile, request, response):
+        profile.total_ms = (time.perf_counter() - profile.started) * 1000
+        response['Server-Timing'] = profile.server_timing()
+        _configure_logger()
+        logger.info(json.dumps(profile.as_record(request, response)))
+        return response
+
+    def process_template_response(self, request, response):
+        profile = _current.get()
+        if profile is not None:
+            profile.start_rendering(response)
+        return response
+
+
+def read_log(path):
+    """Yield the records of ``path`` and its rotated backups, oldest first."""
+    path = Path(path)
+    files = sorted(
+        path.parent.glob(path.name + '.*'),
+        key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0,
+        reverse=True,
+    ) + [path]
+    for file in files:
+        if not file.exists():
+            continue
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples`` (0.0 when empty); the benchmarks use it too."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _hit_rate(hits, misses):
+    return hits / (hits + misses) if hits + misses else None
+
+
+def summarize(records):
+    """Group log records by URL name into request counts and percentiles."""
+    groups = {}
+    for record in records:
+        groups.setdefault(record.get('url_name') or record.get('path'), []).append(record)
+
+    summary = {}
+    for name, rows in groups.items():
+        totals = [row['total_ms'] for row in rows]
+        summary[name] = {
+            'requests': len(rows),
+            'p50': percentile(totals, 50),
+            'p95': percentile(totals, 95),
+            'p99': percentile(totals, 99),
+            'sql_ms': sum(row['sql_ms'] for row in rows) / len(rows),
+            'sql_count': sum(row['sql_count'] for row in rows) / len(rows),
+            'sql_duplicates': sum(row['sql_duplicates'] for row in rows) / len(rows),
+            'template_ms': sum(row['template_ms'] for row in rows) / len(rows),
+            'fragment_hit_rate': _hit_rate(
+                sum(row.get('fragment_hits', 0) for row in rows),
+                sum(row.get('fragment_misses', 0) for row in rows),
+            ),
+        }
+    return summary
@@ -0,0 +1,107 @@
+"""
+Primary/replica database routing.
+
+Reads go to the ``CRM_READ_REPLICA`` alias only while serving a GET/HEAD
+request for one of the read-heavy views in ``CRM_REPLICA_VIEWS``; everything
+else, including management commands and reads inside a transaction, uses
+the primary. ReplicaRoutingMiddleware decides per request. After a request
+that may have written (a POST, or any write routed during the request) the
+client gets a short-lived cookie that keeps its reads on the primary until
+the replica has had time to catch up, so users always see their own writes.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'crm_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('crm_db_routing', default=None)
+
+
+class RoutingState:
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+def replica_alias():
+    alias = getattr(settings, 'CRM_READ_REPLICA', None)
+    return alias if alias and alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        alias = replica_alias()
+        if state is None or alias is None or not state.use_replica or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != replica_alias()
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is None or replica_alias() is None:
+            return None
+        state.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and request.resolver_match.url_name in settings.CRM_REPLICA_VIEWS
+            and STICKY_COOKIE not in request.COOKIES
+        )
+        return None
+
+    def finish(self, request, response, state):
+        if replica_alias() is not None and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.CRM_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
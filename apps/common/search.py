@@ -0,0 +1,189 @@
+"""
+Global search over companies, contacts and projects.
+
+On SQLite the searchable text lives in the ``common_search`` FTS5 table
+(created by migration 0009), one row per record, kept in sync by the signal
+handlers in models.py. The owner id is encoded in the high bits of the rowid,
+so owner scoping is a rowid range that FTS5 seeks to inside each doclist
+instead of a post-filter over every user's matches. Results are ranked with
+bm25.
+
+Other backends fall back to ``icontains`` lookups, which on PostgreSQL are
+served by the pg_trgm GIN indexes the same migration creates.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.urls import reverse
+
+SEARCH_TABLE = 'common_search'
+COLUMNS = ['name', 'email', 'phone', 'description', 'address']
+# bm25 weights for (name, email, phone, description, address)
+WEIGHTS = (10.0, 5.0, 5.0, 1.0, 1.0)
+OWNER_SHIFT = 40
+DEFAULT_LIMIT = 50
+
+# entity: (rowid tag, model name, searchable fields, list page)
+ENTITIES = {
+    'company': (1, 'Company', ['name', 'email', 'phone', 'description', 'address'], 'companies'),
+    'contact': (2, 'Contact', ['name', 'email', 'phone', 'description'], 'contacts'),
+    'project': (3, 'Project', ['name', 'description'], 'projects'),
+}
+
+
+def uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def _model(entity):
+    from django.apps import apps
+    return apps.get_model('common', ENTITIES[entity][1])
+
+
+def _entity_for(model):
+    for entity, (_, name, _, _) in ENTITIES.items():
+        if model._meta.model_name == name.lower():
+            return entity
+    return None
+
+
+def _rowid(entity, pk, owner_id):
+    # Unique per (entity, pk), grouped by owner: owner << 40 | pk * 4 + tag
+    return (owner_id << OWNER_SHIFT) + pk * 4 + ENTITIES[entity][0]
+
+
+def _owner_range(owner_id):
+    return owner_id << OWNER_SHIFT, ((owner_id + 1) << OWNER_SHIFT) - 1
+
+
+def _document(entity, obj):
+    fields = ENTITIES[entity][2]
+    return [_rowid(entity, obj.pk, obj.owner_id)] + [
+        (getattr(obj, column) or '') if column in fields else '' for column in COLUMNS
+    ] + [entity, obj.pk]
+
+
+def index_objects(objs):
+    """Add or replace the search rows of ``objs`` (all of one model)."""
+    objs = list(objs)
+    if not objs or not uses_fts():
+        return
+    entity = _entity_for(type(objs[0]))
+    if entity is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            'DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE,
+            [(_rowid(entity, obj.pk, obj.owner_id),) for obj in objs],
+        )
+        cursor.executemany(
+            'INSERT INTO %s (rowid, %s, entity, object_id) VALUES (%s)' % (
+                SEARCH_TABLE, ', '.join(COLUMNS), ', '.join(['%s'] * (len(COLUMNS) + 3)),
+            ),
+            [_document(entity, obj) for obj in objs],
+        )
+
+
+def unindex_object(obj):
+    entity = _entity_for(type(obj))
+    if entity is None or not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM %s WHERE rowid = %%s' % SEARCH_TABLE, [_rowid(entity, obj.pk, obj.owner_id)]
+        )
+
+
+def populate_sql():
+    """INSERT ... SELECT statements that fill the FTS table from scratch."""
+    statements = []
+    for entity, (tag, name, fields, _) in ENTITIES.items():
+        table = 'common_%s' % name.lower()
+        values = ["COALESCE(%s, '')" % column if column in fields else "''" for column in COLUMNS]
+        statements.append(
+            "INSERT INTO %s (rowid, %s, entity, object_id) "
+            "SELECT (owner_id << %d) + id * 4 + %d, %s, '%s', id FROM %s" % (
+                SEARCH_TABLE, ', '.join(COLUMNS), OWNER_SHIFT, tag, ', '.join(values), entity, table,
+            )
+        )
+    return statements
+
+
+def rebuild_index():
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+        for statement in populate_sql():
+            cursor.execute(statement)
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _result(entity, pk, name, detail, rank):
+    return {
+        'entity': entity,
+        'id': pk,
+        'name': name,
+        'detail': detail,
+        'url': reverse(ENTITIES[entity][3]),
+        'rank': rank,
+    }
+
+
+def _search_fts(user, terms, limit):
+    # Terms are quoted so user input cannot inject FTS syntax. Only the last
+    # one is prefix-matched (it may still be being typed): a prefix query has
+    # to merge the doclists of every matching token before it can seek into
+    # the user's rowid range.
+    match = ' AND '.join(['"%s"' % term for term in terms[:-1]] + ['"%s"*' % terms[-1]])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT entity, object_id, name, email, description, bm25(%s, %s) AS rank '
+            'FROM %s WHERE %s MATCH %%s AND rowid BETWEEN %%s AND %%s '
+            'ORDER BY rank LIMIT %%s' % (
+                SEARCH_TABLE, ', '.join(map(str, WEIGHTS)), SEARCH_TABLE, SEARCH_TABLE,
+            ),
+            [match, *_owner_range(user.pk), limit],
+        )
+        return [
+            _result(entity, pk, name, email or description, rank)
+            for entity, pk, name, email, description, rank in cursor.fetchall()
+        ]
+
+
+def _search_fallback(user, query, terms, limit):
+    results = []
+    for entity, (_, _, fields, _) in ENTITIES.items():
+        condition = Q()
+        for term in terms:
+            condition &= reduce(or_, (Q(**{'%s__icontains' % field: term}) for field in fields))
+        rows = (
+            _model(entity).objects.filter(owner=user).filter(condition)
+            .annotate(rank=Case(
+                When(name__iexact=query, then=Value(0)),
+                When(name__istartswith=terms[0], then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            ))
+            .order_by('rank', '-created_at')
+            .values_list('pk', 'name', 'email' if 'email' in fields else 'description', 'rank')[:limit]
+        )
+        results.extend(_result(entity, pk, name, detail, rank) for pk, name, detail, rank in rows)
+    results.sort(key=lambda result: result['rank'])
+    return results[:limit]
+
+
+def search(user, query, limit=DEFAULT_LIMIT):
+    """Best matches for ``query`` among ``user``'s companies, contacts and projects."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    if uses_fts():
+        return _search_fts(user, terms, limit)
+    return _search_fallback(user, query.strip(), terms, limit)
@@ -0,0 +1,184 @@
+"""
+Production static files.
+
+CompressedManifestStaticFilesStorage is the STATICFILES storage when DEBUG
+is off. On top of Django's manifest storage, which gives every collected
+file a content-hashed copy (css/sb-admin-2.min.css ->
+css/sb-admin-2.min.1d2c4e5f6a7b.css) and rewrites the references between
+them, it writes pre-compressed ``.gz`` copies of text assets at
+collectstatic time, plus ``.br`` copies when the ``brotli`` package is
+installed.
+
+StaticFilesApp wraps the WSGI application (see CRM/wsgi.py) and answers
+requests under STATIC_URL straight from STATIC_ROOT, before Django's
+request handling. Hashed files are sent with a one-year immutable
+Cache-Control, so browsers never revalidate them; the smallest encoding the
+client accepts is chosen. The file index is built once at startup, so
+restart the server after running collectstatic.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico', '.ttf', '.otf', '.eot')
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]  # in order of preference
+
+
+def compress(content):
+    """``{extension: bytes}`` for each encoding that makes ``content`` smaller."""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    # Not worth a second request path unless it saves a few percent
+    return {ext: data for ext, data in variants.items() if len(data) < len(content) * 0.95}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # The templates reference SB Admin vendor assets that are not shipped in
+    # static/; their URLs keep the plain name instead of failing the page.
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE) and self.size(name) >= MIN_COMPRESS_SIZE:
+                with self.open(name) as source:
+                    variants = compress(source.read())
+                for ext, data in variants.items():
+                    if self.exists(name + ext):
+                        self.delete(name + ext)
+                    self._save(name + ext, ContentFile(data))
+
+
+def accepted_encodings(header):
+    """Content codings accepted by an Accept-Encoding header (ignoring q=0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if coding and not (match and float(match.group(1) or 0) == 0):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        # A strong ETag names exact bytes, so each encoding has its own
+        etag = '%x-%x' % (int(stat.st_mtime), stat.st_size)
+        self.identity = (path, '"%s"' % etag, [('Content-Length', str(stat.st_size))])
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        self.encodings = [
+            (coding, path + ext, '"%s-%s"' % (etag, ext[1:]), [
+                ('Content-Encoding', coding), ('Content-Length', str(os.path.getsize(path + ext))),
+            ])
+            for coding, ext in ENCODINGS if os.path.isfile(path + ext)
+        ]
+        self.headers = [
+            ('Content-Type', content_type),
+            ('Cache-Control', IMMUTABLE if immutable else REVALIDATE),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+        ]
+        if self.encodings:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+    def select(self, accept_encoding):
+        """``(path, etag, extra headers)`` of the variant to send."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding, path, etag, headers in self.encodings:
+            if coding in accepted:
+                return path, etag, headers
+        return self.identity
+
+
+class StaticFilesApp:
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = str(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+        if not self.prefix.startswith('/'):
+            self.prefix = '/' + self.prefix
+        self.files = self.scan()
+
+    def scan(self):
+        hashed = set()
+        manifest = os.path.join(self.root, ManifestStaticFilesStorage.manifest_name)
+        if os.path.isfile(manifest):
+            with open(manifest) as manifest_file:
+                hashed = set(json.load(manifest_file).get('paths', {}).values())
+
+        files = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(('.gz', '.br')) and os.path.isfile(os.path.join(directory, filename[:-3])):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[self.prefix + name] = StaticFile(path, name in hashed)
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+
+        static_file = self.files.get(path)
+        if static_file is None:
+            return self.respond(start_response, '404 Not Found', [], b'Not Found')
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.respond(start_response, '405 Method Not Allowed', [('Allow', 'GET, HEAD')], b'')
+
+        file_path, etag, extra = static_file.select(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if etag in [tag.strip() for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            # Vary included, so shared caches keep the encodings apart
+            headers = [header for header in static_file.headers if header[0] != 'Content-Type']
+            start_response('304 Not Modified', headers + [('ETag', etag)])
+            return []
+
+        start_response('200 OK', static_file.headers + [('ETag', etag)] + extra)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(open(file_path, 'rb'), 8192)
+        return self.read(file_path)
+
+    def read(self, file_path):
+        with open(file_path, 'rb') as file_like:
+            yield from iter(lambda: file_like.read(8192), b'')
+
+    def respond(self, start_response, status, headers, body):
+        start_response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))] + headers)
+        return [body]
@@ -0,0 +1,158 @@
+import asyncio
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Count, OuterRef, Q, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .charts import get_chart_data
+from .deadlines import aget_deadlines, get_deadlines
+from .models import Company, Contact, Project, EarningsRollup
+
+
+def _owner_count(model):
+    # Correlated COUNT(*) for one owner, usable as an annotation on User
+    counts = (
+        model.objects.filter(owner=OuterRef('pk'))
+        .order_by()
+        .values('owner')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _entity_counts(user):
+    return User.objects.filter(pk=user.pk).annotate(
+        companies_count=_owner_count(Company),
+        contacts_count=_owner_count(Contact),
+        projects_count=_owner_count(Project),
+    ).values('companies_count', 'contacts_count', 'projects_count')
+
+
+def get_entity_counts(user):
+    """Company, contact and project counts for ``user`` in a single query."""
+    return _entity_counts(user).get()
+
+
+def _project_aggregates(today):
+    return {
+        'active_projects_count': Count('pk', filter=Q(status='active')),
+        'completed_projects_count': Count('pk', filter=Q(status='completed')),
+        'on_hold_projects_count': Count('pk', filter=Q(status='on_hold')),
+        'overdue_projects_count': Count('pk', filter=Q(due_date__lt=today) & ~Q(status='completed')),
+    }
+
+
+def get_project_stats(user, today=None):
+    """Project status breakdown and overdue count for ``user`` in one query."""
+    today = today or timezone.localdate()
+    return Project.objects.filter(owner=user).aggregate(**_project_aggregates(today))
+
+
+async def aget_project_stats(user, today=None):
+    today = today or timezone.localdate()
+    return await Project.objects.filter(owner=user).aaggregate(**_project_aggregates(today))
+
+
+def _rollup_rows(user):
+    return EarningsRollup.objects.filter(owner=user).order_by().values(
+        'year', 'source', 'total', *EarningsRollup.MONTH_FIELDS
+    )
+
+
+def _summarize_earnings(rows, today):
+    last_year, last_month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    monthly = [Decimal(0)] * 12
+    sources = {}
+    total_year = last_month_total = Decimal(0)
+    for row in rows:
+        sources[row['source']] = sources.get(row['source'], 0) + row['total']
+        if row['year'] == today.year:
+            total_year += row['total']
+            monthly = [a + row[field] for a, field in zip(monthly, EarningsRollup.MONTH_FIELDS)]
+        if row['year'] == last_year:
+            last_month_total += row['month_%d' % last_month]
+
+    return {
+        'monthly': [float(amount) for amount in monthly],
+        'sources': sorted(
+            ((source, float(total)) for source, total in sources.items()),
+            key=lambda item: item[1], reverse=True,
+        ),
+        'total_year': total_year,
+        'current_month': monthly[today.month - 1],
+        'last_month': last_month_total,
+        'active_sources_count': len(sources),
+    }
+
+
+def get_earnings_stats(user, today=None):
+    """
+    Earnings figures for ``user`` read from the rollup table in one query.
+
+    The rollup holds one row per (year, source), so the work here depends on
+    how many years of history the user has, not on how many earnings rows.
+    """
+    today = today or timezone.localdate()
+    return _summarize_earnings(_rollup_rows(user), today)
+
+
+async def aget_earnings_stats(user, today=None):
+    today = today or timezone.localdate()
+    return _summarize_earnings([row async for row in _rollup_rows(user)], today)
+
+
+def _recent(model, user):
+    return model.objects.filter(owner=user)[:5]
+
+
+def _dashboard_stats(counts, earnings, recent_companies, recent_projects, recent_contacts, deadlines):
+    earnings_chart, sources_chart = get_chart_data(earnings)
+    return {
+        'deadlines': deadlines,
+        'companies_count': counts['companies_count'] or 0,
+        'contacts_count': counts['contacts_count'] or 0,
+        'active_projects_count': counts['projects_count'] or 0,
+        'recent_companies': recent_companies,
+        'recent_projects': recent_projects,
+        'recent_contacts': recent_contacts,
+        'current_monthly_earnings': earnings['current_month'],
+        'earnings_chart': earnings_chart,
+        'sources_chart': sources_chart,
+    }
+
+
+def get_dashboard_stats(user, today=None):
+    """
+    Everything the dashboard renders, computed in a fixed number of queries:
+    one for the entity counts, one per "recent" list, one for the earnings
+    rollups and one for the deadline summary.
+    """
+    today = today or timezone.localdate()
+    return _dashboard_stats(
+        get_entity_counts(user),
+        get_earnings_stats(user, today),
+        list(_recent(Company, user)),
+        list(_recent(Project, user)),
+        list(_recent(Contact, user)),
+        get_deadlines(user.pk, today),
+    )
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def aget_dashboard_stats(user, today=None):
+    """Async version of get_dashboard_stats(); the six queries are issued together."""
+    today = today or timezone.localdate()
+    return _dashboard_stats(*await asyncio.gather(
+        _entity_counts(user).aget(),
+        aget_earnings_stats(user, today),
+        _alist(_recent(Company, user)),
+        _alist(_recent(Project, user)),
+        _alist(_recent(Contact, user)),
+        aget_deadlines(user.pk, today),
+    ))
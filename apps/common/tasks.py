@@ -0,0 +1,242 @@
+"""
+Background tasks.
+
+Functions decorated with ``@task`` gain an ``enqueue()`` method that records
+a Task row and hands it to the backend named by ``CRM_TASK_BACKEND``:
+
+    DatabaseBackend   the row waits in the queue until ``manage.py run_worker``
+                      claims it and runs it in a worker process (the default)
+    ImmediateBackend  the task runs right away in the calling process
+
+Arguments must be JSON serializable. A task that raises is retried with
+exponential backoff until it has been attempted ``max_attempts`` times.
+Enqueueing with an ``idempotency_key`` that is already used returns the
+existing task instead of queueing the same work twice, unless that task
+failed: its key is then released and the work is queued again.
+
+A running task keeps refreshing its lock; once the lock goes stale the
+worker is taken for dead and the task is requeued (or failed when it has no
+attempts left) by the next worker to poll.
+"""
+import functools
+import logging
+import os
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30
+# Seconds between lock refreshes of a running task; well below the
+# --stale-after of run_worker
+HEARTBEAT_INTERVAL = 60
+
+logger = logging.getLogger('crm.tasks')
+
+
+def task(func=None, *, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+    """Mark ``func`` as runnable by the worker and give it ``enqueue()``."""
+    def decorate(func):
+        func.task_name = '%s.%s' % (func.__module__, func.__qualname__)
+        func.max_attempts = max_attempts
+        func.retry_delay = retry_delay
+        func.enqueue = functools.partial(enqueue, func)
+        return func
+    return decorate(func) if func is not None else decorate
+
+
+def get_backend():
+    return import_string(settings.CRM_TASK_BACKEND)()
+
+
+def enqueue(func, *args, idempotency_key=None, owner=None, **kwargs):
+    """Queue ``func(*args, **kwargs)`` and return its Task."""
+    return get_backend().enqueue(func, args, kwargs, idempotency_key=idempotency_key, owner=owner)
+
+
+class DatabaseBackend:
+
+    def create(self, func, args, kwargs, idempotency_key=None, owner=None):
+        fields = {
+            'name': func.task_name,
+            'args': list(args),
+            'kwargs': kwargs,
+            'owner': owner,
+            'max_attempts': func.max_attempts,
+        }
+        if idempotency_key is None:
+            return Task.objects.create(**fields), True
+        # A failed task must not block retrying the same work for good
+        Task.objects.filter(idempotency_key=idempotency_key, status=Task.FAILED).update(idempotency_key=None)
+        try:
+            with transaction.atomic():
+                return Task.objects.create(idempotency_key=idempotency_key, **fields), True
+        except IntegrityError:
+            return Task.objects.get(idempotency_key=idempotency_key), False
+
+    def enqueue(self, func, args, kwargs, idempotency_key=None, owner=None):
+        task, _ = self.create(func, args, kwargs, idempotency_key, owner)
+        return task
+
+
+class ImmediateBackend(DatabaseBackend):
+
+    def enqueue(self, func, args, kwargs, idempotency_key=None, owner=None):
+        task, created = self.create(func, args, kwargs, idempotency_key, owner)
+        if created:
+            Task.objects.filter(pk=task.pk).update(
+                status=Task.RUNNING, attempts=1, locked_by=worker_name(), locked_at=timezone.now(),
+            )
+            run_task(task.pk)
+            task.refresh_from_db()
+        return task
+
+
+def worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def claim(worker, limit):
+    """Mark up to ``limit`` due tasks as running by ``worker`` and return their ids."""
+    now = timezone.now()
+    with transaction.atomic():
+        # SKIP LOCKED lets several workers claim from the same queue on
+        # PostgreSQL; SQLite serializes the whole transaction instead.
+        ids = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_after__lte=now)
+            .order_by('run_after', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if ids:
+            Task.objects.filter(pk__in=ids).update(
+                status=Task.RUNNING, locked_by=worker, locked_at=now,
+                attempts=F('attempts') + 1,
+            )
+    return ids
+
+
+def run_task(task_id):
+    """Run a claimed task and record its result, or schedule a retry."""
+    task = Task.objects.get(pk=task_id)
+    retry_delay = DEFAULT_RETRY_DELAY
+    try:
+        func = import_string(task.name)
+        if not hasattr(func, 'task_name'):
+            raise ImportError('%s is not a task' % task.name)
+        retry_delay = func.retry_delay
+        with heartbeat(task):
+            result = func(*task.args, **task.kwargs)
+    except Exception:
+        task.last_error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            task.status = Task.QUEUED
+            task.run_after = timezone.now() + timedelta(seconds=retry_delay * 2 ** (task.attempts - 1))
+        else:
+            task.status = Task.FAILED
+    else:
+        task.status = Task.DONE
+        task.result = result
+
+    # Only while the claim holds: if the lock went stale, another worker
+    # has failed or requeued the task meanwhile and its outcome stands
+    claimed = Task.objects.filter(pk=task.pk, status=Task.RUNNING, locked_by=task.locked_by)
+    values = {
+        'status': task.status, 'result': task.result, 'last_error': task.last_error,
+        'run_after': task.run_after, 'locked_by': '', 'locked_at': None, 'updated_at': timezone.now(),
+    }
+    try:
+        with transaction.atomic():
+            updated = claimed.update(**values)
+    except Exception:
+        # e.g. a result that is not JSON serializable. The work itself has
+        # run, so it is failed rather than retried.
+        values.update(status=Task.FAILED, result=None, last_error=traceback.format_exc())
+        updated = claimed.update(**values)
+    if not updated:
+        return Task.objects.values_list('status', flat=True).get(pk=task.pk)
+    return values['status']
+
+
+@contextmanager
+def heartbeat(task):
+    """
+    Refresh the lock of the running ``task`` every HEARTBEAT_INTERVAL seconds
+    while the block runs, so requeue_stale only releases tasks whose worker
+    is gone, however long they take.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                try:
+                    Task.objects.filter(pk=task.pk, status=Task.RUNNING, locked_by=task.locked_by).update(
+                        locked_at=timezone.now(),
+                    )
+                except Exception:
+                    logger.exception('Could not refresh the lock of task %d', task.pk)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name='task-%d-heartbeat' % task.pk, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(timeout):
+    """
+    Release running tasks whose lock has not been refreshed (see heartbeat())
+    for ``timeout`` seconds: their worker is gone.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, locked_by='', locked_at=None, last_error='Worker did not finish the task.',
+    )
+    requeued = stale.update(status=Task.QUEUED, locked_by='', locked_at=None)
+    return requeued + failed
+
+
+@task(max_attempts=1)
+def import_upload(entity, name, owner_id, file_format=None):
+    """
+    Import a file saved to the "imports" storage by ImportView, then delete
+    it. Not retried: batches that were already committed would be imported
+    twice.
+    """
+    from django.contrib.auth.models import User
+    from django.core.files.storage import storages
+    from .importers import import_file
+
+    storage = storages['imports']
+    try:
+        owner = User.objects.get(pk=owner_id)
+        with storage.open(name, 'rb') as binary_file:
+            result = import_file(entity, binary_file, owner, file_format=file_format)
+    finally:
+        storage.delete(name)
+    return {'imported': result.imported, 'failed': result.failed, 'errors': result.errors}
+
+
+@task
+def rebuild_rollups(owner_ids=None):
+    from django.contrib.auth.models import User
+    from .models import EarningsRollup
+
+    owners = None if owner_ids is None else list(User.objects.filter(pk__in=owner_ids))
+    return EarningsRollup.rebuild(owners)
@@ -0,0 +1,64 @@
+from django import template
+
+from ..fragments import cached_fragment, request_stamps
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, entities, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.entities = entities
+        self.vary_on = vary_on
+
+    def get_entities(self, context):
+        return [entity.strip() for entity in self.entities.resolve(context).split(',')]
+
+    def render(self, context):
+        request = context.get('request')
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return self.nodelist.render(context)
+
+        if not getattr(request, '_fragments_prefetched', False):
+            # Read the stamps of every fragment on the page in one query, on
+            # top of those the view already read for its cached context
+            request._fragments_prefetched = True
+            nodes = context.template.nodelist.get_nodes_by_type(FragmentNode) if context.template else [self]
+            request_stamps(request, [entity for node in nodes for entity in node.get_entities(context)])
+        return cached_fragment(
+            self.name.resolve(context),
+            user.pk,
+            self.get_entities(context),
+            lambda: self.nodelist.render(context),
+            vary_on=[value.resolve(context) for value in self.vary_on],
+            memo=request._fragment_stamps,
+        )
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Cache the enclosed block per user until one of the listed entities
+    changes (see apps.common.fragments); further arguments are extra values
+    the block varies on::
+
+        {% fragment 'projects-table' 'projects,companies' request.GET.urlencode %}
+            ...
+        {% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            "'%s' takes a name and a comma-separated list of entities" % bits[0]
+        )
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
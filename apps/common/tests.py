@@ -1,3 +1,1557 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, skipUnless
+from io import BytesIO, StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection, connections, router
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .models import Company, Contact, DeadlineSummary, Project, EarningsModel, EarningsRollup, Task
+from .analytics import analyze, forecast, get_earnings_analytics, rolling_average
+from .cache import bump_generation, cache_stats, reset_cache_stats
+from .charts import earnings_chart, earnings_chart_json
+from .db import configure_sqlite
+from .deadlines import get_deadlines, overdue
+from .exporters import stream_csv
+from .fragments import fragment_hit_rate, version_stamps
+from .importers import import_file
+from .profiling import RequestProfile, read_log, summarize
+from .routers import ReplicaRoutingMiddleware, STICKY_COOKIE
+from .search import search
+from .staticfiles import StaticFilesApp, accepted_encodings
+from .tasks import claim, requeue_stale, run_task, task
+from .stats import get_dashboard_stats
+
+
+def seed_user(user, companies=0, contacts=0, projects=0, earning_years=()):
+    Company.objects.bulk_create(
+        Company(name='Company %d' % i, email='c%d@example.com' % i, owner=user)
+        for i in range(companies)
+    )
+    Contact.objects.bulk_create(
+        Contact(name='Contact %d' % i, email='p%d@example.com' % i, owner=user)
+        for i in range(contacts)
+    )
+    Project.objects.bulk_create(
+        Project(name='Project %d' % i, owner=user, status='active')
+        for i in range(projects)
+    )
+    earnings = EarningsModel.objects.bulk_create(
+        EarningsModel(month=month, year=year, source=source, amount=Decimal('100.50'), owner=user)
+        for year in earning_years
+        for month in range(1, 13)
+        for source, _ in EarningsModel.SOURCE_CHOICES
+    )
+    EarningsRollup.refresh_for(earnings)
+    bump_generation(user.pk)
+
+
+class CRMTestCase(TestCase):
+
+    def setUp(self):
+        # Primary keys are reused between tests, so start each one with an empty cache
+        cache.clear()
+        reset_cache_stats()
+
+
+class DashboardStatsTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.today = datetime.date(2025, 3, 15)
+
+    def test_stats_values(self):
+        seed_user(self.user, companies=7, contacts=3, projects=2, earning_years=[2024, 2025])
+        other = User.objects.create_user('other', password='pass')
+        seed_user(other, companies=4, earning_years=[2025])
+
+        stats = get_dashboard_stats(self.user, today=self.today)
+
+        self.assertEqual(stats['companies_count'], 7)
+        self.assertEqual(stats['contacts_count'], 3)
+        self.assertEqual(stats['active_projects_count'], 2)
+        self.assertEqual(len(stats['recent_companies']), 5)
+        self.assertEqual(stats['current_monthly_earnings'], 402.0)
+        self.assertEqual(stats['earnings_chart']['data'], [402.0] * 12)
+        self.assertEqual(stats['sources_chart']['data'], [2412.0] * 4)
+
+    def test_query_count_is_constant(self):
+        # The deadline summary is computed once per day; measure the reads
+        get_deadlines(self.user.pk, self.today)
+        with CaptureQueriesContext(connection) as small:
+            get_dashboard_stats(self.user, today=self.today)
+
+        seed_user(self.user, companies=50, contacts=50, projects=50, earning_years=range(2015, 2026))
+        with CaptureQueriesContext(connection) as large:
+            get_dashboard_stats(self.user, today=self.today)
+
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 6)
+
+    def test_dashboard_view(self):
+        seed_user(self.user, companies=2, earning_years=[datetime.date.today().year])
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['companies_count'], 2)
+        chart = json.loads(response.context['earnings_chart_data'])
+        self.assertEqual(len(chart['labels']), 12)
+
+
+class EarningsRollupTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+
+    def rollup(self, year, source):
+        return EarningsRollup.objects.get(owner=self.user, year=year, source=source)
+
+    def test_save_and_delete_maintain_rollup(self):
+        january = EarningsModel.objects.create(month=1, year=2025, source='design', amount=Decimal('10.00'), owner=self.user)
+        EarningsModel.objects.create(month=2, year=2025, source='design', amount=Decimal('5.25'), owner=self.user)
+
+        rollup = self.rollup(2025, 'design')
+        self.assertEqual(rollup.total, Decimal('15.25'))
+        self.assertEqual(rollup.month_1, Decimal('10.00'))
+        self.assertEqual(rollup.month_2, Decimal('5.25'))
+
+        january.delete()
+        self.assertEqual(self.rollup(2025, 'design').total, Decimal('5.25'))
+
+    def test_moving_an_earning_refreshes_both_buckets(self):
+        EarningsModel.objects.create(month=1, year=2025, source='design', amount=Decimal('10.00'), owner=self.user)
+
+        earning = EarningsModel.objects.get()
+        earning.source = 'consulting'
+        earning.save()
+
+        self.assertFalse(EarningsRollup.objects.filter(source='design').exists())
+        self.assertEqual(self.rollup(2025, 'consulting').total, Decimal('10.00'))
+
+    def test_rebuild_command(self):
+        seed_user(self.user, earning_years=[2024, 2025])
+        expected = list(EarningsRollup.objects.values_list('year', 'source', 'total'))
+        EarningsRollup.objects.all().delete()
+
+        call_command('rebuild_earnings_rollups', stdout=StringIO())
+
+        self.assertCountEqual(EarningsRollup.objects.values_list('year', 'source', 'total'), expected)
+        self.assertEqual(EarningsRollup.objects.count(), 8)
+
+    def test_earnings_view_stats(self):
+        year = datetime.date.today().year
+        seed_user(self.user, earning_years=[year - 1, year])
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('earnings'))
+
+        self.assertEqual(response.context['total_year_earnings'], Decimal('4824.00'))
+        self.assertEqual(response.context['current_month_earnings'], Decimal('402.00'))
+        self.assertEqual(response.context['last_month_earnings'], Decimal('402.00'))
+        self.assertEqual(response.context['active_sources_count'], 4)
+
+
+class ContextCacheTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        seed_user(self.user, companies=3, projects=3, earning_years=[datetime.date.today().year])
+        self.client.force_login(self.user)
+
+    def test_repeat_dashboard_view_only_queries_auth(self):
+        self.client.get(reverse('dashboard'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+
+        # Session and user lookups done by the auth middleware, and the
+        # version stamps of the cached fragments
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(response.context['companies_count'], 3)
+        self.assertEqual(cache_stats()['dashboard'], {'hits': 1, 'misses': 1, 'bypass': 0})
+
+    def test_writes_invalidate_the_owner_only(self):
+        other = User.objects.create_user('other', password='pass')
+        self.client.get(reverse('dashboard'))
+
+        Company.objects.create(name='Other', email='o@example.com', owner=other)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['companies_count'], 3)
+
+        Company.objects.create(name='New', email='n@example.com', owner=self.user)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['companies_count'], 4)
+        self.assertEqual(cache_stats()['dashboard']['misses'], 2)
+
+    def test_post_bypasses_cache(self):
+        self.client.post(reverse('projects'), {'name': ''})
+
+        self.assertEqual(cache_stats()['projects'], {'hits': 0, 'misses': 0, 'bypass': 1})
+
+
+class KeysetPaginationTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        seed_user(self.user, companies=23)
+        # Force ties on created_at so the pk tie-breaker is exercised
+        Company.objects.filter(pk__in=Company.objects.order_by('pk')[:10].values('pk')).update(
+            created_at=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        self.client.force_login(self.user)
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            names.extend(company.name for company in response.context['companies'])
+            page = response.context['page']
+            url = reverse('companies') + page.next_url if page.has_next() else None
+        return names, page
+
+    def test_pages_cover_every_row_once_in_order(self):
+        names, last_page = self.walk(reverse('companies') + '?page_size=5')
+
+        expected = list(Company.objects.order_by('-created_at', '-pk').values_list('name', flat=True))
+        self.assertEqual(names, expected)
+        self.assertTrue(last_page.has_previous())
+
+    def test_previous_cursor_returns_the_preceding_page(self):
+        first = self.client.get(reverse('companies') + '?page_size=5').context['page']
+        second = self.client.get(reverse('companies') + first.next_url).context['page']
+        back = self.client.get(reverse('companies') + second.previous_url).context['page']
+
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertFalse(back.has_previous())
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.client.get(reverse('companies') + '?page_size=5').context['page']
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(reverse('companies') + '?page_size=5')
+        with CaptureQueriesContext(connection) as deep_queries:
+            self.client.get(reverse('companies') + first.next_url)
+
+        self.assertEqual(len(first_queries), len(deep_queries))
+        self.assertNotIn('OFFSET', deep_queries[-1]['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('companies') + '?after=not-a-cursor')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_earnings_are_paginated_by_period(self):
+        seed_user(self.user, earning_years=[2024, 2025])
+
+        response = self.client.get(reverse('earnings') + '?page_size=4')
+        earnings = response.context['earnings']
+
+        self.assertEqual([(e.year, e.month) for e in earnings], [(2025, 12)] * 4)
+        self.assertTrue(response.context['page'].has_next())
+
+
+class ProjectsViewTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.force_login(self.user)
+
+    def add_projects(self, count):
+        company = Company.objects.create(name='Acme', email='acme@example.com', owner=self.user)
+        today = datetime.date.today()
+        Project.objects.bulk_create(
+            Project(
+                name='Project %d' % i, owner=self.user, company=company,
+                status=['active', 'completed', 'on_hold', 'planning'][i % 4],
+                due_date=today - datetime.timedelta(days=1),
+            )
+            for i in range(count)
+        )
+
+    def test_statistics(self):
+        self.add_projects(8)
+
+        context = self.client.get(reverse('projects')).context
+
+        self.assertEqual(context['active_projects_count'], 2)
+        self.assertEqual(context['completed_projects_count'], 2)
+        self.assertEqual(context['on_hold_projects_count'], 2)
+        self.assertEqual(context['overdue_projects_count'], 6)
+
+    def test_query_count_does_not_grow_with_projects(self):
+        self.add_projects(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('projects'))
+
+        cache.clear()
+        self.add_projects(40)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('projects'))
+
+        self.assertContains(response, 'Acme')
+        self.assertEqual(len(few), len(many))
+        # session, user, one page of projects, the statistics, the company
+        # choices of the create form, the projects stamp the statistics are
+        # cached under and the companies stamp of the table fragment
+        self.assertEqual(len(many), 7)
+
+
+class ImportTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+
+    def import_storage(self, location):
+        return override_settings(STORAGES={
+            **settings.STORAGES,
+            'imports': {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': location}},
+        })
+
+    def import_text(self, entity, text, file_format='csv', **kwargs):
+        return import_file(entity, BytesIO(text.encode()), self.user, file_format=file_format, **kwargs)
+
+    def test_csv_rows_are_validated_with_form_rules(self):
+        result = self.import_text('companies', (
+            'name,email,phone,website\n'
+            'Acme,acme@example.com,555-0100,https://acme.test\n'
+            ',missing-name@example.com,,\n'
+            'Globex,not-an-email,,\n'
+            'Initech,info@initech.test,,\n'
+        ), batch_size=2)
+
+        self.assertEqual((result.imported, result.failed), (2, 2))
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertIn('name', result.errors[0][1])
+        self.assertIn('email', result.errors[1][1])
+        self.assertCountEqual(Company.objects.values_list('name', flat=True), ['Acme', 'Initech'])
+
+    def test_projects_may_only_reference_own_companies(self):
+        own = Company.objects.create(name='Own', email='own@example.com', owner=self.user)
+        other = User.objects.create_user('other', password='pass')
+        foreign = Company.objects.create(name='Foreign', email='f@example.com', owner=other)
+
+        result = self.import_text('projects', '\n'.join([
+            json.dumps({'name': 'Ok', 'company': own.pk, 'status': 'active', 'priority': 3}),
+            json.dumps({'name': 'Bad', 'company': foreign.pk, 'status': 'active', 'priority': 3}),
+            'not json',
+        ]), file_format='jsonl')
+
+        self.assertEqual((result.imported, result.failed), (1, 2))
+        self.assertEqual(Project.objects.get().company, own)
+
+    def test_earnings_are_upserted_and_rollups_refreshed(self):
+        EarningsModel.objects.create(month=1, year=2025, source='design', amount=Decimal('10.00'), owner=self.user)
+
+        result = self.import_text('earnings', (
+            'month,year,amount,source\n'
+            '1,2025,25.00,design\n'
+            '2,2025,5.00,design\n'
+        ))
+
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(EarningsModel.objects.get(month=1).amount, Decimal('25.00'))
+        self.assertEqual(EarningsRollup.objects.get(year=2025, source='design').total, Decimal('30.00'))
+
+    def test_queries_per_batch_are_constant(self):
+        rows = ''.join('Company %d,c%d@example.com\n' % (i, i) for i in range(100))
+        with CaptureQueriesContext(connection) as queries:
+            self.import_text('companies', 'name,email\n' + rows, batch_size=50)
+
+        # one INSERT per batch, each inside its own transaction
+        inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(Company.objects.count(), 100)
+
+    def test_command_and_upload_view(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'contacts.csv')
+            with open(path, 'w') as f:
+                f.write('name,email\nJane,jane@example.com\n')
+            call_command('import_records', 'contacts', path, user='owner', stdout=out)
+        self.assertIn('1 imported, 0 failed', out.getvalue())
+
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('contacts.jsonl', b'{"name": "John", "email": "john@example.com"}\n')
+        with tempfile.TemporaryDirectory() as imports, self.import_storage(imports):
+            response = self.client.post(reverse('import'), {'entity': 'contacts', 'file': upload})
+            self.assertRedirects(response, reverse('import'))
+            self.assertEqual(Contact.objects.count(), 1)
+            # Kept out of the served media, under a name that cannot be guessed
+            [queued] = os.listdir(os.path.join(imports, str(self.user.pk)))
+            self.assertRegex(queued, r'^[0-9a-f]{32}$')
+
+            call_command('run_worker', processes=0, once=True, stdout=StringIO())
+            self.assertEqual(os.listdir(os.path.join(imports, str(self.user.pk))), [])
+
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['contacts_count'], 2)
+        self.assertEqual(self.client.get(reverse('import')).context['import_tasks'][0].result['imported'], 1)
+
+    def test_failed_uploads_are_cleaned_up_and_can_be_retried(self):
+        self.client.force_login(self.user)
+        content = b'{"name": "John", "email": "john@example.com"}\n'
+        with tempfile.TemporaryDirectory() as imports, self.import_storage(imports):
+            self.client.post(reverse('import'), {'entity': 'contacts', 'file': SimpleUploadedFile('c.jsonl', content)})
+            with mock.patch('apps.common.importers.import_file', side_effect=RuntimeError('database is locked')):
+                call_command('run_worker', processes=0, once=True, stdout=StringIO())
+            self.assertEqual(os.listdir(os.path.join(imports, str(self.user.pk))), [])
+            self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+            response = self.client.post(
+                reverse('import'), {'entity': 'contacts', 'file': SimpleUploadedFile('c.jsonl', content)}, follow=True,
+            )
+            self.assertContains(response, 'queued for import')
+            call_command('run_worker', processes=0, once=True, stdout=StringIO())
+
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(sorted(Task.objects.values_list('status', flat=True)), [Task.DONE, Task.FAILED])
+
+    def test_queued_import_reports_foreign_companies(self):
+        other = User.objects.create_user('other', password='pass')
+        foreign = Company.objects.create(name='Foreign', email='f@example.com', owner=other)
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('projects.csv', (
+            'name,company,status,priority\n'
+            'Ok,,active,3\n'
+            'Bad,%d,active,3\n' % foreign.pk
+        ).encode())
+        with tempfile.TemporaryDirectory() as imports, self.import_storage(imports):
+            self.client.post(reverse('import'), {'entity': 'projects', 'file': upload})
+            call_command('run_worker', processes=0, once=True, stdout=StringIO())
+
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.DONE)
+        self.assertEqual((task.result['imported'], task.result['failed']), (1, 1))
+        self.assertEqual(task.result['errors'][0][0], 3)
+        self.assertIn('company', task.result['errors'][0][1])
+
+
+class ExportTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        other = User.objects.create_user('other', password='pass')
+        seed_user(self.user, companies=3, earning_years=[2025])
+        seed_user(other, companies=2)
+        self.client.force_login(self.user)
+
+    def test_csv_export_streams_owner_rows(self):
+        response = self.client.get(reverse('export', args=['companies', 'csv']))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['name', 'email'])
+        self.assertEqual(len(rows), 4)
+
+    def test_header_is_sent_before_the_query_runs(self):
+        stream = stream_csv('companies', self.user)
+        with CaptureQueriesContext(connection) as queries:
+            header = next(stream)
+
+        self.assertTrue(header.startswith('name,email'))
+        self.assertEqual(len(queries), 0)
+
+    def test_jsonl_export_round_trips_through_the_importer(self):
+        response = self.client.get(reverse('export', args=['earnings', 'jsonl']))
+        body = b''.join(response.streaming_content)
+        EarningsModel.objects.update(amount=0)
+
+        result = import_file('earnings', BytesIO(body), self.user, file_format='jsonl')
+
+        self.assertEqual(result.imported, 48)
+        self.assertEqual(EarningsModel.objects.filter(owner=self.user, amount=Decimal('100.50')).count(), 48)
+
+    def test_unknown_export(self):
+        response = self.client.get(reverse('export', args=['users', 'csv']))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ApiTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        other = User.objects.create_user('other', password='pass')
+        seed_user(self.user, companies=5)
+        seed_user(other, companies=3)
+        self.client.force_login(self.user)
+
+    def test_list_is_owner_scoped_paginated_and_field_selected(self):
+        url = reverse('api-list', args=['companies']) + '?page_size=3&fields=id,name'
+        first = self.client.get(url).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertEqual(list(first['results'][0]), ['id', 'name'])
+        names = [row['name'] for row in first['results'] + second['results']]
+        self.assertCountEqual(names, Company.objects.filter(owner=self.user).values_list('name', flat=True))
+        self.assertIsNone(second['next'])
+
+    def test_list_conditional_get(self):
+        url = reverse('api-list', args=['companies'])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        # session, user and the validator aggregate only
+        self.assertEqual(len(queries), 3)
+
+        company = Company.objects.filter(owner=self.user).first()
+        company.name = 'Renamed'
+        company.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_notices_deletions(self):
+        url = reverse('api-list', args=['companies'])
+        etag = self.client.get(url)['ETag']
+
+        Company.objects.filter(owner=self.user).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_if_modified_since_without_etag(self):
+        company = Company.objects.filter(owner=self.user).first()
+        detail = reverse('api-detail', args=['companies', company.pk])
+        last_modified = self.client.get(detail)['Last-Modified']
+
+        self.assertEqual(self.client.get(detail, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(
+            self.client.get(detail, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT').status_code, 200,
+        )
+        list_response = self.client.get(reverse('api-list', args=['companies']), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(list_response.status_code, 200)
+
+    def test_detail(self):
+        company = Company.objects.filter(owner=self.user).first()
+        url = reverse('api-detail', args=['companies', company.pk])
+
+        response = self.client.get(url + '?fields=name,updated_at')
+        self.assertEqual(response.json()['name'], company.name)
+        self.assertEqual(self.client.get(url + '?fields=name,updated_at', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        foreign = Company.objects.exclude(owner=self.user).first()
+        self.assertEqual(self.client.get(reverse('api-detail', args=['companies', foreign.pk])).status_code, 404)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(reverse('api-list', args=['companies']) + '?fields=owner').status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-list', args=['users'])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api-list', args=['companies'])).status_code, 403)
+
+
+class DashboardApiTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        seed_user(self.user, companies=3, contacts=2, projects=1, earning_years=[timezone.localdate().year])
+        self.client.force_login(self.user)
+        self.url = reverse('api-dashboard')
+
+    def test_full_payload(self):
+        payload = self.client.get(self.url).json()
+
+        self.assertEqual(set(payload['widgets']), {
+            'counts', 'earnings', 'recent_companies', 'recent_projects', 'recent_contacts', 'deadlines',
+        })
+        self.assertEqual(payload['widgets']['counts'], {'companies': 3, 'contacts': 2, 'projects': 1})
+        self.assertEqual(payload['widgets']['earnings']['current_month'], 402.0)
+        self.assertEqual(len(payload['widgets']['recent_companies']), 3)
+        self.assertEqual(payload['widgets']['deadlines']['overdue'], 0)
+
+    def test_since_returns_only_changed_widgets(self):
+        version = self.client.get(self.url).json()['version']
+
+        with CaptureQueriesContext(connection) as queries:
+            unchanged = self.client.get(self.url, {'since': version}).json()
+        self.assertEqual(unchanged, {'version': version, 'widgets': {}})
+        # session, user and the version stamps
+        self.assertEqual(len(queries), 3)
+
+        Contact.objects.create(name='New', owner=self.user)
+        changed = self.client.get(self.url, {'since': version}).json()
+        self.assertEqual(set(changed['widgets']), {'counts', 'recent_contacts'})
+        self.assertNotEqual(changed['version'], version)
+
+        self.assertEqual(len(self.client.get(self.url, {'since': 'garbage'}).json()['widgets']), 6)
+
+    def test_conditional_get_and_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        payload = json.loads(gzip.decompress(response.content))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        since = self.client.get(self.url, {'since': payload['version']}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(since.status_code, 200)
+
+        EarningsModel.objects.filter(owner=self.user).first().save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_widgets_are_cached_per_version(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.assertEqual(cache_stats()['dashboard-widget'], {'hits': 6, 'misses': 6, 'bypass': 0})
+
+
+class BatchTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        seed_user(self.user, companies=2, projects=3, earning_years=[2024])
+        seed_user(self.other, projects=1)
+        self.client.force_login(self.user)
+
+    def post(self, entity, operations):
+        return self.client.post(
+            reverse('api-batch', args=[entity]), json.dumps({'operations': operations}),
+            content_type='application/json',
+        )
+
+    def test_create_update_delete_in_one_batch(self):
+        first, second, third = Project.objects.filter(owner=self.user).order_by('pk')
+        company = Company.objects.filter(owner=self.user).first()
+        get_dashboard_stats(self.user)
+        started = timezone.now()
+
+        response = self.post('projects', [
+            {'op': 'update', 'id': first.pk, 'data': {'status': 'completed', 'company': company.pk}},
+            {'op': 'update', 'id': second.pk, 'data': {'status': 'completed'}},
+            {'op': 'delete', 'id': third.pk},
+            {'op': 'create', 'data': {'name': 'New', 'status': 'planning', 'priority': 2, 'due_date': '2000-01-01'}},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertTrue(payload['applied'])
+        self.assertEqual([row['status'] for row in payload['results']], ['updated', 'updated', 'deleted', 'created'])
+        created = Project.objects.get(pk=payload['results'][3]['id'])
+        self.assertEqual((created.name, created.owner), ('New', self.user))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.company, first.name), ('completed', company, 'Project 0'))
+        self.assertGreaterEqual(first.updated_at, started)
+        self.assertFalse(Project.objects.filter(pk=third.pk).exists())
+        self.assertEqual(search(self.user, 'New')[0]['id'], created.pk)
+        self.assertEqual(get_dashboard_stats(self.user)['deadlines'].overdue_count, 1)
+
+    def test_updates_and_creates_take_a_fixed_number_of_queries(self):
+        seed_user(self.user, projects=20)
+        ids = list(Project.objects.filter(owner=self.user).values_list('pk', flat=True))
+
+        def measure(count):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post('projects', [
+                    {'op': 'update', 'id': pk, 'data': {'status': 'on_hold'}} for pk in ids[:count]
+                ] + [
+                    {'op': 'create', 'data': {'name': 'Bulk %d' % i, 'status': 'active', 'priority': 1}}
+                    for i in range(count)
+                ])
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        self.assertEqual(measure(2), measure(20))
+
+    def test_invalid_batches_are_not_applied(self):
+        project = Project.objects.filter(owner=self.user).first()
+        foreign = Project.objects.get(owner=self.other)
+
+        response = self.post('projects', [
+            {'op': 'update', 'id': project.pk, 'data': {'status': 'done'}},
+            {'op': 'update', 'id': foreign.pk, 'data': {'status': 'active'}},
+            {'op': 'delete', 'id': project.pk},
+            {'op': 'create', 'data': {'name': 'Missing priority', 'colour': 'red'}},
+            {'op': 'rename', 'id': 1},
+            {'op': 'create', 'data': {'name': 'Valid', 'status': 'active', 'priority': 3}},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        payload = response.json()
+        self.assertFalse(payload['applied'])
+        statuses = [row['status'] for row in payload['results']]
+        self.assertEqual(statuses, ['invalid'] * 5 + ['valid'])
+        self.assertIn('status', payload['results'][0]['errors'])
+        self.assertEqual(payload['results'][1]['errors'], {'id': ['No such record.']})
+        self.assertIn('colour', payload['results'][3]['errors'])
+        self.assertFalse(Project.objects.filter(name='Valid').exists())
+        project.refresh_from_db()
+        self.assertEqual(project.status, 'active')
+
+    def test_earnings_keep_rollups_and_unique_keys(self):
+        earning = EarningsModel.objects.get(owner=self.user, year=2024, month=1, source='design')
+
+        duplicate = self.post('earnings', [
+            {'op': 'create', 'data': {'month': 1, 'year': 2024, 'source': 'design', 'amount': '5'}},
+        ])
+        self.assertEqual(duplicate.status_code, 400)
+
+        response = self.post('earnings', [
+            {'op': 'update', 'id': earning.pk, 'data': {'year': 2025}},
+            {'op': 'create', 'data': {'month': 1, 'year': 2024, 'source': 'design', 'amount': '5'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        rollups = {r.year: r for r in EarningsRollup.objects.filter(owner=self.user, source='design')}
+        self.assertEqual(rollups[2025].total, Decimal('100.50'))
+        self.assertEqual(rollups[2024].month_1, Decimal('5'))
+
+    def test_request_errors(self):
+        url = reverse('api-batch', args=['projects'])
+        self.assertEqual(self.client.post(url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post('projects', []).status_code, 400)
+        self.assertEqual(self.post('users', [{'op': 'delete', 'id': 1}]).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+
+class SearchTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+
+    def names(self, query, user=None):
+        return [result['name'] for result in search(user or self.user, query)]
+
+    def test_records_are_indexed_on_save_and_delete(self):
+        company = Company.objects.create(name='Acme Rockets', email='sales@acme.test', owner=self.user)
+        Contact.objects.create(name='Wile Coyote', email='wile@acme.test', owner=self.user)
+        Company.objects.create(name='Acme Other', email='x@acme.test', owner=self.other)
+
+        self.assertEqual(self.names('acme rock'), ['Acme Rockets'])
+        self.assertCountEqual(self.names('acme'), ['Acme Rockets', 'Wile Coyote'])
+
+        company.name = 'Roadrunner Inc'
+        company.save()
+        self.assertEqual(self.names('rockets'), [])
+        self.assertEqual(self.names('roadrunner'), ['Roadrunner Inc'])
+
+        company.delete()
+        self.assertEqual(self.names('roadrunner'), [])
+
+    def test_name_matches_rank_above_description_matches(self):
+        Project.objects.create(name='Migration', description='Move the falcon servers', owner=self.user)
+        Project.objects.create(name='Falcon', description='New website', owner=self.user)
+
+        self.assertEqual(self.names('falcon'), ['Falcon', 'Migration'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        Company.objects.create(name='Acme', email='a@acme.test', owner=self.user)
+
+        self.assertEqual(self.names('acme OR "'), [])
+        self.assertEqual(self.names('acme NOT acme'), [])
+
+    def test_imported_rows_are_searchable(self):
+        import_file('contacts', BytesIO(b'name,email\nGrace Hopper,grace@navy.test\n'), self.user, file_format='csv')
+
+        self.assertEqual(self.names('hopper'), ['Grace Hopper'])
+
+    def test_rebuild_and_endpoints(self):
+        Company.objects.bulk_create([Company(name='Bulk Co', email='b@bulk.test', owner=self.user)])
+        self.assertEqual(self.names('bulk'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.names('bulk'), ['Bulk Co'])
+
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('search') + '?q=bulk'), 'Bulk Co')
+        results = self.client.get(reverse('api-search') + '?q=bulk').json()['results']
+        self.assertEqual(results[0]['entity'], 'company')
+
+
+class ProfilingTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        seed_user(self.user, companies=3, projects=3, earning_years=[datetime.date.today().year])
+        self.client.force_login(self.user)
+        self.log = os.path.join(tempfile.mkdtemp(), 'profiling.jsonl')
+
+    def test_disabled_by_default(self):
+        with override_settings(CRM_PROFILING_HEADER=False, CRM_PROFILING_LOG=self.log):
+            response = self.client.get(reverse('dashboard'), HTTP_X_PROFILE='1')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_header_opt_in_adds_server_timing_and_logs(self):
+        with override_settings(CRM_PROFILING_HEADER=True, CRM_PROFILING_LOG=self.log):
+            self.client.get(reverse('companies'))
+            self.assertFalse(os.path.exists(self.log))
+            self.client.get(reverse('dashboard'), HTTP_X_PROFILE='1')
+            response = self.client.get(reverse('dashboard'), HTTP_X_PROFILE='1')
+
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('cache;desc="1 hits, 0 misses"', response['Server-Timing'])
+        records = list(read_log(self.log))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['url_name'], 'dashboard')
+        self.assertEqual(records[0]['cache_misses'], 1)
+        self.assertGreater(records[0]['sql_count'], records[1]['sql_count'])
+        self.assertGreater(records[0]['template_ms'], 0)
+
+    def test_duplicate_queries_are_reported(self):
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            for _ in range(3):
+                list(Company.objects.filter(owner=self.user))
+
+        self.assertEqual(profile.query_count, 3)
+        self.assertEqual(profile.duplicate_count, 2)
+        self.assertEqual(profile.duplicates()[0]['count'], 3)
+
+    def test_summary_command(self):
+        with override_settings(CRM_PROFILING=True, CRM_PROFILING_LOG=self.log):
+            for _ in range(3):
+                self.client.get(reverse('dashboard'))
+            self.client.get(reverse('companies'))
+            out = StringIO()
+            call_command('profiling_summary', stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(any(line.startswith('dashboard ') and ' 3 ' in line for line in lines))
+        self.assertTrue(any(line.startswith('companies ') for line in lines))
+
+
+@override_settings(ROOT_URLCONF='CRM.asgi_urls')
+class AsyncViewTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        seed_user(self.user, companies=30, contacts=3, projects=4, earning_years=[datetime.date.today().year])
+
+    def test_async_views_are_routed(self):
+        from . import async_views
+        for name in ('dashboard', 'companies', 'contacts', 'projects', 'earnings'):
+            view_class = self.client.get(reverse(name)).resolver_match.func.view_class
+            self.assertTrue(view_class.view_is_async, name)
+            self.assertIs(view_class, getattr(async_views, view_class.__name__))
+
+    async def test_pages_match_the_sync_views(self):
+        await self.async_client.aforce_login(self.user)
+
+        dashboard = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(dashboard.status_code, 200)
+        self.assertEqual(dashboard.context['companies_count'], 30)
+        self.assertEqual(len(dashboard.context['recent_projects']), 4)
+        sources = len(EarningsModel.SOURCE_CHOICES)
+        self.assertEqual(dashboard.context['current_monthly_earnings'], Decimal('100.50') * sources)
+
+        companies = await self.async_client.get(reverse('companies'))
+        self.assertEqual(len(companies.context['companies']), 25)
+        self.assertTrue(companies.context['page'].has_next())
+        following = await self.async_client.get(reverse('companies') + companies.context['page'].next_url)
+        self.assertEqual(len(following.context['companies']), 5)
+
+        projects = await self.async_client.get(reverse('projects'))
+        self.assertEqual(projects.context['active_projects_count'], 4)
+        earnings = await self.async_client.get(reverse('earnings'))
+        self.assertEqual(earnings.context['active_sources_count'], sources)
+        contacts = await self.async_client.get(reverse('contacts'))
+        self.assertEqual(len(contacts.context['contacts']), 3)
+
+    async def test_anonymous_users_are_redirected(self):
+        response = await self.async_client.get(reverse('dashboard'))
+
+        self.assertRedirects(response, reverse('home') + '?next=/dashboard/', fetch_redirect_response=False)
+
+    async def test_post_uses_the_sync_handler(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(reverse('companies'), {'name': 'Async Co', 'email': 'a@async.test'})
+
+        self.assertRedirects(response, reverse('companies'), fetch_redirect_response=False)
+        self.assertTrue(await Company.objects.filter(owner=self.user, name='Async Co').aexists())
+
+
+class EarningsAnalyticsTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.today = datetime.date(2025, 3, 15)
+
+    def rows(self, totals):
+        """Rollup-like rows from ``{(year, source): [12 amounts]}``."""
+        return [
+            {'year': year, 'source': source, **{'month_%d' % (m + 1): amount for m, amount in enumerate(amounts)}}
+            for (year, source), amounts in totals.items()
+        ]
+
+    def test_growth_shares_and_rolling_averages(self):
+        analytics = analyze(self.rows({
+            (2023, 'consulting'): [100] * 12,
+            (2024, 'consulting'): [150] * 12,
+            (2024, 'design'): [50] * 12,
+            (2025, 'consulting'): [300] * 3 + [0] * 9,
+        }), self.today)
+
+        self.assertEqual([row['year'] for row in analytics['years']], [2023, 2024, 2025])
+        self.assertEqual([row['growth'] for row in analytics['growth']], [1.0, 0.5])
+        # The current year is compared on January to March only
+        self.assertEqual(analytics['growth'][-1]['previous'], 600)
+        self.assertEqual(len(analytics['monthly']['data']), 27)
+        self.assertEqual(analytics['monthly']['labels'][-1], '2025-03')
+        self.assertEqual(analytics['monthly']['rolling_3'][-1], 300)
+        self.assertEqual(analytics['sources'][0]['source'], 'consulting')
+        self.assertAlmostEqual(sum(source['share'] for source in analytics['sources']), 1.0)
+        self.assertEqual(analytics['forecast']['labels'][0], '2025-04')
+        self.assertEqual(analytics['summary']['growth'], 0.5)
+
+    def test_rolling_average(self):
+        self.assertEqual(rolling_average([1, 2, 3, 4], 2), [None, 1.5, 2.5, 3.5])
+
+    def test_forecast_follows_trend_and_season(self):
+        self.assertEqual(forecast([10, 20, 30], 0, months=2), [40, 50])
+        # Two years with a December peak on a flat base
+        history = ([100] * 11 + [400]) * 2
+        predicted = forecast(history, 0)
+        self.assertEqual(max(range(12), key=predicted.__getitem__), 11)
+        self.assertAlmostEqual(predicted[0], 100, delta=1)
+        self.assertEqual(forecast([], 0), [])
+        self.assertEqual(forecast([-50, -100], 0, months=1), [0.0])
+
+    def test_empty(self):
+        analytics = analyze([], self.today)
+        self.assertEqual(analytics['forecast'], {'labels': [], 'data': []})
+        self.assertIsNone(analytics['summary']['top_source'])
+
+    def test_out_of_range_years_are_rejected_and_ignored(self):
+        self.client.force_login(self.user)
+        data = {'month': 1, 'year': 20000000, 'amount': '5', 'source': 'design', 'description': ''}
+
+        response = self.client.post(reverse('earnings'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('year', response.context['earning_form'].errors)
+        self.assertFalse(EarningsModel.objects.exists())
+
+        # Rows stored before the year was checked
+        analytics = analyze(self.rows({(20000000, 'design'): [5] * 12, (2024, 'design'): [5] * 12}), self.today)
+        self.assertEqual([row['year'] for row in analytics['years']], [2024, 2025])
+
+    def test_cached_until_earnings_change(self):
+        seed_user(self.user, earning_years=[2024, timezone.localdate().year])
+        get_earnings_analytics(self.user)
+        # Only the version stamp of the earnings
+        with self.assertNumQueries(1):
+            get_earnings_analytics(self.user)
+
+        earning = EarningsModel.objects.filter(owner=self.user).first()
+        earning.amount = Decimal('1000')
+        earning.save()
+        with self.assertNumQueries(2):
+            get_earnings_analytics(self.user)
+
+    def test_writes_from_other_processes_are_noticed(self):
+        seed_user(self.user, earning_years=[timezone.localdate().year])
+        before = get_earnings_analytics(self.user)['years'][-1]['total']
+
+        # What a worker process does: it cannot bump this process's generation
+        with mock.patch('apps.common.models.bump_generation'):
+            earning = EarningsModel.objects.filter(owner=self.user).first()
+            earning.amount += 10
+            earning.save()
+
+        self.assertEqual(get_earnings_analytics(self.user)['years'][-1]['total'], before + 10)
+
+    def test_endpoint_and_page(self):
+        seed_user(self.user, earning_years=[timezone.localdate().year - 1, timezone.localdate().year])
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('api-earnings-analytics'))
+        self.assertEqual(len(response.json()['forecast']['data']), 12)
+        self.assertEqual(
+            self.client.get(reverse('api-earnings-analytics'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+        )
+        self.assertContains(self.client.get(reverse('earnings')), 'Next Month Forecast')
+
+
+class ChartTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.year = datetime.date.today().year
+        seed_user(self.user, earning_years=[self.year - 1, self.year])
+        EarningsModel.objects.filter(owner=self.user, year=self.year, month=12).delete()
+
+    def test_payload_has_twelve_slots_per_series(self):
+        chart = earnings_chart(self.user, self.year, years=3)
+        sources = len(EarningsModel.SOURCE_CHOICES)
+
+        self.assertEqual(chart['data'], [100.5 * sources] * 11 + [0.0])
+        self.assertEqual([series['label'] for series in chart['years']], [str(self.year - y) for y in range(3)])
+        self.assertEqual(chart['years'][1]['data'], [100.5 * sources] * 12)
+        self.assertEqual(chart['years'][2]['data'], [0.0] * 12)
+        self.assertEqual(len(chart['sources']), sources)
+        self.assertTrue(all(len(series['data']) == 12 for series in chart['sources']))
+
+    def test_query_count_does_not_depend_on_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            earnings_chart(self.user, self.year, years=2)
+        seed_user(self.user, earning_years=[self.year - 2, self.year - 3])
+
+        with self.assertNumQueries(len(queries)):
+            earnings_chart(self.user, self.year, years=4)
+
+    def test_json_is_cached_until_earnings_change(self):
+        payload = earnings_chart_json(self.user, self.year)
+        # Only the version stamp of the earnings
+        with self.assertNumQueries(1):
+            self.assertEqual(earnings_chart_json(self.user, self.year), payload)
+
+        EarningsModel.objects.create(month=12, year=self.year, source='freelance', amount=5, owner=self.user)
+        self.assertEqual(json.loads(earnings_chart_json(self.user, self.year))['data'][11], 5.0)
+
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        url = reverse('api-earnings-chart')
+
+        response = self.client.get(url, {'year': self.year - 1})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json()['year'], self.year - 1)
+        cached = self.client.get(url, {'year': self.year - 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(url, {'years': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'years': 50}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'year': 10 ** 20}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'year': EarningsModel.MIN_YEAR - 1}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'year': EarningsModel.MAX_YEAR + 1}).status_code, 400)
+
+
+class SQLiteTuningTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        defaults = {name: self.pragma(name) for name in ('cache_size', 'busy_timeout')}
+        self.addCleanup(override_settings(CRM_SQLITE_PRAGMAS=defaults)(configure_sqlite), None, connection)
+
+        with override_settings(CRM_SQLITE_PRAGMAS={'cache_size': -1234, 'busy_timeout': 500}):
+            configure_sqlite(None, connection)
+        self.assertEqual(self.pragma('cache_size'), -1234)
+        self.assertEqual(self.pragma('busy_timeout'), 500)
+
+    def test_invalid_pragmas_are_rejected(self):
+        with override_settings(CRM_SQLITE_PRAGMAS={'cache_size': '1; DROP TABLE auth_user'}):
+            with self.assertRaises(ValueError):
+                configure_sqlite(None, connection)
+
+
+@mock.patch('apps.common.routers.replica_alias', return_value='replica')
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def serve(self, request, write=False):
+        """Run ``request`` through the middleware; return (alias read from, response)."""
+        seen = []
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            if write:
+                router.db_for_write(Company)
+            seen.append(router.db_for_read(Company))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(view)
+        request.resolver_match = resolve(request.path)
+        response = middleware(request)
+        return seen[0], response
+
+    def test_reads_outside_requests_use_the_primary(self, _):
+        self.assertEqual(router.db_for_read(Company), 'default')
+
+    def test_listed_get_views_read_from_the_replica(self, _):
+        alias, response = self.serve(RequestFactory().get(reverse('companies')))
+
+        self.assertEqual(alias, 'replica')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.serve(RequestFactory().get(reverse('profile')))[0], 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self, _):
+        alias, response = self.serve(RequestFactory().post(reverse('companies')))
+        self.assertEqual(alias, 'default')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = RequestFactory().get(reverse('companies'))
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.assertEqual(self.serve(request)[0], 'default')
+
+    def test_write_during_a_get_keeps_later_reads_on_the_primary(self, _):
+        alias, response = self.serve(RequestFactory().get(reverse('dashboard')), write=True)
+
+        self.assertEqual(alias, 'default')
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+
+@skipUnless('replica' in settings.DATABASES, 'Run with CRM_DB_REPLICA=1 to add a replica alias')
+class ReplicaRoutingDatabaseTests(TransactionTestCase):
+    databases = '__all__'
+
+    def test_list_pages_query_the_replica(self):
+        user = User.objects.create_user('owner', password='pass')
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get(reverse('companies'))
+        self.assertTrue(replica.captured_queries)
+
+        response = self.client.post(reverse('companies'), {'name': 'Acme', 'email': 'a@acme.test'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertContains(self.client.get(reverse('companies')), 'Acme')
+        self.assertFalse(replica.captured_queries)
+
+
+CALLS = []
+
+
+@task(max_attempts=2, retry_delay=60)
+def flaky_task(fail_times):
+    CALLS.append(fail_times)
+    if len(CALLS) <= fail_times:
+        raise RuntimeError('boom')
+    return len(CALLS)
+
+
+@task
+def opaque_task():
+    return object()
+
+
+@task(max_attempts=1)
+def outlived_task(seconds):
+    # Other workers see the lock an hour old unless the heartbeat refreshes it
+    Task.objects.update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+    time.sleep(seconds)
+    return requeue_stale(600)
+
+
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        CALLS.clear()
+
+    def run_due(self):
+        return [run_task(task_id) for task_id in claim('test', 10)]
+
+    def test_tasks_wait_for_the_worker(self):
+        queued = flaky_task.enqueue(0)
+
+        self.assertEqual(queued.status, Task.QUEUED)
+        self.assertEqual(CALLS, [])
+        self.assertEqual(self.run_due(), [Task.DONE])
+        queued.refresh_from_db()
+        self.assertEqual((queued.result, queued.attempts), (1, 1))
+
+    def test_failures_are_retried_with_backoff(self):
+        queued = flaky_task.enqueue(5)
+
+        self.assertEqual(self.run_due(), [Task.QUEUED])
+        queued.refresh_from_db()
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertGreater(queued.run_after, timezone.now() + datetime.timedelta(seconds=50))
+        self.assertEqual(self.run_due(), [])
+
+        Task.objects.update(run_after=timezone.now())
+        self.assertEqual(self.run_due(), [Task.FAILED])
+        self.assertEqual(len(CALLS), 2)
+
+    def test_idempotency_key(self):
+        first = flaky_task.enqueue(0, idempotency_key='once')
+        second = flaky_task.enqueue(0, idempotency_key='once')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_tasks_release_their_idempotency_key(self):
+        failed = flaky_task.enqueue(5, idempotency_key='once')
+        Task.objects.update(status=Task.FAILED)
+
+        retried = flaky_task.enqueue(0, idempotency_key='once')
+
+        self.assertNotEqual(retried.pk, failed.pk)
+        self.assertEqual(retried.status, Task.QUEUED)
+        failed.refresh_from_db()
+        self.assertIsNone(failed.idempotency_key)
+
+    def test_pool_errors_do_not_stop_the_worker(self):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        from apps.common.management.commands.run_worker import Command
+
+        class FailingPool:
+            def submit(self, func, task_id):
+                future = Future()
+                future.set_exception(BrokenProcessPool('A process in the pool was terminated'))
+                return future
+
+        flaky_task.enqueue(0)
+        flaky_task.enqueue(0)
+        out = StringIO()
+        options = {'stale_after': 600, 'once': True, 'poll_interval': 0}
+        with self.assertLogs('crm.tasks', 'ERROR') as logs:
+            done, broken = Command(stdout=out).run_pool(FailingPool(), 'test', 2, options)
+
+        self.assertEqual((done, broken), (2, True))
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('error (A process in the pool was terminated)', out.getvalue())
+
+    @override_settings(CRM_TASK_BACKEND='apps.common.tasks.ImmediateBackend')
+    def test_immediate_backend_runs_inline(self):
+        self.assertEqual(flaky_task.enqueue(0).status, Task.DONE)
+        self.assertEqual(CALLS, [0])
+
+    def test_stale_tasks_are_requeued(self):
+        queued = flaky_task.enqueue(0)
+        claim('dead-worker', 1)
+        Task.objects.update(locked_at=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(requeue_stale(600), 1)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by), (Task.QUEUED, ''))
+        self.assertEqual(self.run_due(), [Task.DONE])
+
+    def test_results_that_cannot_be_stored_fail_the_task(self):
+        opaque_task.enqueue()
+
+        self.assertEqual(self.run_due(), [Task.FAILED])
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.result, task.locked_by), (Task.FAILED, None, ''))
+        self.assertIn('not JSON serializable', task.last_error)
+
+    def test_tasks_released_meanwhile_keep_their_outcome(self):
+        outlived_task.enqueue(0)
+
+        self.assertEqual(self.run_due(), [Task.FAILED])
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.result), (Task.FAILED, None))
+        self.assertEqual(task.last_error, 'Worker did not finish the task.')
+
+    def test_only_decorated_functions_run(self):
+        Task.objects.create(name='os.remove', args=['/tmp/x'], max_attempts=1)
+
+        self.assertEqual(self.run_due(), [Task.FAILED])
+        self.assertIn('is not a task', Task.objects.get().last_error)
+
+    def test_rollup_rebuild_can_be_queued(self):
+        call_command('rebuild_earnings_rollups', queue=True, stdout=StringIO())
+        call_command('run_worker', processes=0, once=True, stdout=StringIO())
+
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+
+class TaskHeartbeatTests(TransactionTestCase):
+
+    @mock.patch('apps.common.tasks.HEARTBEAT_INTERVAL', 0.05)
+    def test_long_tasks_keep_their_lock(self):
+        outlived_task.enqueue(0.5)
+
+        self.assertEqual([run_task(task_id) for task_id in claim('test', 1)], [Task.DONE])
+        self.assertEqual(Task.objects.get().result, 0)
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'apps.common.staticfiles.CompressedManifestStaticFilesStorage'},
+})
+class StaticFilesTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.root)
+        with override_settings(STATIC_ROOT=cls.root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(cls.root, 'staticfiles.json')) as manifest:
+            cls.hashed = json.load(manifest)['paths']['css/sb-admin-2.min.css']
+
+    def setUp(self):
+        self.calls = []
+        self.app = StaticFilesApp(self.django_app, root=self.root, prefix='/static/')
+
+    def django_app(self, environ, start_response):
+        self.calls.append(environ['PATH_INFO'])
+        start_response('200 OK', [])
+        return [b'django']
+
+    def get(self, path, method='GET', **headers):
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+        environ.update(('HTTP_' + key.upper(), value) for key, value in headers.items())
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(response_headers)
+
+        response['body'] = b''.join(self.app(environ, start_response))
+        return response
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        self.assertRegex(self.hashed, r'^css/sb-admin-2\.min\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, self.hashed), 'rb') as plain:
+            with gzip.open(os.path.join(self.root, self.hashed + '.gz')) as compressed:
+                self.assertEqual(compressed.read(), plain.read())
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'admin/img/lhome.png.gz')))
+
+    def test_templates_use_hashed_urls(self):
+        with override_settings(STATIC_ROOT=self.root):
+            html = Template(
+                "{% load static %}{% static 'css/sb-admin-2.min.css' %} {% static 'vendor/missing.js' %}"
+            ).render(Context())
+        self.assertEqual(html, '/static/%s /static/vendor/missing.js' % self.hashed)
+
+    def test_hashed_files_are_immutable_and_compressed(self):
+        response = self.get('/static/' + self.hashed, accept_encoding='br;q=0, gzip, deflate')
+
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['headers']['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['headers']['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(int(response['headers']['Content-Length']), len(response['body']))
+        self.assertEqual(self.calls, [])
+
+        identity = self.get('/static/' + self.hashed)
+        self.assertNotIn('Content-Encoding', identity['headers'])
+        self.assertEqual(gzip.decompress(response['body']), identity['body'])
+
+    def test_each_encoding_has_its_own_etag(self):
+        url = '/static/css/sb-admin-2.min.css'
+        compressed = self.get(url, accept_encoding='gzip')['headers']['ETag']
+        identity = self.get(url)['headers']['ETag']
+        self.assertNotEqual(compressed, identity)
+
+        not_modified = self.get(url, accept_encoding='gzip', if_none_match=compressed)
+        self.assertEqual(not_modified['status'], 304)
+        self.assertEqual(not_modified['headers']['ETag'], compressed)
+        self.assertEqual(not_modified['headers']['Vary'], 'Accept-Encoding')
+        self.assertEqual(self.get(url, if_none_match=compressed)['status'], 200)
+
+    def test_unhashed_names_revalidate(self):
+        response = self.get('/static/css/sb-admin-2.min.css')
+
+        self.assertEqual(response['headers']['Cache-Control'], 'public, max-age=60')
+        etag = response['headers']['ETag']
+        not_modified = self.get('/static/css/sb-admin-2.min.css', if_none_match=etag)
+        self.assertEqual((not_modified['status'], not_modified['body']), (304, b''))
+
+    def test_other_requests(self):
+        self.assertEqual(self.get('/static/missing.css')['status'], 404)
+        self.assertEqual(self.get('/static/' + self.hashed, method='POST')['status'], 405)
+        self.assertEqual(self.get('/static/' + self.hashed, method='HEAD')['body'], b'')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.get('/dashboard/')['body'], b'django')
+        self.assertEqual(self.calls, ['/dashboard/'])
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip;q=0.5'), {'gzip'})
+        self.assertEqual(accepted_encodings(''), set())
+
+
+class FragmentCacheTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.company = Company.objects.create(name='Acme', owner=self.user)
+        Project.objects.create(name='Launch', company=self.company, owner=self.user, status='on_hold', priority=4)
+        self.client.force_login(self.user)
+
+    def fragment_stats(self, name):
+        return cache_stats().get('fragment:%s' % name)
+
+    def test_unchanged_tables_are_served_from_the_cache(self):
+        self.client.get(reverse('projects'))
+        second = self.client.get(reverse('projects'))
+
+        self.assertEqual(self.fragment_stats('projects-table'), {'hits': 1, 'misses': 1, 'bypass': 0})
+        self.assertEqual(self.fragment_stats('project-cards'), {'hits': 1, 'misses': 1, 'bypass': 0})
+        self.assertContains(second, '<span class="badge badge-warning">High (4)</span>', html=True)
+        self.assertEqual(fragment_hit_rate(cache_stats()), 0.5)
+
+    def test_edits_bulk_writes_and_related_rows_change_the_stamp(self):
+        self.client.get(reverse('projects'))
+
+        # Bypasses the signal handlers, but changes the row count
+        Project.objects.bulk_create([Project(name='Bulk', owner=self.user)])
+        self.assertContains(self.client.get(reverse('projects')), 'Bulk')
+
+        self.company.name = 'Renamed'
+        self.company.save()
+        self.assertContains(self.client.get(reverse('projects')), 'Renamed')
+        self.assertEqual(self.fragment_stats('projects-table')['hits'], 0)
+
+    def test_stat_cards_follow_writes_that_skip_the_signals(self):
+        EarningsModel.objects.create(
+            month=timezone.localdate().month, year=timezone.localdate().year, source='design',
+            amount=Decimal('100.00'), owner=self.user,
+        )
+        self.assertContains(self.client.get(reverse('earnings')), '$100.00')
+
+        # A bulk write that neither bumps the generation nor sends signals
+        EarningsModel.objects.bulk_create([EarningsModel(
+            month=timezone.localdate().month, year=timezone.localdate().year, source='other',
+            amount=Decimal('50.00'), owner=self.user,
+        )])
+        EarningsRollup.rebuild([self.user])
+
+        self.assertContains(self.client.get(reverse('earnings')), '$150.00')
+
+    def test_generation_bumps_invalidate_fragments(self):
+        self.client.get(reverse('projects'))
+        bump_generation(self.user.pk)
+        self.client.get(reverse('projects'))
+
+        self.assertEqual(self.fragment_stats('project-cards'), {'hits': 0, 'misses': 2, 'bypass': 0})
+
+    def test_pages_and_users_are_cached_separately(self):
+        other = User.objects.create_user('other', password='pass')
+        Company.objects.create(name='Other Co', owner=other)
+        self.client.get(reverse('companies'))
+
+        response = self.client.get(reverse('companies') + '?page_size=1')
+        self.client.force_login(other)
+        other_response = self.client.get(reverse('companies'))
+
+        self.assertContains(response, 'Acme')
+        self.assertContains(other_response, 'Other Co')
+        self.assertNotContains(other_response, 'Acme')
+        self.assertEqual(self.fragment_stats('companies-table')['hits'], 0)
+
+    def test_version_stamps(self):
+        memo = {}
+        with CaptureQueriesContext(connection) as queries:
+            projects, companies, contacts = version_stamps(self.user.pk, ['projects', 'companies', 'contacts'], memo)
+            version_stamps(self.user.pk, ['projects'], memo)
+
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(projects.endswith('.1'))
+        self.assertEqual(contacts, '0.0')
+        with self.assertRaises(ValueError):
+            version_stamps(self.user.pk, ['tasks'])
+
+    def test_fragment_outcomes_are_profiled(self):
+        with tempfile.TemporaryDirectory() as logs, \
+                self.settings(CRM_PROFILING=True, CRM_PROFILING_LOG=os.path.join(logs, 'profiling.jsonl')):
+            self.client.get(reverse('contacts'))
+            response = self.client.get(reverse('contacts'))
+            summary = summarize(read_log(os.path.join(logs, 'profiling.jsonl')))
+
+        self.assertIn('frag;desc="1 hits, 0 misses"', response['Server-Timing'])
+        self.assertEqual(summary['contacts']['fragment_hit_rate'], 0.5)
+
+
+class DeadlineTests(CRMTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner', password='pass')
+        self.today = timezone.localdate()
+        day = datetime.timedelta(days=1)
+        for name, offset, status in [
+            ('Late', -3, 'active'), ('Done late', -3, 'completed'), ('Today', 0, 'active'),
+            ('Tomorrow', 1, 'planning'), ('Next week', 7, 'active'), ('Next month', 20, 'on_hold'),
+            ('Later', 45, 'active'),
+        ]:
+            Project.objects.create(name=name, owner=self.user, status=status, due_date=self.today + offset * day)
+        Project.objects.create(name='Undated', owner=self.user, status='active')
+        self.client.force_login(self.user)
+
+    def test_buckets_and_feed(self):
+        other = User.objects.create_user('other', password='pass')
+        Project.objects.create(name='Other', owner=other, due_date=self.today)
+
+        summary = get_deadlines(self.user.pk, self.today)
+
+        self.assertEqual(
+            (summary.overdue_count, summary.due_today_count, summary.due_week_count, summary.due_month_count),
+            (1, 1, 2, 1),
+        )
+        self.assertEqual([row['name'] for row in summary.due_soon], ['Today', 'Tomorrow', 'Next week'])
+        self.assertEqual(summary.due_soon[1]['days_left'], 1)
+        self.assertEqual([p.name for p in overdue(self.user.pk, self.today)], ['Late'])
+
+    def test_summary_is_reused_until_a_project_changes(self):
+        get_deadlines(self.user.pk, self.today)
+        with self.assertNumQueries(1):
+            get_deadlines(self.user.pk, self.today)
+
+        Project.objects.filter(name='Late').get().delete()
+        self.assertFalse(DeadlineSummary.objects.filter(owner=self.user).exists())
+        self.assertEqual(get_deadlines(self.user.pk, self.today).overdue_count, 0)
+
+    def test_stale_summary_is_recomputed(self):
+        get_deadlines(self.user.pk, self.today)
+
+        tomorrow = get_deadlines(self.user.pk, self.today + datetime.timedelta(days=1))
+
+        self.assertEqual(tomorrow.computed_on, self.today + datetime.timedelta(days=1))
+        self.assertEqual((tomorrow.overdue_count, tomorrow.due_today_count), (2, 1))
+
+    def test_imports_invalidate_the_summary(self):
+        get_deadlines(self.user.pk, self.today)
+        upload = SimpleUploadedFile('projects.csv', b'name,status,priority,due_date\nImported,active,3,2000-01-01\n')
+
+        result = import_file('projects', upload, self.user)
+
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(get_deadlines(self.user.pk, self.today).overdue_count, 2)
+
+    def test_refresh_command(self):
+        stale = DeadlineSummary.objects.create(owner=self.user, computed_on=self.today - datetime.timedelta(days=1))
+        nobody = User.objects.create_user('nobody', password='pass')
+        DeadlineSummary.objects.create(owner=nobody, computed_on=self.today)
+        out = StringIO()
+
+        call_command('refresh_deadlines', stdout=out)
+
+        stale.refresh_from_db()
+        self.assertEqual((stale.computed_on, stale.due_today_count), (self.today, 1))
+        self.assertFalse(DeadlineSummary.objects.filter(owner=nobody).exists())
+        self.assertIn('Refreshed the deadlines of 1 user(s).', out.getvalue())
+
+    def test_pages(self):
+        projects = self.client.get(reverse('projects'))
+        dashboard = self.client.get(reverse('dashboard'))
+
+        self.assertContains(projects, 'Overdue</small>', count=1)
+        self.assertContains(dashboard, '1 overdue project')
+        self.assertContains(dashboard, 'In 1 day<')
@@ -10,6 +10,16 @@ from django.urls import reverse_lazy
 
 from collections import defaultdict
 
+from .analytics import earnings_analytics
+from .cache import cached_context
+from .charts import get_chart_data
+from .deadlines import with_overdue
+from .pagination import paginate, COMPANY_ORDERING, CONTACT_ORDERING, PROJECT_ORDERING, EARNINGS_ORDERING
+from .stats import get_dashboard_stats, get_earnings_stats, get_project_stats
+
+# Tables the dashboard statistics are computed from
+DASHBOARD_ENTITIES = ['companies', 'contacts', 'projects', 'earnings']
+
 class HomeView(TemplateView):
     template_name = 'common/home.html'
 
@@ -19,70 +29,16 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        
-        # Get counts for the current user
-        user_companies = Company.objects.filter(owner=self.request.user)
-        context['companies_count'] = user_companies.count()
-        
-        # You can add more dashboard data here
-        context['recent_companies'] = user_companies[:5]  # Latest 5 companies
-        
-        user_projects = Project.objects.filter(owner=self.request.user)
-        context['active_projects_count'] = user_projects.count()
-        context['recent_projects'] = user_projects[:5]  # Optional, if you want to show them
-
-        # Contacts (placeholder)
-        user_contacts = Contact.objects.filter(owner=self.request.user)
-        context['contacts_count'] = user_contacts.count()
-        context['recent_contacts'] = user_contacts[:5]
-        # context['contacts_count'] = Contact.objects.filter(owner=self.request.user).count()
-
-        user_earnings = EarningsModel.objects.filter(owner=self.request.user)
-
-        # Update the existing earnings calculation to use real data:
-        current_year = datetime.now().year
-        current_month = datetime.now().month
-        context['current_monthly_earnings'] = user_earnings.filter(
-            year=current_year, 
-            month=current_month
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        # Update chart data for dashboard
-        context['earnings_chart_data'] = self.get_earnings_chart_data(user_earnings)
-        context['sources_chart_data'] = self.get_sources_chart_data(user_earnings)
-
+        context.update(cached_context(
+            self.request, 'dashboard', self.get_dashboard_data, entities=DASHBOARD_ENTITIES,
+        ))
         return context
-    
-    def get_earnings_chart_data(self, earnings):
-        current_year = datetime.now().year
-        monthly_data = {}
-
-        for earning in earnings.filter(year=current_year):
-            month_name = earning.get_month_display()
-            monthly_data[month_name] = monthly_data.get(month_name, 0) + float(earning.amount)
-
-        months = ['January', 'February', 'March', 'April', 'May', 'June',
-                  'July', 'August', 'September', 'October', 'November', 'December']
 
-        return json.dumps({
-            'labels': months,
-            'data': [monthly_data.get(month, 0) for month in months]
-        })
-
-    def get_sources_chart_data(self, earnings):
-        sources_data = earnings.values('source').annotate(total=Sum('amount')).order_by('-total')
-
-        labels = []
-        data = []
-        for item in sources_data:
-            source_display = dict(EarningsModel.SOURCE_CHOICES).get(item['source'], 'Other')
-            labels.append(source_display)
-            data.append(float(item['total']))
-
-        return json.dumps({
-            'labels': labels,
-            'data': data
-        })
+    def get_dashboard_data(self):
+        stats = get_dashboard_stats(self.request.user)
+        stats['earnings_chart_data'] = json.dumps(stats['earnings_chart'])
+        stats['sources_chart_data'] = json.dumps(stats['sources_chart'])
+        return stats
 
 class SignupView(CreateView):
     form_class = SignUpForm
@@ -105,13 +61,18 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from .forms import UserForm, ProfileForm
 from django.contrib.auth.models import User
-from apps.userprofile.models import Profile
+from apps.userprofile.models import Profile, get_profile
 
 from django.contrib import messages
 
 class ProfileView(LoginRequiredMixin, TemplateView):
     template_name = 'common/profile.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['profile'] = get_profile(self.request.user)
+        return context
+
 class ProfileUpdateView(LoginRequiredMixin, TemplateView):
     user_form = UserForm
     profile_form = ProfileForm
@@ -123,11 +84,14 @@ class ProfileUpdateView(LoginRequiredMixin, TemplateView):
         file_data = request.FILES or None
 
         user_form = UserForm(post_data, instance=request.user)
-        profile_form = ProfileForm(post_data, file_data, instance=request.user.profile)
+        profile_form = ProfileForm(post_data, file_data, instance=get_profile(request.user))
 
         if user_form.is_valid() and profile_form.is_valid():
-            user_form.save()
-            profile_form.save()
+            # Skip the UPDATEs when nothing was edited
+            if user_form.has_changed():
+                user_form.save()
+            if profile_form.has_changed():
+                profile_form.save()
             messages.error(request, 'Your profile is updated successfully!')
             return HttpResponseRedirect(reverse_lazy('profile'))
 
@@ -153,7 +117,8 @@ class CompanyView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['company_form'] = CompanyForm()
-        context['companies'] = Company.objects.filter(owner=self.request.user)
+        context['page'] = paginate(self.request, Company.objects.filter(owner=self.request.user), COMPANY_ORDERING)
+        context['companies'] = context['page'].object_list
         return context
     
     def post(self, request, *args, **kwargs):
@@ -177,7 +142,8 @@ class ContactView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['contact_form'] = ContactForm()
-        context['contacts'] = Contact.objects.filter(owner=self.request.user)
+        context['page'] = paginate(self.request, Contact.objects.filter(owner=self.request.user), CONTACT_ORDERING)
+        context['contacts'] = context['page'].object_list
         return context
     
     def post(self, request, *args, **kwargs):
@@ -195,7 +161,6 @@ class ContactView(LoginRequiredMixin, TemplateView):
         context['contact_form'] = form
         return self.render_to_response(context)
 
-from django.utils import timezone
 from .forms import ProjectForm 
 
 class ProjectsView(LoginRequiredMixin, TemplateView):
@@ -203,14 +168,17 @@ class ProjectsView(LoginRequiredMixin, TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['project_form'] = ProjectForm()
-        context['projects'] = Project.objects.filter(owner=self.request.user)
+        context['project_form'] = ProjectForm(user=self.request.user)
+        # Only the columns the projects table renders, with the company joined in
+        projects = Project.objects.filter(owner=self.request.user).select_related('company').only(
+            'name', 'status', 'priority', 'start_date', 'due_date', 'budget', 'created_at', 'company__name'
+        )
+        context['page'] = paginate(self.request, with_overdue(projects), PROJECT_ORDERING)
+        context['projects'] = context['page'].object_list
         # Add statistics
-        projects = context['projects']
-        context['active_projects_count'] = projects.filter(status='active').count()
-        context['completed_projects_count'] = projects.filter(status='completed').count()
-        context['on_hold_projects_count'] = projects.filter(status='on_hold').count()
-        context['overdue_projects_count'] = projects.filter(due_date__lt=timezone.now().date()).exclude(status='completed').count()
+        context.update(cached_context(
+            self.request, 'projects', lambda: get_project_stats(self.request.user), entities=['projects'],
+        ))
         return context
     
     def post(self, request, *args, **kwargs):
@@ -229,8 +197,6 @@ class ProjectsView(LoginRequiredMixin, TemplateView):
     
 from .models import EarningsModel
 from .forms import EarningsForm
-from django.db.models import Sum
-from datetime import datetime
 import json
 
 class EarningsView(LoginRequiredMixin, TemplateView):
@@ -240,25 +206,29 @@ class EarningsView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         user_earnings = EarningsModel.objects.filter(owner=self.request.user)
         
-        # Basic stats
-        current_year = datetime.now().year
-        current_month = datetime.now().month
-        
         context['earning_form'] = EarningsForm()
-        context['earnings'] = user_earnings
-        context['total_year_earnings'] = user_earnings.filter(year=current_year).aggregate(Sum('amount'))['amount__sum'] or 0
-        context['current_month_earnings'] = user_earnings.filter(year=current_year, month=current_month).aggregate(Sum('amount'))['amount__sum'] or 0
-        context['last_month_earnings'] = user_earnings.filter(
-            year=current_year if current_month > 1 else current_year-1, 
-            month=current_month-1 if current_month > 1 else 12
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        context['active_sources_count'] = user_earnings.values('source').distinct().count()
+        context['page'] = paginate(self.request, user_earnings, EARNINGS_ORDERING)
+        context['earnings'] = context['page'].object_list
+        context.update(cached_context(self.request, 'earnings', self.get_earnings_data, entities=['earnings']))
+        
+        return context
+
+    def get_earnings_data(self):
+        # Basic stats, read from the per-year rollups
+        stats = get_earnings_stats(self.request.user)
         
         # Chart data for dashboard integration
-        context['earnings_chart_data'] = self.get_earnings_chart_data(user_earnings)
-        context['sources_chart_data'] = self.get_sources_chart_data(user_earnings)
+        earnings_chart, sources_chart = get_chart_data(stats)
         
-        return context
+        return {
+            'total_year_earnings': stats['total_year'],
+            'current_month_earnings': stats['current_month'],
+            'last_month_earnings': stats['last_month'],
+            'active_sources_count': stats['active_sources_count'],
+            'earnings_chart_data': json.dumps(earnings_chart),
+            'sources_chart_data': json.dumps(sources_chart),
+            'analytics': earnings_analytics(self.request.user),
+        }
     
     def post(self, request, *args, **kwargs):
         earning_form = EarningsForm(request.POST)
@@ -272,39 +242,96 @@ class EarningsView(LoginRequiredMixin, TemplateView):
         context = self.get_context_data(**kwargs)
         context['earning_form'] = earning_form
         return self.render_to_response(context)
-    
-    def get_earnings_chart_data(self, earnings):
-        # Generate monthly data for the current year
-        current_year = datetime.now().year
-        monthly_data = {}
-        
-        for earning in earnings.filter(year=current_year):
-            month_name = earning.get_month_display()
-            if month_name in monthly_data:
-                monthly_data[month_name] += float(earning.amount)
+
+import hashlib
+import secrets
+from django.core.files.storage import storages
+from .forms import ImportForm
+from .importers import guess_format
+from .models import Task
+from .tasks import import_upload
+
+class ImportView(LoginRequiredMixin, TemplateView):
+    template_name = 'common/import.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.setdefault('import_form', ImportForm())
+        context['import_tasks'] = Task.objects.filter(
+            owner=self.request.user, name=import_upload.task_name
+        ).defer('args', 'kwargs', 'last_error')[:10]
+        return context
+
+    def post(self, request, *args, **kwargs):
+        import_form = ImportForm(request.POST, request.FILES)
+        if not import_form.is_valid():
+            messages.error(request, 'Please correct the errors below.')
+            return self.render_to_response(self.get_context_data(import_form=import_form))
+
+        # The file is imported by a background worker. Uploading the same
+        # file again returns the earlier task instead of importing it twice,
+        # unless that import failed.
+        entity = import_form.cleaned_data['entity']
+        upload = request.FILES['file']
+        digest = hashlib.sha256()
+        for chunk in upload.chunks():
+            digest.update(chunk)
+        key = 'import:%s:%s:%s' % (request.user.pk, entity, digest.hexdigest())
+
+        if Task.objects.filter(idempotency_key=key).exclude(status=Task.FAILED).exists():
+            messages.warning(request, 'This file has already been uploaded; see its import below.')
+            return redirect('import')
+
+        # Under a random name: the upload holds the user's data
+        name = storages['imports'].save('%s/%s' % (request.user.pk, secrets.token_hex(16)), upload)
+        task = import_upload.enqueue(
+            entity, name, request.user.pk, guess_format(upload.name), idempotency_key=key, owner=request.user,
+        )
+        if task.args[1] != name:
+            # Lost a race with an identical upload
+            storages['imports'].delete(name)
+
+        if task.status == Task.DONE:
+            result = task.result
+            if result['failed']:
+                messages.warning(request, 'Import finished: %(imported)d imported, %(failed)d failed.' % result)
             else:
-                monthly_data[month_name] = float(earning.amount)
-        
-        # Ensure all months are represented
-        months = ['January', 'February', 'March', 'April', 'May', 'June',
-                 'July', 'August', 'September', 'October', 'November', 'December']
-        
-        return json.dumps({
-            'labels': months,
-            'data': [monthly_data.get(month, 0) for month in months]
-        })
-    
-    def get_sources_chart_data(self, earnings):
-        sources_data = earnings.values('source').annotate(total=Sum('amount')).order_by('-total')
-        
-        labels = []
-        data = []
-        for item in sources_data:
-            source_display = dict(EarningsModel.SOURCE_CHOICES)[item['source']]
-            labels.append(source_display)
-            data.append(float(item['total']))
-        
-        return json.dumps({
-            'labels': labels,
-            'data': data
-        })
\ No newline at end of file
+                messages.success(request, 'Import finished: %(imported)d imported, %(failed)d failed.' % result)
+            return self.render_to_response(self.get_context_data(import_result=result))
+        if task.status == Task.FAILED:
+            messages.error(request, 'The import failed.')
+        else:
+            messages.success(request, 'Your file has been queued for import; results will appear below.')
+        return redirect('import')
+
+from django.db import router
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+from .exporters import EXPORTS, FORMATS, STREAMERS
+
+class ExportView(LoginRequiredMixin, View):
+
+    def get(self, request, entity, file_format):
+        if entity not in EXPORTS or file_format not in FORMATS:
+            raise Http404('Unknown export.')
+
+        # The body is generated after the request's routing context has
+        # ended, so pick the database now
+        using = router.db_for_read(EXPORTS[entity][0])
+        response = StreamingHttpResponse(
+            STREAMERS[file_format](entity, request.user, using=using),
+            content_type=FORMATS[file_format],
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (entity, file_format)
+        return response
+
+from .search import search
+
+class SearchView(LoginRequiredMixin, TemplateView):
+    template_name = 'common/search.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '').strip()
+        context['results'] = search(self.request.user, context['query']) if context['query'] else []
+        return context
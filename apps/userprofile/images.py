@@ -0,0 +1,148 @@
+"""
+Resized variants of profile images.
+
+An upload is center-cropped to a square and saved once per size in
+``VARIANTS``, as WebP and as a JPEG fallback, with all metadata (EXIF, GPS,
+ICC profiles, comments) dropped. Variant files are named after a hash of
+their content, so a URL never changes meaning and can be cached forever;
+identical images share their files, which are only deleted once no profile
+uses them.
+``Profile.image_variants`` maps each size to its files:
+
+    {'avatar': {'size': 300, 'webp': 'users/variants/....webp', 'jpeg': '...'}, ...}
+
+Variants are built by a background task queued when ProfileForm saves a new
+image; until it has run, pages fall back to the original upload.
+"""
+import hashlib
+import io
+from functools import reduce
+from operator import or_
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from apps.common.tasks import task
+
+VARIANTS = {
+    'thumbnail': 96,
+    'avatar': 300,
+    'profile': 600,
+}
+VARIANT_DIR = 'users/variants'
+FORMATS = {
+    # format: (Pillow format, extension, save options)
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _encode(image, file_format):
+    pil_format, extension, options = FORMATS[file_format]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    content = buffer.getvalue()
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    return '%s/%s-%d.%s' % (VARIANT_DIR, digest, image.width, extension), content
+
+
+def _clean(image):
+    """``image`` upright, in RGB, with no metadata carried along."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    # A fresh image carries pixels only: no EXIF, ICC profile or comments
+    clean = Image.new(image.mode, image.size)
+    clean.paste(image)
+    return clean
+
+
+def render_variants(source):
+    """``({name: {'size': ..., format: path}}, {path: bytes})`` for an open image file."""
+    with Image.open(source) as image:
+        image = _clean(image)
+    largest = min(image.size)
+    variants, files = {}, {}
+    for name, size in VARIANTS.items():
+        # Never upscale: a small upload yields smaller (possibly shared) files
+        size = min(size, largest)
+        resized = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        variants[name] = {'size': size}
+        for file_format in FORMATS:
+            path, content = _encode(resized, file_format)
+            variants[name][file_format] = path
+            files[path] = content
+    return variants, files
+
+
+def variant_paths(variants):
+    return {path for variant in variants.values() for key, path in variant.items() if key in FORMATS}
+
+
+def delete_variants(variants, keep=()):
+    """
+    Delete the files of ``variants`` except ``keep`` and those another
+    profile still uses: names come from the content, so identical uploads
+    (the default avatar, for one) share their files.
+    """
+    from .models import Profile
+
+    paths = variant_paths(variants) - set(keep)
+    if not paths:
+        return
+    # Narrowed down in SQL on the serialized JSON, then checked exactly
+    mentions = reduce(or_, (Q(image_variants__icontains=path) for path in paths))
+    for other in Profile.objects.filter(mentions).values_list('image_variants', flat=True):
+        paths -= variant_paths(other)
+    for path in paths:
+        default_storage.delete(path)
+
+
+@task
+def build_image_variants(profile_id, image_name):
+    """
+    Build the variants of ``image_name`` for the profile and delete the ones
+    of its previous image. Does nothing if the image was replaced meanwhile.
+    """
+    from .models import Profile
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or (profile.profile_image.name or '') != image_name:
+        return None
+
+    if image_name and default_storage.exists(image_name):
+        with default_storage.open(image_name, 'rb') as source:
+            variants, files = render_variants(source)
+        for path, content in files.items():
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(content))
+    else:
+        variants = {}
+
+    previous = profile.image_variants
+    Profile.objects.filter(pk=profile_id, profile_image=image_name).update(image_variants=variants)
+    delete_variants(previous, keep=variant_paths(variants))
+    return variants
+
+
+def pick_variant(variants, size):
+    """The smallest variant at least ``size`` pixels wide, else the largest one."""
+    if not variants:
+        return None
+    ordered = sorted(variants.values(), key=lambda variant: variant['size'])
+    return next((variant for variant in ordered if variant['size'] >= size), ordered[-1])
+
+
+def variant_srcset(variants, file_format):
+    """``srcset`` listing every distinct variant in ``file_format`` by width."""
+    widths = {variant[file_format]: variant['size'] for variant in variants.values()}
+    return ', '.join(
+        '%s %dw' % (default_storage.url(path), width)
+        for path, width in sorted(widths.items(), key=lambda item: item[1])
+    )
+
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from apps.userprofile.images import build_image_variants
+from apps.userprofile.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Build the resized variants of profile images uploaded before they existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild every profile image, not only the ones without variants.',
+        )
+        parser.add_argument(
+            '--queue', action='store_true',
+            help='Queue the work for the background worker instead of running it now.',
+        )
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(profile_image='').exclude(profile_image__isnull=True)
+        if not options['all']:
+            profiles = profiles.filter(image_variants={})
+
+        count = 0
+        for pk, name in profiles.values_list('pk', 'profile_image').iterator():
+            if options['queue']:
+                build_image_variants.enqueue(pk, name)
+            else:
+                build_image_variants(pk, name)
+            count += 1
+
+        verb = 'Queued' if options['queue'] else 'Built'
+        self.stdout.write(self.style.SUCCESS('%s image variants for %d profile(s).' % (verb, count)))
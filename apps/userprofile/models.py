@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -10,17 +10,35 @@ class Profile(models.Model):
     phone_number = models.CharField(max_length=12, blank=True)
     birth_date = models.DateField(null=True, blank=True)
     profile_image = models.ImageField(default='default-avatar.png', upload_to='users/', null=True, blank=True)
+    # Resized copies of profile_image, see images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return '%s %s' % (self.user.first_name, self.user.last_name)
 
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+def get_profile(user):
+    """
+    Return ``user``'s profile, creating it if the user predates profiles
+    (e.g. accounts loaded from fixtures). Prefer this over ``user.profile``.
+    """
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Profiles are only written when they change (see ProfileUpdateView), so
+    # routine user saves such as the last_login update do not touch them.
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_delete, sender=Profile)
+def delete_image_variants(sender, instance, **kwargs):
+    from .images import delete_variants
+    delete_variants(instance.image_variants)
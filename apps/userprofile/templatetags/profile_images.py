@@ -0,0 +1,38 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from ..images import pick_variant, variant_srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def profile_image_url(profile, size):
+    """URL of the smallest JPEG variant at least ``size`` pixels wide."""
+    variant = pick_variant(profile.image_variants, size)
+    if variant is None:
+        return profile.profile_image.url if profile.profile_image else ''
+    return profile.profile_image.storage.url(variant['jpeg'])
+
+
+@register.simple_tag
+def profile_picture(profile, size, **attrs):
+    """
+    ``<picture>`` showing the profile image at ``size`` CSS pixels. The
+    browser picks the smallest variant for the screen's pixel density and
+    prefers WebP; ``src`` is the smallest JPEG that fits, for old browsers.
+
+        {% profile_picture user.profile 300 class="rounded" %}
+    """
+    attrs = {'width': size, 'height': size, 'alt': '', **attrs}
+    variants = profile.image_variants
+    if not variants:
+        return format_html('<img src="{}"{}>', profile_image_url(profile, size), flatatt(attrs))
+    sizes = '%dpx' % size
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        variant_srcset(variants, 'webp'), sizes,
+        profile_image_url(profile, size), variant_srcset(variants, 'jpeg'), sizes, flatatt(attrs),
+    )
@@ -1,3 +1,186 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+from .images import VARIANTS
+from .models import Profile, get_profile
+
+
+class ProfileTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pass', first_name='Ada')
+
+    def test_profile_is_created_with_the_user(self):
+        self.assertTrue(Profile.objects.filter(user=self.user).exists())
+
+    def test_saving_the_user_does_not_touch_the_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.first_name = 'Grace'
+            user.save()
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('userprofile', queries[0]['sql'])
+
+    def test_login_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'), {'username': 'owner', 'password': 'pass'})
+
+        self.assertFalse([q for q in queries if 'userprofile_profile' in q['sql']])
+
+    def test_request_user_is_loaded_with_its_profile(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('profile'))
+
+        user = response.wsgi_request.user
+        self.assertIn('profile', user._state.fields_cache)
+
+    def test_sessions_from_the_model_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+
+        response = self.client.get(reverse('profile'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_missing_profile_is_created_lazily(self):
+        Profile.objects.filter(user=self.user).delete()
+        user = User.objects.get(pk=self.user.pk)
+
+        profile = get_profile(user)
+
+        self.assertEqual(profile.user, user)
+        self.assertEqual(get_profile(user), profile)
+        self.assertEqual(Profile.objects.filter(user=user).count(), 1)
+
+    def test_unchanged_profile_update_writes_nothing(self):
+        self.client.force_login(self.user)
+        data = {'username': 'owner', 'first_name': 'Ada', 'last_name': '', 'email': '',
+                'bio': '', 'phone_number': '', 'birth_date': ''}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('profile-update'), data)
+
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "auth_user"')])
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "userprofile_profile"')])
+
+        data['bio'] = 'Mathematician'
+        self.client.post(reverse('profile-update'), data)
+        self.assertEqual(Profile.objects.get(user=self.user).bio, 'Mathematician')
+
+
+def photo(size=(1600, 1200), name='photo.jpg'):
+    image = Image.effect_noise(size, 60).convert('RGB')
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera maker'
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95, exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ProfileImageTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user('owner', password='pass')
+        self.client.force_login(self.user)
+
+    def upload(self, image):
+        data = {'username': 'owner', 'first_name': '', 'last_name': '', 'email': '',
+                'bio': '', 'phone_number': '', 'birth_date': '', 'profile_image': image}
+        self.client.post(reverse('profile-update'), data)
+        call_command('run_worker', processes=0, once=True, stdout=StringIO())
+        return Profile.objects.get(user=self.user)
+
+    def test_upload_builds_small_variants_without_metadata(self):
+        source = photo()
+        profile = self.upload(source)
+
+        self.assertEqual(set(profile.image_variants), set(VARIANTS))
+        for name, size in VARIANTS.items():
+            variant = profile.image_variants[name]
+            self.assertEqual(variant['size'], size)
+            for key, file_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                path = os.path.join(self.media, variant[key])
+                self.assertRegex(variant[key], r'^users/variants/[0-9a-f]{16}-%d\.' % size)
+                with Image.open(path) as image:
+                    self.assertEqual((image.format, image.size), (file_format, (size, size)))
+                    self.assertFalse(image.getexif())
+                    self.assertNotIn('icc_profile', image.info)
+
+        avatar = os.path.getsize(os.path.join(self.media, profile.image_variants['avatar']['webp']))
+        self.assertLess(avatar * 10, source.size)
+
+    def test_small_uploads_are_not_upscaled(self):
+        profile = self.upload(photo((200, 150), 'small.jpg'))
+
+        self.assertEqual([v['size'] for v in profile.image_variants.values()], [96, 150, 150])
+        self.assertEqual(profile.image_variants['avatar'], profile.image_variants['profile'])
+
+    def test_replacing_the_image_deletes_old_variants(self):
+        old = self.upload(photo()).image_variants
+        new = self.upload(photo(name='other.jpg')).image_variants
+
+        self.assertNotEqual(old, new)
+        self.assertFalse(os.path.exists(os.path.join(self.media, old['avatar']['webp'])))
+        self.assertTrue(os.path.exists(os.path.join(self.media, new['avatar']['webp'])))
+
+    def test_variants_shared_with_another_profile_are_kept(self):
+        shared = self.upload(photo()).image_variants
+        path = os.path.join(self.media, shared['avatar']['webp'])
+        others = [get_profile(User.objects.create_user(name, password='pass')) for name in ('ada', 'grace')]
+        Profile.objects.filter(pk__in=[other.pk for other in others]).update(image_variants=shared)
+
+        self.upload(photo(name='other.jpg'))
+        self.assertTrue(os.path.exists(path))
+
+        Profile.objects.get(pk=others[0].pk).delete()
+        self.assertTrue(os.path.exists(path))
+
+        Profile.objects.get(pk=others[1].pk).delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_template_helper(self):
+        template = Template('{% load profile_images %}{% profile_picture profile 300 class="rounded" %}')
+        profile = get_profile(self.user)
+        fallback = template.render(Context({'profile': profile}))
+        self.assertIn('src="%s"' % profile.profile_image.url, fallback)
+
+        profile = self.upload(photo())
+        html = template.render(Context({'profile': profile}))
+
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('src="/media/%s"' % profile.image_variants['avatar']['jpeg'], html)
+        self.assertIn('/media/%s 600w' % profile.image_variants['profile']['webp'], html)
+        self.assertIn('height="300" width="300"', html)
+        self.assertIn('class="rounded"', html)
+        self.assertContains(self.client.get(reverse('profile')), '<picture>')
+
+    def test_backfill_command(self):
+        profile = self.upload(photo())
+        Profile.objects.filter(pk=profile.pk).update(image_variants={})
+
+        call_command('build_profile_images', stdout=StringIO())
+
+        self.assertEqual(Profile.objects.get(pk=profile.pk).image_variants, profile.image_variants)
@@ -0,0 +1,48 @@
+"""
+Timings of the earnings analytics (apps/common/analytics.py) for a user with
+``--years`` years of monthly earnings across every source: the rollup query
+plus the computation, the computation alone, and a cached read.
+
+    python -m benchmarks.analytics_benchmark --years 10
+"""
+import argparse
+
+from benchmarks.utils import setup_django, seed, timeit
+
+TARGET_MS = 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--years', type=int, default=10, help='Years of earnings of the measured user')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.core.cache import cache
+    from django.utils import timezone
+    from apps.common.analytics import analyze, earnings_analytics, get_earnings_analytics
+    from apps.common.stats import _rollup_rows
+
+    user = seed(users=1, earning_years=args.years, prefix='analytics')[0]
+    today = timezone.localdate()
+    rows = list(_rollup_rows(user))
+    print('%d years of earnings, %d rollup rows' % (args.years, len(rows)))
+
+    cases = {
+        'query + analyze': lambda: earnings_analytics(user, today),
+        'analyze only': lambda: analyze(rows, today),
+        'cached read': lambda: get_earnings_analytics(user),
+    }
+    cache.clear()
+    for name, func in cases.items():
+        stats = timeit(func, repeat=args.repeat)
+        verdict = 'ok' if stats['p95'] < TARGET_MS else 'over %d ms' % TARGET_MS
+        print('%-16s p50 %7.3f ms  p95 %7.3f ms  p99 %7.3f ms  %s' % (
+            name, stats['p50'], stats['p95'], stats['p99'], verdict,
+        ))
+
+
+if __name__ == '__main__':
+    main()
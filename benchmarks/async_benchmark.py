@@ -0,0 +1,73 @@
+"""
+Throughput of the dashboard and list pages served by the synchronous views
+through the WSGI handler (one thread per in-flight request) versus the async
+views through the ASGI handler (one event loop), at the same concurrency.
+
+    python -m benchmarks.async_benchmark --users 4 --rows 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.routes_benchmark import run_route
+from benchmarks.utils import setup_django, seed, summarize
+
+ROUTES = ['dashboard', 'companies', 'contacts', 'projects', 'earnings']
+
+
+async def run_route_async(url, users, concurrency, requests):
+    from django.test import AsyncClient
+
+    remaining = iter(range(requests))
+    samples = []
+
+    async def worker(user):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        while next(remaining, None) is not None:
+            started = time.perf_counter()
+            response = await client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError('%s returned %d' % (url, response.status_code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(users[i % len(users)]) for i in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    stats = summarize(samples)
+    stats['rps'] = len(samples) / wall
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1000, help='Companies, contacts and projects per user')
+    parser.add_argument('--years', type=int, default=3, help='Years of earnings per user')
+    parser.add_argument('--concurrency', type=int, default=8, help='Worker threads / concurrent tasks')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route and handler')
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.test.utils import override_settings
+    from django.urls import reverse
+
+    print('Seeding %d users x %d rows...' % (args.users, args.rows))
+    users = seed(users=args.users, companies=args.rows, contacts=args.rows, projects=args.rows, earning_years=args.years)
+
+    print('\n%-10s %-5s %8s %9s %9s %9s' % ('route', 'path', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name in ROUTES:
+        url = reverse(name)
+        wsgi = run_route(url, users, args.concurrency, args.requests)
+        with override_settings(ROOT_URLCONF='CRM.asgi_urls'):
+            asgi = asyncio.run(run_route_async(url, users, args.concurrency, args.requests))
+        for label, stats in (('wsgi', wsgi), ('asgi', asgi)):
+            print('%-10s %-5s %8.1f %9.2f %9.2f %9.2f' % (
+                name, label, stats['rps'], stats['p50'], stats['p95'], stats['p99'],
+            ))
+
+
+if __name__ == '__main__':
+    main()
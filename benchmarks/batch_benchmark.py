@@ -0,0 +1,87 @@
+"""
+Throughput of the batch endpoint (POST /api/<entity>/batch/) against one
+request per row, through the Django test client:
+
+- creating ``--rows`` projects with the project page form vs one batch;
+- changing the status of ``--rows`` projects with one single-operation
+  batch request each vs one batch.
+
+    python -m benchmarks.batch_benchmark --rows 200
+"""
+import argparse
+import json
+import time
+
+from benchmarks.utils import setup_django, seed
+
+
+def timed(func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries)
+
+
+def report(label, rows, per_row, batched):
+    (row_time, row_queries), (batch_time, batch_queries) = per_row, batched
+    print('\n== %s (%d rows) ==' % (label, rows))
+    print('%-10s %9.1f ms  %8.0f rows/s  %6d queries' % ('per row', row_time * 1000, rows / row_time, row_queries))
+    print('%-10s %9.1f ms  %8.0f rows/s  %6d queries' % ('batch', batch_time * 1000, rows / batch_time, batch_queries))
+    print('speedup    %9.1fx' % (row_time / batch_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.test import Client
+    from django.urls import reverse
+    from apps.common.models import Project
+
+    user = seed(users=1, companies=10, projects=2 * args.rows, prefix='batch')[0]
+    client = Client()
+    client.force_login(user)
+    batch_url = reverse('api-batch', args=['projects'])
+
+    def post_batch(operations):
+        response = client.post(batch_url, json.dumps({'operations': operations}), content_type='application/json')
+        assert response.status_code == 200, response.content
+
+    def project(i, label):
+        return {'name': '%s %d' % (label, i), 'status': 'planning', 'priority': 3}
+
+    def create_per_row():
+        for i in range(args.rows):
+            response = client.post(reverse('projects'), project(i, 'Form'))
+            assert response.status_code == 302, response.status_code
+
+    report(
+        'create', args.rows,
+        timed(create_per_row),
+        timed(lambda: post_batch([{'op': 'create', 'data': project(i, 'Batch')} for i in range(args.rows)])),
+    )
+
+    ids = list(Project.objects.filter(owner=user).order_by('pk').values_list('pk', flat=True))
+
+    def update_per_row():
+        for pk in ids[:args.rows]:
+            post_batch([{'op': 'update', 'id': pk, 'data': {'status': 'on_hold'}}])
+
+    report(
+        'update status', args.rows,
+        timed(update_per_row),
+        timed(lambda: post_batch([
+            {'op': 'update', 'id': pk, 'data': {'status': 'completed'}} for pk in ids[args.rows:2 * args.rows]
+        ])),
+    )
+
+
+if __name__ == '__main__':
+    main()
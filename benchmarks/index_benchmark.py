@@ -0,0 +1,82 @@
+"""
+Query plans and timings of the owner-scoped queries used by the views, with
+and without the composite indexes added in common/0008_owner_indexes.
+
+    python -m benchmarks.index_benchmark --users 20 --rows 20000
+"""
+import argparse
+
+from benchmarks.utils import setup_django, seed, timeit
+
+
+def build_queries(user):
+    from django.db.models import Q
+    from django.utils import timezone
+    from apps.common.models import Company, Contact, Project, EarningsModel
+
+    today = timezone.localdate()
+    middle = Company.objects.filter(owner=user).order_by('-created_at', '-pk')[
+        Company.objects.filter(owner=user).count() // 2
+    ]
+    deep_page = Q(created_at__lt=middle.created_at) | Q(created_at=middle.created_at, pk__lt=middle.pk)
+
+    return {
+        'companies: first page': lambda: Company.objects.filter(owner=user).order_by('-created_at', '-pk')[:26],
+        'companies: deep page': lambda: Company.objects.filter(owner=user).filter(deep_page).order_by('-created_at', '-pk')[:26],
+        'contacts: first page': lambda: Contact.objects.filter(owner=user).order_by('-created_at', '-pk')[:26],
+        'projects: first page': lambda: Project.objects.filter(owner=user).order_by('-created_at', '-pk')[:26],
+        'projects: active count': lambda: Project.objects.filter(owner=user, status='active').order_by().values('pk'),
+        'projects: overdue': lambda: Project.objects.filter(owner=user, due_date__lt=today).exclude(status='completed').order_by().values('pk'),
+        'earnings: current year': lambda: EarningsModel.objects.filter(owner=user, year=today.year).values('month', 'amount'),
+    }
+
+
+def run(label, queries, repeat):
+    print('\n== %s ==' % label)
+    for name, factory in queries.items():
+        plan = factory().explain()
+        stats = timeit(lambda: list(factory()), repeat=repeat)
+        print('%-26s p50 %8.3f ms  p95 %8.3f ms' % (name, stats['p50'], stats['p95']))
+        for line in plan.splitlines():
+            print('    ' + line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10000, help='Companies, contacts and projects per user')
+    parser.add_argument('--years', type=int, default=10, help='Years of earnings per user')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.db import connection
+    from apps.common.models import Company, Contact, Project, EarningsModel
+
+    print('Seeding %d users x %d rows...' % (args.users, args.rows))
+    users = seed(users=args.users, companies=args.rows, contacts=args.rows, projects=args.rows, earning_years=args.years)
+    queries = build_queries(users[len(users) // 2])
+
+    indexes = [
+        (model, index)
+        for model in (Company, Contact, Project, EarningsModel)
+        for index in model._meta.indexes
+    ]
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    run('without composite indexes', queries, args.repeat)
+
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.add_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    run('with composite indexes', queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
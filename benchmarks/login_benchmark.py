@@ -0,0 +1,66 @@
+"""
+Login throughput and queries per login, optionally with the old
+``save_user_profile`` handler (which re-saved the profile on every user
+save, including the last_login update) reconnected for comparison.
+
+    python -m benchmarks.login_benchmark --logins 500
+    python -m benchmarks.login_benchmark --logins 500 --legacy-profile-save
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, summarize
+
+
+def legacy_save_user_profile(sender, instance, **kwargs):
+    instance.profile.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--logins', type=int, default=300)
+    parser.add_argument('--legacy-profile-save', action='store_true',
+                        help='Reconnect the pre-change post_save handler that saved the profile on every user save')
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.db.models.signals import post_save
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+
+    # Password hashing would otherwise dominate every sample
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    if args.legacy_profile_save:
+        post_save.connect(legacy_save_user_profile, sender=User)
+
+    User.objects.filter(username='login-bench').delete()
+    User.objects.create_user('login-bench', password='bench-password')
+    url = reverse('login')
+    data = {'username': 'login-bench', 'password': 'bench-password'}
+
+    samples, queries = [], []
+    for _ in range(args.logins):
+        client = Client()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.post(url, data)
+            samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 302, response.status_code
+        queries.append(len(captured))
+
+    stats = summarize(samples)
+    total = sum(samples) / 1000
+    print('%s profile save on login' % ('legacy' if args.legacy_profile_save else 'no'))
+    print('logins/s %8.1f  p50 %7.3f ms  p95 %7.3f ms  p99 %7.3f ms' % (
+        args.logins / total, stats['p50'], stats['p95'], stats['p99'],
+    ))
+    print('queries per login: %.1f (min %d, max %d)' % (sum(queries) / len(queries), min(queries), max(queries)))
+
+
+if __name__ == '__main__':
+    main()
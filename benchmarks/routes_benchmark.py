@@ -0,0 +1,198 @@
+"""
+Load test of every page and API route, driven through the Django test client
+by concurrent workers against a seeded scratch database.
+
+For each route it reports throughput, latency percentiles, queries per
+request and the peak Python memory allocated while serving one request.
+Results can be saved as a JSON baseline and compared against a later run:
+
+    python -m benchmarks.routes_benchmark --users 5 --rows 2000 --save benchmarks/baselines/main.json
+    python -m benchmarks.routes_benchmark --users 5 --rows 2000 --compare benchmarks/baselines/main.json
+
+Comparisons flag routes whose p95 or query count grew by more than
+``--tolerance`` and exit with status 1 if any did.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.utils import setup_django, seed, summarize
+
+# (label, url name, kwargs, query string)
+ROUTES = [
+    ('home', 'home', {}, ''),
+    ('dashboard', 'dashboard', {}, ''),
+    ('companies', 'companies', {}, ''),
+    ('contacts', 'contacts', {}, ''),
+    ('projects', 'projects', {}, ''),
+    ('earnings', 'earnings', {}, ''),
+    ('profile', 'profile', {}, ''),
+    ('search', 'search', {}, '?q=company'),
+    ('export companies', 'export', {'entity': 'companies', 'file_format': 'csv'}, ''),
+    ('api companies', 'api-list', {'entity': 'companies'}, ''),
+    ('api projects', 'api-list', {'entity': 'projects'}, ''),
+    ('api search', 'api-search', {}, '?q=project'),
+]
+
+
+def make_client(user):
+    from django.test import Client
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def fetch(client, url):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = (time.perf_counter() - started) * 1000
+    if response.status_code != 200:
+        raise RuntimeError('%s returned %d' % (url, response.status_code))
+    return elapsed, len(queries)
+
+
+def peak_memory(client, url):
+    """Peak bytes allocated by Python while serving ``url`` once."""
+    tracemalloc.start()
+    try:
+        fetch(client, url)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_route(url, users, workers, requests):
+    local = threading.local()
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        from django.db import connection
+        samples = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            if not hasattr(local, 'client'):
+                local.client = make_client(users[threading.get_ident() % len(users)])
+            samples.append(fetch(local.client, url))
+        connection.close()
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = [future.result() for future in [executor.submit(worker) for _ in range(workers)]]
+    wall = time.perf_counter() - started
+
+    samples = [sample for result in results for sample in result]
+    stats = summarize([elapsed for elapsed, _ in samples])
+    stats['rps'] = len(samples) / wall
+    stats['queries'] = sum(count for _, count in samples) / len(samples)
+    return stats
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print('\n%-18s %12s %12s %10s %10s' % ('route', 'p95 before', 'p95 now', 'q before', 'q now'))
+    for label, now in results['routes'].items():
+        before = baseline['routes'].get(label)
+        if before is None:
+            continue
+        slower = now['p95'] > before['p95'] * (1 + tolerance)
+        chattier = now['queries'] > before['queries'] + 0.5
+        flag = '  <-- regression' if slower or chattier else ''
+        print('%-18s %12.2f %12.2f %10.1f %10.1f%s' % (
+            label, before['p95'], now['p95'], before['queries'], now['queries'], flag,
+        ))
+        if flag:
+            regressions.append(label)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='SQLite file to use (a temporary one by default)')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--companies', type=int, default=1000)
+    parser.add_argument('--contacts', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--rows', type=int, help='Shorthand for the same --companies/--contacts/--projects')
+    parser.add_argument('--years', type=int, default=3, help='Years of earnings per user')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--route', action='append', help='Only run the route(s) with this label')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare with a JSON file written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 growth (0.2 = 20%%)')
+    args = parser.parse_args()
+    if args.rows is not None:
+        args.companies = args.contacts = args.projects = args.rows
+
+    setup_django(args.db)
+    from django.urls import reverse
+
+    print('Seeding %d users (%d companies, %d contacts, %d projects, %d years of earnings each)...' % (
+        args.users, args.companies, args.contacts, args.projects, args.years,
+    ))
+    users = seed(
+        users=args.users, companies=args.companies, contacts=args.contacts,
+        projects=args.projects, earning_years=args.years,
+    )
+
+    routes = [route for route in ROUTES if not args.route or route[0] in args.route]
+    results = {
+        'config': {
+            key: getattr(args, key)
+            for key in ('users', 'companies', 'contacts', 'projects', 'years', 'workers', 'requests')
+        },
+        'python': platform.python_version(),
+        'routes': {},
+    }
+
+    print('\n%-18s %8s %9s %9s %9s %8s %10s' % ('route', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KiB'))
+    for label, name, kwargs, query in routes:
+        url = reverse(name, kwargs=kwargs) + query
+        stats = run_route(url, users, args.workers, args.requests)
+        stats['peak_memory'] = peak_memory(make_client(users[0]), url)
+        results['routes'][label] = stats
+        print('%-18s %8.1f %9.2f %9.2f %9.2f %8.1f %10.1f' % (
+            label, stats['rps'], stats['p50'], stats['p95'], stats['p99'],
+            stats['queries'], stats['peak_memory'] / 1024,
+        ))
+
+    # ru_maxrss is KiB on Linux
+    results['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('\nprocess max RSS: %.1f MiB' % (results['max_rss_kib'] / 1024))
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        print('Saved results to %s' % path)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get('config') != results['config']:
+            print('\nWarning: the baseline was recorded with a different configuration: %s' % baseline.get('config'))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\nRegressed: %s' % ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Read/write throughput of SQLite under parallel workers, with the default
+connection setup versus the production profile from CRM/local_settings.py
+(WAL, synchronous=NORMAL, mmap, cache size, busy timeout, BEGIN IMMEDIATE
+and persistent connections).
+
+Each worker thread loops over requests that are either a write (upserting
+an earning and creating a company inside a transaction, as the POST handlers
+do,
+including the rollup/search/cache signal work) or a read (the dashboard
+statistics). Connections are closed or kept after every request exactly as
+Django's request_finished handling would with the profile's CONN_MAX_AGE.
+
+    python -m benchmarks.sqlite_benchmark --workers 8 --seconds 10 --write-ratio 0.2
+
+Each profile runs in its own process against its own database file.
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.utils import setup_django, seed, summarize
+
+# Django's defaults: a connection per request, deferred transactions, no PRAGMAs
+BASELINE = {
+    'CONN_MAX_AGE': 0,
+    'CONN_HEALTH_CHECKS': False,
+    'OPTIONS': {},
+}
+
+
+def setup_profile(profile):
+    setup_django(migrate=False, database=BASELINE if profile == 'baseline' else None)
+    from django.conf import settings
+    from django.core.management import call_command
+    if profile == 'baseline':
+        settings.CRM_SQLITE_PRAGMAS = {}
+    call_command('migrate', verbosity=0)
+
+
+def run_profile(workers, seconds, write_ratio):
+    from django.db import OperationalError, close_old_connections, connection, transaction
+    from apps.common.models import Company, EarningsModel
+    from apps.common.stats import get_dashboard_stats
+
+    users = seed(users=workers, companies=200, contacts=200, projects=200, earning_years=2)
+    close_old_connections()
+    connection.close()
+
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    totals = {'reads': [], 'writes': [], 'errors': 0}
+
+    def worker(n):
+        rng = random.Random(n)
+        user = users[n]
+        reads, writes, errors, i = [], [], 0, 0
+        while time.perf_counter() < deadline:
+            i += 1
+            started = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    with transaction.atomic():
+                        # Read first, as form validation does, then write
+                        EarningsModel.objects.update_or_create(
+                            owner=user, year=2000 + i // 12 % 50, month=i % 12 + 1, source='other',
+                            defaults={'amount': rng.randint(1, 1000)},
+                        )
+                        Company.objects.create(name='Load %d-%d' % (n, i), email='l%d@example.com' % i, owner=user)
+                    writes.append((time.perf_counter() - started) * 1000)
+                else:
+                    get_dashboard_stats(user)
+                    reads.append((time.perf_counter() - started) * 1000)
+            except OperationalError:
+                errors += 1
+            finally:
+                close_old_connections()
+        connection.close()
+        with lock:
+            totals['reads'] += reads
+            totals['writes'] += writes
+            totals['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'reads_per_s': len(totals['reads']) / seconds,
+        'writes_per_s': len(totals['writes']) / seconds,
+        'errors': totals['errors'],
+        'read': summarize(totals['reads']),
+        'write': summarize(totals['writes']),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--profile', choices=['baseline', 'production'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        setup_profile(args.profile)
+        print(json.dumps(run_profile(args.workers, args.seconds, args.write_ratio)))
+        return
+
+    print('%-11s %9s %9s %7s %12s %12s %12s' % (
+        'profile', 'reads/s', 'writes/s', 'errors', 'read p95 ms', 'write p50 ms', 'write p95 ms',
+    ))
+    for profile in ('baseline', 'production'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_benchmark', '--profile', profile,
+             '--workers', str(args.workers), '--seconds', str(args.seconds),
+             '--write-ratio', str(args.write_ratio)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print('%-11s %9.1f %9.1f %7d %12.2f %12.2f %12.2f' % (
+            profile, result['reads_per_s'], result['writes_per_s'], result['errors'],
+            result['read']['p95'], result['write']['p50'], result['write']['p95'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks never touch db.sqlite3: ``setup_django`` points the default
+database at a scratch file (or reuses one given on the command line) before
+Django is initialised.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, migrate=True, database=None):
+    """
+    Configure Django against ``db_path`` (a temp file by default) and migrate.
+    ``database`` updates the rest of the default DATABASES entry.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CRM.settings')
+
+    from django.conf import settings
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='crm-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    settings.DATABASES['default'].update(database or {})
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+    import django
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return db_path
+
+
+def seed(users=1, companies=0, contacts=0, projects=0, earning_years=0, batch_size=5000, prefix='bench'):
+    """
+    Create ``users`` users with the given number of rows each, using
+    bulk_create, and return the users. Rollups and caches are rebuilt once at
+    the end rather than per row.
+    """
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from apps.common.cache import bump_generation
+    from apps.common.models import Company, Contact, Project, EarningsModel, EarningsRollup
+    from apps.common.search import rebuild_index
+
+    rng = random.Random(42)
+    today = timezone.localdate()
+    statuses = [status for status, _ in Project.STATUS_CHOICES]
+    sources = [source for source, _ in EarningsModel.SOURCE_CHOICES]
+    start = User.objects.filter(username__startswith=prefix).count()
+
+    created = []
+    for n in range(start, start + users):
+        user = User.objects.create_user('%s%d' % (prefix, n), password='bench-password')
+        created.append(user)
+
+        Company.objects.bulk_create((
+            Company(
+                name='Company %d' % i, email='company%d@example.com' % i, phone='555-%04d' % i,
+                address='%d Main Street' % i, description='Customer account number %d' % i, owner=user,
+            )
+            for i in range(companies)
+        ), batch_size=batch_size)
+        company_ids = list(Company.objects.filter(owner=user).values_list('pk', flat=True)[:1000])
+
+        Contact.objects.bulk_create((
+            Contact(
+                name='Contact %d' % i, email='contact%d@example.com' % i,
+                phone='555-%04d' % i, description='Reached through referral %d' % i, owner=user,
+            )
+            for i in range(contacts)
+        ), batch_size=batch_size)
+
+        Project.objects.bulk_create((
+            Project(
+                name='Project %d' % i, owner=user,
+                company_id=rng.choice(company_ids) if company_ids else None,
+                status=rng.choice(statuses), priority=rng.randint(1, 5), progress=rng.randint(0, 100),
+                start_date=today - timedelta(days=rng.randint(0, 365)),
+                due_date=today + timedelta(days=rng.randint(-180, 180)),
+                budget=Decimal(rng.randint(1000, 100000)),
+                description='Statement of work %d' % i,
+            )
+            for i in range(projects)
+        ), batch_size=batch_size)
+
+        EarningsModel.objects.bulk_create((
+            EarningsModel(
+                month=month, year=year, source=source, owner=user,
+                amount=Decimal(rng.randint(100, 10000)),
+            )
+            for year in range(today.year - earning_years + 1, today.year + 1)
+            for month in range(1, 13)
+            for source in sources
+        ), batch_size=batch_size)
+
+    # bulk_create bypasses the model signals, so refresh derived data once
+    EarningsRollup.rebuild(created)
+    rebuild_index()
+    for user in created:
+        bump_generation(user.pk)
+    return created
+
+
+def timeit(func, repeat=20, warmup=2):
+    """Run ``func`` and return timing statistics in milliseconds."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    from apps.common.profiling import percentile
+
+    return {
+        'count': len(samples),
+        'mean': statistics.fmean(samples) if samples else 0.0,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }